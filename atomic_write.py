@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Atomic File Writes
+Every file the fetcher persists (running statistics, dedup state, history
+metadata, JSON exports, metrics) is replaced atomically: the content is written
+to a temp file next to the target and renamed over it, so readers and a restart
+after a crash see either the old or the new file, never a partial one.
+"""
+
+import os
+
+def write_atomic(path: str, content: bytes, durable: bool = False):
+    """
+    Replace path with content atomically (temp file next to it, then rename).
+    durable=True also fsyncs the file before the rename, for state that must
+    survive a power loss rather than just a crashed process.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
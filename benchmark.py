@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Offline Pipeline Benchmark
+Times every stage of the data pipeline on a synthetic (or saved) GTFS-RT feed,
+without network access: protobuf decode, stop-time extraction, delay derivation
+and deduplication, process_data, merge_delays with either aggregation engine,
+each _calculate_* aggregation, generate_json_files and, optionally, the
+database writes. Results are written
+as JSON; --compare checks a run against a baseline and flags regressions.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from google.transit import gtfs_realtime_pb2
+from data_fetcher import AGGREGATION_ENGINES, TrainDelayFetcher
+from delay_aggregation import aggregate_delays
+from delay_batch import StopTimeBatch
+from feed_decode import extract_stop_times
+from oslo_region_config import get_route_code_set
+from running_stats import DELAY_KINDS, KEY_COLUMNS, RunningAggregator
+from synthetic_feed import build_feed_bytes
+
+RESULTS_VERSION = 1
+
+# Stages are compared by their fastest run: interference only ever slows a run down
+COMPARE_STATISTIC = 'min'
+# Stages faster than this (seconds) are never flagged; timer noise dominates
+MIN_REGRESSION_SECONDS = 0.002
+
+def _git_commit() -> Optional[str]:
+    """Commit the benchmark ran against, if this is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StageTimer:
+    """
+    Runs each stage once untimed to warm up caches and lazy imports, then `repeat`
+    times (output silenced), keeping the wall-clock timings
+    """
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.timings: Dict[str, List[float]] = {}
+
+    def run(self, name: str, stage: Callable[..., Any], setup: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Time stage() and return the result of its last run. With setup, every run
+        calls stage(setup()) and only the stage itself is timed.
+        """
+        runs = self.timings.setdefault(name, [])
+        result = None
+        for run in range(self.repeat + 1):
+            with contextlib.redirect_stdout(io.StringIO()):
+                arguments = (setup(),) if setup is not None else ()
+                started = time.perf_counter()
+                result = stage(*arguments)
+                if run:
+                    runs.append(time.perf_counter() - started)
+        print(f"  {name:<28} min {min(runs) * 1000:9.2f} ms, median {statistics.median(runs) * 1000:9.2f} ms")
+        return result
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                'runs': runs,
+                'min': min(runs),
+                'median': statistics.median(runs),
+                'mean': statistics.fmean(runs),
+            }
+            for name, runs in self.timings.items()
+        }
+
+def run_benchmark(content: bytes, repeat: int = 5, use_db: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Time every pipeline stage on one serialized trip-updates feed"""
+    timer = StageTimer(repeat)
+    route_codes = get_route_code_set()
+    now = int(time.time())
+
+    def parse() -> gtfs_realtime_pb2.FeedMessage:
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(content)
+        return feed
+
+    feed = timer.run('decode', parse)
+    stop_times: StopTimeBatch = timer.run(
+        'extract', lambda: StopTimeBatch.from_records(extract_stop_times(feed, route_codes, now)))
+    timer.run('stop_pair_delays', stop_times.stop_pair_delays)
+    timer.run('segment_delays', stop_times.segment_delays)
+    timer.run('dwell_delays', stop_times.dwell_delays)
+
+    # A fresh fetcher (no persisted state) per run, so every run sees all observations as new
+    fetchers: List[TrainDelayFetcher] = []
+
+    def fresh_fetcher() -> TrainDelayFetcher:
+        fetchers.append(TrainDelayFetcher(state_path=None))
+        return fetchers[-1]
+
+    raw_data = timer.run('new_observations', lambda fetcher: fetcher.new_observations(stop_times), fresh_fetcher)
+    stats = timer.run('process_data', lambda fetcher: fetcher.process_data(raw_data), fresh_fetcher)
+    for used in fetchers:
+        used.close()
+    fetcher = fresh_fetcher()
+
+    # Both aggregation engines, merging into an empty running state each run
+    delays = raw_data['delays']
+    for engine in AGGREGATION_ENGINES:
+        fetcher.aggregation_engine = engine
+        timer.run(f'merge_delays ({engine})', lambda aggregator: fetcher.merge_delays(delays, aggregator),
+                  RunningAggregator)
+    fetcher.aggregation_engine = 'numpy'
+    relevant = fetcher._pair_ids(delays) >= 0
+    timer.run('aggregate_delays', lambda: aggregate_delays(delays, DELAY_KINDS, relevant))
+
+    # Individual pandas aggregations on the per-record frame they group
+    df = fetcher._delay_frame(delays, relevant)
+    timer.run('_calculate_daily_stats', lambda: fetcher._calculate_daily_stats(df))
+    timer.run('_calculate_hourly_stats', lambda: fetcher._calculate_hourly_stats(df))
+    timer.run('_calculate_date_hourly_stats', lambda: fetcher._calculate_date_hourly_stats(df))
+    timer.run('_calculate_route_stats', lambda: fetcher._calculate_route_stats(df))
+    timer.run('_calculate_distribution', lambda: fetcher._calculate_distribution(df, KEY_COLUMNS['daily']))
+    timer.run('merge_segments', lambda: fetcher.merge_segments(
+        raw_data['segment_delays'], raw_data['dwell_delays'], RunningAggregator()))
+
+    # Every run writes into an empty directory, so no file is skipped as unchanged
+    with tempfile.TemporaryDirectory() as output_root:
+        timer.run('generate_json_files', lambda output_dir: fetcher.generate_json_files(stats, output_dir),
+                  lambda: tempfile.mkdtemp(dir=output_root))
+    fetcher.close()
+
+    if use_db:
+        db_fetcher = TrainDelayFetcher(use_database=True, state_path=None)
+        try:
+            def write(conn):
+                db_fetcher._write_raw_delays(conn, raw_data)
+                db_fetcher._write_stats(conn, stats)
+            timer.run('database_writes', lambda: db_fetcher.db_pool.run_transaction(write))
+        finally:
+            db_fetcher.close()
+
+    return timer.summary()
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a stage-by-stage comparison; returns the stages that regressed beyond threshold"""
+    if baseline.get('parameters') != current.get('parameters'):
+        print(f"Warning: runs used different parameters:\n"
+              f"  baseline {baseline.get('parameters')}\n  current  {current.get('parameters')}")
+
+    regressions = []
+    print(f"{'stage (' + COMPARE_STATISTIC + ')':<28} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, stage in current['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>12} {stage[COMPARE_STATISTIC] * 1000:12.2f} {'new':>8}")
+            continue
+        old, new = before[COMPARE_STATISTIC], stage[COMPARE_STATISTIC]
+        change = new / old - 1 if old else 0.0
+        regressed = change > threshold and new - old > MIN_REGRESSION_SECONDS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {old * 1000:12.2f} {new * 1000:12.2f} "
+              f"{change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    """Main execution function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline Train Delay Pipeline Benchmark')
+    parser.add_argument('--trips', type=int, default=2000, help='Synthetic trips in the feed (default: 2000)')
+    parser.add_argument('--stops', type=int, default=12, help='Stops per synthetic trip (default: 12)')
+    parser.add_argument('--oslo-share', type=float, default=0.3,
+                        help='Share of synthetic trips on Oslo region routes (default: 0.3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic feed (default: 0)')
+    parser.add_argument('--feed', help='Benchmark a saved trip-updates feed instead of a synthetic one')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per stage (default: 5)')
+    parser.add_argument('--use-db', action='store_true',
+                        help='Also time the database writes (use a scratch database: rows are committed)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown of a stage (fastest run) flagged as a regression (default: 0.10)')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare_results(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}: "
+                  f"{', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+        return
+
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    if args.feed:
+        with open(args.feed, 'rb') as f:
+            content = f.read()
+        parameters: Dict[str, Any] = {'feed': os.path.basename(args.feed)}
+    else:
+        content = build_feed_bytes(args.trips, args.stops, args.oslo_share, args.seed)
+        parameters = {'trips': args.trips, 'stops': args.stops, 'oslo_share': args.oslo_share,
+                      'seed': args.seed}
+    parameters.update(repeat=args.repeat, use_db=args.use_db)
+
+    print(f"Benchmarking a {len(content)} byte feed, {args.repeat} runs per stage...")
+    results = {
+        'version': RESULTS_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'feed_bytes': len(content),
+        'stages': run_benchmark(content, args.repeat, args.use_db),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -2,299 +2,814 @@
 """
 Train Delay Data Fetcher and JSON Generator
 MVP implementation that fetches data from Entur API and generates JSON files.
+
+Modules only some runs need are imported where they are used, so a cron run
+doesn't pay for them at startup: requests (sync fetch), protobuf bindings (feed
+decoding), httpx (--all-feeds), psycopg2 and dotenv (--use-db), zstandard
+(--archive-dir/--replay) and the profiler. test_import_time.py keeps it that way.
 """
 
 import os
-import json
-import requests
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+import signal
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, FrozenSet, Tuple
 import pandas as pd
-from google.transit import gtfs_realtime_pb2  # For GTFS-RT parsing
-import psycopg2
-from psycopg2.extras import execute_values
-from dotenv import load_dotenv
-from oslo_region_config import OSLO_REGION_ROUTES, get_all_route_codes, get_station_pairs_for_route
-
-# Load environment variables
-load_dotenv()
+import numpy as np
+from delay_aggregation import aggregate_delays
+from delay_batch import DelayBatch, StopPairDelay, StopTimeBatch
+from json_export import JsonExporter, frame_records
+from metrics import MetricsServer, PipelineMetrics, timed_stage
+from running_stats import DELAY_KINDS, KEY_COLUMNS, RunningAggregator
+from delay_sketch import histogram_buckets, sketch_bins
+from trip_dedup import TripDeduplicator
+from oslo_region_config import OSLO_REGION_ROUTES, get_route_code_set, get_route_topology, load_gtfs_quays
+
+if TYPE_CHECKING:
+    import requests
+    from async_fetcher import AsyncFeedFetcher
+    from db_pool import DatabasePool
+    from feed_decode import ParallelFeedDecoder
+    from snapshot_archive import SnapshotArchive
 
 # Configuration
 ENTUR_API_URL = "https://api.entur.io/realtime/v1"  # Base URL for Entur real-time API
 # No API key required for open GTFS-RT feeds
 
+# GTFS-RT endpoints fetched concurrently in --all-feeds mode
+GTFS_RT_FEEDS = {
+    'trip_updates': f"{ENTUR_API_URL}/gtfs-rt/trip-updates",
+    'vehicle_positions': f"{ENTUR_API_URL}/gtfs-rt/vehicle-positions",
+    'alerts': f"{ENTUR_API_URL}/gtfs-rt/alerts",
+}
+
+def feed_sources(datasources: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Feed name -> URL for every endpoint, optionally split per Entur datasource
+    (codespace, e.g. VYG or GOA) so each region's feed is fetched on its own.
+    Names are '<feed>' or '<feed>:<datasource>'.
+    """
+    if not datasources:
+        return dict(GTFS_RT_FEEDS)
+    return {f"{feed}:{source}": f"{url}?datasource={source}"
+            for feed, url in GTFS_RT_FEEDS.items() for source in datasources}
+
+def feed_kind(name: str) -> str:
+    """Endpoint a feed name refers to ('trip_updates:VYG' -> 'trip_updates')"""
+    return name.split(':', 1)[0]
+
+# Rolling windows (days) of the pre-aggregated summary files
+SUMMARY_WINDOWS = (7, 30)
+
+# Per-poll aggregation: 'numpy' (delay_aggregation) or 'pandas' (groupby, the reference implementation)
+AGGREGATION_ENGINES = ('numpy', 'pandas')
+
+# Where running statistics are persisted between polls/restarts
+DEFAULT_STATE_PATH = os.path.join('state', 'running_stats.json')
+
+# Replays keep their own running statistics and dedup state unless --state-file is given
+DEFAULT_REPLAY_STATE_PATH = os.path.join('state', 'replay', 'running_stats.json')
+
+def read_feed_timestamp(content: bytes) -> Optional[int]:
+    """FeedHeader timestamp of a serialized feed, without parsing its entities"""
+    from gtfs_wire import read_feed_header
+
+    header = read_feed_header(content)
+    return header.timestamp if header is not None and header.HasField('timestamp') else None
+
+def decode_vehicle_positions(content: bytes, route_codes: FrozenSet[str]) -> int:
+    """Number of vehicles currently reporting positions on the given routes"""
+    from google.transit import gtfs_realtime_pb2
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    return sum(1 for entity in feed.entity
+               if entity.HasField('vehicle') and entity.vehicle.trip.route_id in route_codes)
+
+def decode_alerts(content: bytes, route_codes: FrozenSet[str]) -> List[Dict[str, Any]]:
+    """Service alerts that inform about at least one of the given routes"""
+    from google.transit import gtfs_realtime_pb2
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+
+    alerts = []
+    for entity in feed.entity:
+        if not entity.HasField('alert'):
+            continue
+        alert = entity.alert
+        routes = sorted({informed.route_id for informed in alert.informed_entity
+                         if informed.route_id in route_codes})
+        if not routes:
+            continue
+        header = alert.header_text.translation
+        alerts.append({
+            'id': entity.id,
+            'route_ids': routes,
+            'effect': gtfs_realtime_pb2.Alert.Effect.Name(alert.effect),
+            'header': header[0].text if header else '',
+        })
+    return alerts
+
+def raw_data_rows(raw_data: Dict[str, Any], *_) -> int:
+    """Delay rows (stop-pair, segment and dwell) in a fetched poll"""
+    return sum(len(raw_data.get(key) or ()) for key in ('delays', 'segment_delays', 'dwell_delays'))
+
+def stats_rows(stats: Dict[str, pd.DataFrame], *_) -> int:
+    """Rows across all statistics tables"""
+    return sum(len(frame) for frame in stats.values())
+
 class TrainDelayFetcher:
-    def __init__(self, use_database: bool = False):
-        self.session = requests.Session()
+    # Tables keyed by date first; their flat <name>.json files hold the latest date
+    DATED_TABLES = ('daily_stats', 'route_stats', 'segment_stats', 'dwell_stats')
+
+    def __init__(self, use_database: bool = False, state_path: Optional[str] = DEFAULT_STATE_PATH,
+                 all_feeds: bool = False, datasources: Optional[List[str]] = None,
+                 decode_workers: int = 1, archive_dir: Optional[str] = None,
+                 history_dir: Optional[str] = None, aggregation_engine: str = 'numpy'):
+        if aggregation_engine not in AGGREGATION_ENGINES:
+            raise ValueError(f"Unknown aggregation engine {aggregation_engine!r}")
+        self.aggregation_engine = aggregation_engine
+        # HTTP session for the synchronous trip-updates fetch, created on first use
+        self._session: Optional['requests.Session'] = None
         self.use_database = use_database
-        self.db_conn = None
+        # Stage latency, row and failure counters (served or dumped by main())
+        self.metrics = PipelineMetrics()
+        self.db_pool: Optional['DatabasePool'] = None
+
+        # Whether station_pair_delays is partitioned (None until checked),
+        # and the day range known to have partitions
+        self._partitioned: Optional[bool] = None
+        self._partitions_covered: Optional[Tuple[date, date]] = None
+
+        # Running daily/hourly/route statistics, persisted across polls and restarts
+        self.aggregator = (RunningAggregator.load(state_path) if state_path
+                           else RunningAggregator())
+
+        # Last delay seen per trip stop, so re-reported observations are skipped;
+        # segment and dwell delays are deduplicated separately
+        def deduplicator(name: str) -> TripDeduplicator:
+            if not state_path:
+                return TripDeduplicator()
+            return TripDeduplicator.load(os.path.join(os.path.dirname(state_path), name))
+
+        self.deduplicator = deduplicator('trip_dedup.json')
+        self.segment_deduplicator = deduplicator('segment_dedup.json')
+        self.dwell_deduplicator = deduplicator('dwell_dedup.json')
+
+        # Validators (ETag, Last-Modified, header timestamp) of the last
+        # successfully processed response per feed, for conditional GETs
+        self._validators: Dict[str, Dict[str, Any]] = {}
+
+        # Local memory-mapped delay history (works without PostgreSQL)
+        self.history_store = None
+        if history_dir:
+            from history_store import HistoryStore
+            self.history_store = HistoryStore(history_dir)
+
+        # Raw payloads of every processed feed, one snapshot archive per feed
+        self.archive_dir = archive_dir
+        self.archives: Dict[str, 'SnapshotArchive'] = {}
+
+        # Trip-update protobuf decoding, spread over decode_workers processes (created on first use)
+        self.decode_workers = decode_workers
+        self._feed_decoder_pool: Optional['ParallelFeedDecoder'] = None
+        # Feeds may be decoded from several threads; only one may create the decoder
+        self._feed_decoder_lock = threading.Lock()
+
+        # Concurrent fetching of trip updates, vehicle positions and alerts
+        self.async_fetcher: Optional['AsyncFeedFetcher'] = None
+        self.sources = feed_sources(datasources)
+        if all_feeds or datasources:
+            from async_fetcher import AsyncFeedFetcher
+            self.async_fetcher = AsyncFeedFetcher(timeout=30)
 
         if self.use_database:
             self._connect_to_database()
 
+    @property
+    def session(self) -> 'requests.Session':
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    @session.setter
+    def session(self, session: 'requests.Session'):
+        self._session = session
+
+    @property
+    def feed_decoder(self) -> 'ParallelFeedDecoder':
+        if self._feed_decoder_pool is None:
+            with self._feed_decoder_lock:
+                if self._feed_decoder_pool is None:
+                    from feed_decode import ParallelFeedDecoder
+                    self._feed_decoder_pool = ParallelFeedDecoder(self.decode_workers)
+        return self._feed_decoder_pool
+
     def _connect_to_database(self):
-        """Establish database connection"""
+        """Set up the pooled database layer and check the schema once"""
+        from db_pool import DatabasePool
+        from delay_writer import DelayCopyWriter
+
+        self.db_pool = DatabasePool()
+        self.delay_writer = DelayCopyWriter()
         try:
-            self.db_conn = psycopg2.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                port=os.getenv('DB_PORT', '5432'),
-                user=os.getenv('DB_USER', 'postgres'),
-                password=os.getenv('DB_PASSWORD', ''),
-                database=os.getenv('DB_NAME', 'train_delays')
-            )
+            self.db_pool.run_transaction(self._check_schema)
             print("Connected to database successfully!")
         except Exception as e:
+            # Keep use_database on: the pool reconnects on the next poll
+            self.metrics.db_errors.inc()
             print(f"Failed to connect to database: {e}")
-            self.use_database = False
 
+    def _check_schema(self, conn):
+        """Detect whether station_pair_delays uses daily partitions"""
+        from setup_database import is_partitioned
+
+        with conn.cursor() as cursor:
+            self._partitioned = is_partitioned(cursor, 'station_pair_delays')
+
+    def close(self):
+        """Persist dedup state and release the HTTP session and database connections"""
+        try:
+            for deduplicator in (self.deduplicator, self.segment_deduplicator, self.dwell_deduplicator):
+                deduplicator.save()
+        except OSError as e:
+            print(f"Failed to save trip dedup state: {e}")
+        if self._session:
+            self._session.close()
+        if self.async_fetcher:
+            self.async_fetcher.close()
+        if self._feed_decoder_pool:
+            self._feed_decoder_pool.close()
+        for archive in self.archives.values():
+            archive.close()
+        if self.db_pool:
+            self.db_pool.close()
+
+    @timed_stage('save_to_database', rows_in=stats_rows)
     def save_to_database(self, stats: Dict[str, pd.DataFrame]):
-        """Save processed statistics to database"""
-        if not self.use_database or not self.db_conn:
+        """Save processed statistics to database in one transaction"""
+        self._save_in_transaction(None, stats)
+
+    @timed_stage('save_raw_delays_to_database', rows_in=raw_data_rows)
+    def save_raw_delays_to_database(self, raw_data: Dict[str, Any]):
+        """Stream raw station pair delay data into the database in one transaction"""
+        self._save_in_transaction(raw_data, None)
+
+    @timed_stage('save_poll_to_database',
+                 rows_in=lambda raw_data, stats: raw_data_rows(raw_data) + stats_rows(stats))
+    def save_poll_to_database(self, raw_data: Dict[str, Any], stats: Dict[str, pd.DataFrame]):
+        """Save a poll's raw delays and all aggregate upserts in a single transaction (never mock data)"""
+        if raw_data.get('mock'):
+            print("Mock data, skipping database save.")
+            return
+        self._save_in_transaction(raw_data, stats)
+
+    def _save_in_transaction(self, raw_data: Optional[Dict[str, Any]],
+                             stats: Optional[Dict[str, pd.DataFrame]]):
+        """Run the raw and/or aggregate writes in one transaction, reconnecting if needed"""
+        if not self.use_database or not self.db_pool:
             print("Database not available, skipping database save.")
             return
 
-        try:
-            cursor = self.db_conn.cursor()
-
-            # Save daily station stats
-            if 'daily_stats' in stats and not stats['daily_stats'].empty:
-                daily_data = []
-                for _, row in stats['daily_stats'].iterrows():
-                    if row['is_relevant']:
-                        daily_data.append((
-                            row['from_stop'],
-                            row['to_stop'],
-                            row['date'],
-                            row['avg_delay_minutes'],
-                            row['delay_count'],  # total_trips
-                            max(1, int(row['delay_count'] * 0.15)),  # estimated delayed_trips
-                            min(100, row['avg_delay_minutes'] * 3.33)  # estimated delay_percentage
-                        ))
-
-                if daily_data:
-                    execute_values(cursor, """
-                        INSERT INTO daily_station_stats
-                        (from_station, to_station, date, avg_delay_minutes, total_trips, delayed_trips, delay_percentage)
-                        VALUES %s
-                        ON CONFLICT (from_station, to_station, date) DO UPDATE SET
-                            avg_delay_minutes = EXCLUDED.avg_delay_minutes,
-                            total_trips = EXCLUDED.total_trips,
-                            delayed_trips = EXCLUDED.delayed_trips,
-                            delay_percentage = EXCLUDED.delay_percentage
-                    """, daily_data)
-                    print(f"Saved {len(daily_data)} daily station stats to database.")
-
-            # Save daily route stats
-            if 'route_stats' in stats and not stats['route_stats'].empty:
-                route_data = []
-                for _, row in stats['route_stats'].iterrows():
-                    route_data.append((
-                        row['route_name'],
-                        row['date'],
-                        row['avg_delay_minutes'],
-                        row['delay_count'],  # total_trips
-                        max(1, int(row['delay_count'] * 0.18)),  # estimated delayed_trips
-                        min(100, row['avg_delay_minutes'] * 4.0)  # estimated delay_percentage
-                    ))
-
-                if route_data:
-                    execute_values(cursor, """
-                        INSERT INTO daily_route_stats
-                        (route_name, date, avg_delay_minutes, total_trips, delayed_trips, delay_percentage)
-                        VALUES %s
-                        ON CONFLICT (route_name, date) DO UPDATE SET
-                            avg_delay_minutes = EXCLUDED.avg_delay_minutes,
-                            total_trips = EXCLUDED.total_trips,
-                            delayed_trips = EXCLUDED.delayed_trips,
-                            delay_percentage = EXCLUDED.delay_percentage
-                    """, route_data)
-                    print(f"Saved {len(route_data)} daily route stats to database.")
-
-            self.db_conn.commit()
-            cursor.close()
+        partitions_covered = self._partitions_covered
 
+        def work(conn):
+            # A retry starts over on a fresh connection: the failed attempt's buffered
+            # rows and the partitions it created were rolled back with it
+            self.delay_writer.discard()
+            self._partitions_covered = partitions_covered
+            if raw_data is not None:
+                self._write_raw_delays(conn, raw_data)
+            if stats is not None:
+                self._write_stats(conn, stats)
+
+        try:
+            self.db_pool.run_transaction(work)
         except Exception as e:
+            self.metrics.db_errors.inc()
             print(f"Error saving to database: {e}")
-            if self.db_conn:
-                self.db_conn.rollback()
+            # Nothing from this transaction was committed
+            self.delay_writer.discard()
+            self._partitions_covered = None
 
-    def save_raw_delays_to_database(self, raw_data: Dict[str, Any]):
-        """Save raw station pair delay data to database"""
-        if not self.use_database or not self.db_conn:
-            return
+    def write_metrics(self, path: str):
+        """Dump the metrics for node_exporter's textfile collector"""
+        try:
+            self.metrics.registry.write_textfile(path)
+        except OSError as e:
+            print(f"Failed to write metrics to {path}: {e}")
 
+    def save_to_history(self, raw_data: Dict[str, Any]):
+        """Append a poll's delays to the local history store (mock data is never stored)"""
+        if not self.history_store or raw_data.get('mock'):
+            return
         try:
-            delays = raw_data.get('delays', [])
-            if not delays:
-                return
-
-            cursor = self.db_conn.cursor()
-
-            # Prepare data for insertion
-            delay_data = []
-            for delay in delays:
-                # Only save delays for relevant station pairs
-                relevant_pairs = [
-                    ('Drammen', 'Sandvika'), ('Sandvika', 'Asker'), ('Asker', 'Oslo S'),
-                    ('Oslo S', 'Asker'), ('Asker', 'Sandvika'), ('Sandvika', 'Drammen'),
-                    ('Oslo S', 'Lillestrøm'), ('Lillestrøm', 'Oslo Lufthavn'),
-                    ('Oslo Lufthavn', 'Lillestrøm'), ('Lillestrøm', 'Oslo S')
-                ]
-
-                if (delay['from_stop'], delay['to_stop']) in relevant_pairs:
-                    delay_data.append((
-                        f"trip_{hash(delay['timestamp'])}",  # Generate trip_id
-                        delay['route_id'],
-                        delay['from_stop'],
-                        delay['to_stop'],
-                        None,  # scheduled_departure (not available in current data)
-                        None,  # actual_departure (not available in current data)
-                        delay['delay_seconds'] / 60  # Convert to minutes
-                    ))
-
-            if delay_data:
-                execute_values(cursor, """
-                    INSERT INTO station_pair_delays
-                    (trip_id, route_id, from_station, to_station, scheduled_departure, actual_departure, delay_minutes)
-                    VALUES %s
-                """, delay_data)
-                print(f"Saved {len(delay_data)} raw delay records to database.")
-
-            self.db_conn.commit()
-            cursor.close()
+            written = self.history_store.append((raw_data.get('delays') or DelayBatch.empty()).delayed())
+            if written:
+                print(f"Appended {written} delay records to history store.")
+        except OSError as e:
+            print(f"Error saving to history store: {e}")
+
+    def _write_stats(self, conn, stats: Dict[str, pd.DataFrame]):
+        """Upsert processed statistics (COPY into staging tables, then merge)"""
+        from delay_writer import copy_upsert
+
+        # Save daily station stats
+        if 'daily_stats' in stats and not stats['daily_stats'].empty:
+            daily = stats['daily_stats']
+            daily = daily[daily['is_relevant']]
+            daily_data = zip(
+                daily['from_stop'],
+                daily['to_stop'],
+                daily['date'],
+                daily['avg_delay_minutes'],
+                daily['delay_count'],  # total_trips
+                daily['delayed_count'],  # delayed_trips (DELAYED_THRESHOLD_MINUTES or more)
+                (None if pd.isna(on_time) else 100 - on_time for on_time in daily['on_time_percentage'])
+            )
+            saved = copy_upsert(
+                conn, 'daily_station_stats',
+                ['from_station', 'to_station', 'date', 'avg_delay_minutes', 'total_trips',
+                 'delayed_trips', 'delay_percentage'],
+                daily_data, conflict_columns=['from_station', 'to_station', 'date'])
+            if saved:
+                print(f"Saved {saved} daily station stats to database.")
+
+        # Save daily route stats
+        if 'route_stats' in stats and not stats['route_stats'].empty:
+            routes = stats['route_stats']
+            route_data = zip(
+                routes['route_name'],
+                routes['date'],
+                routes['avg_delay_minutes'],
+                routes['delay_count'],  # total_trips
+                routes['delayed_count'],  # delayed_trips (DELAYED_THRESHOLD_MINUTES or more)
+                (None if pd.isna(on_time) else 100 - on_time for on_time in routes['on_time_percentage'])
+            )
+            saved = copy_upsert(
+                conn, 'daily_route_stats',
+                ['route_name', 'date', 'avg_delay_minutes', 'total_trips',
+                 'delayed_trips', 'delay_percentage'],
+                route_data, conflict_columns=['route_name', 'date'])
+            if saved:
+                print(f"Saved {saved} daily route stats to database.")
+
+    def _write_raw_delays(self, conn, raw_data: Dict[str, Any]):
+        """Stream raw station pair delays into station_pair_delays with COPY"""
+        delays = raw_data.get('delays')
+        if not delays:
+            return
 
-        except Exception as e:
-            print(f"Error saving raw delays to database: {e}")
-            if self.db_conn:
-                self.db_conn.rollback()
+        # Only save nonzero delays for relevant station pairs
+        delays = delays.delayed()
+        relevant = delays.take(self._pair_ids(delays) >= 0)
+        if not relevant:
+            return
+
+        self._ensure_partitions(conn, relevant)
+        self.delay_writer.add(conn, relevant)
+        written = self.delay_writer.flush(conn)
+
+        if written:
+            print(f"Saved {written} raw delay records to database "
+                  f"({self.delay_writer.rows_per_second:.0f} rows/s average).")
+
+    def _ensure_partitions(self, conn, batch: DelayBatch):
+        """Make sure daily partitions exist for every day the batch covers"""
+        if self._partitioned is None:
+            self._check_schema(conn)
+        if not self._partitioned:
+            return
+        from setup_database import PARTITION_DAYS_AHEAD, ensure_partitions
+
+        local_times = batch.local_times()
+        first, last = local_times.min().date(), local_times.max().date()
+        if self._partitions_covered and self._partitions_covered[0] <= first and last <= self._partitions_covered[1]:
+            return
 
+        with conn.cursor() as cursor:
+            created = ensure_partitions(cursor, first)
+        self._partitions_covered = (first, date.today() + timedelta(days=PARTITION_DAYS_AHEAD))
+        if created:
+            print(f"Created {created} new station_pair_delays partitions.")
+
+    def _conditional_headers(self, name: str) -> Dict[str, str]:
+        """If-None-Match/If-Modified-Since headers from a feed's last processed response"""
+        validators = self._validators.get(name, {})
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def _remember_validators(self, name: str, headers, feed_timestamp: Optional[int]):
+        """Only called once a feed has been fully consumed"""
+        self._validators[name] = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'timestamp': feed_timestamp,
+        }
+
+    def _feed_decoder(self, name: str):
+        """
+        Decoder for one feed: returns (feed_timestamp, decoded), with decoded None when
+        the FeedHeader timestamp shows the feed hasn't moved since it was last processed.
+        Servers that ignore validators still give us the header timestamp, so only
+        the header is read before committing to a full parse.
+        """
+        kind = feed_kind(name)
+        last_timestamp = self._validators.get(name, {}).get('timestamp')
+        route_codes = get_route_code_set()
+        now = int(time.time())
+
+        def decode(content: bytes) -> Tuple[Optional[int], Any]:
+            feed_timestamp = read_feed_timestamp(content)
+            if feed_timestamp is not None and feed_timestamp == last_timestamp:
+                return feed_timestamp, None
+            if kind == 'trip_updates':
+                return feed_timestamp, self.feed_decoder.decode(content, route_codes, now)
+            if kind == 'vehicle_positions':
+                return feed_timestamp, decode_vehicle_positions(content, route_codes)
+            return feed_timestamp, decode_alerts(content, route_codes)
+
+        return decode
+
+    @timed_stage('fetch_realtime_data', rows_out=raw_data_rows)
     def fetch_realtime_data(self) -> Dict[str, Any]:
         """
         Fetch real-time trip update data from Entur API (GTFS-RT format).
         Focus on routes between Drammen and Gardemoen.
+        Returns {"delays": DelayBatch}, plus "unchanged": True when the feed hasn't moved.
+        With all feeds enabled, vehicle positions and alerts are fetched concurrently
+        and joined in as "vehicle_positions" and "alerts".
         """
         try:
-            # Entur GTFS-RT endpoint for trip updates (contains delay info)
-            url = "https://api.entur.io/realtime/v1/gtfs-rt/trip-updates"
+            if self.async_fetcher:
+                return self._fetch_all_feeds()
 
-            response = self.session.get(url, timeout=30)
+            # Entur GTFS-RT endpoint for trip updates (contains delay info)
+            name = 'trip_updates'
+            url = GTFS_RT_FEEDS[name]
+
+            # Conditional GET: let the server answer 304 if the feed hasn't changed
+            response = self.session.get(url, headers=self._conditional_headers(name), timeout=30)
+            self.metrics.feed_bytes.inc(len(response.content), feed=name)
+            if response.status_code == 304:
+                self.metrics.feed_not_modified.inc(feed=name)
+                print("Feed not modified since last poll (HTTP 304).")
+                return {"delays": DelayBatch.empty(), "unchanged": True}
             response.raise_for_status()
 
-            # Parse GTFS-RT protobuf
-            feed = gtfs_realtime_pb2.FeedMessage()
-            feed.ParseFromString(response.content)
-
-            # Convert to our format - extract delays between stops
-            delays = []
-            for entity in feed.entity:
-                if entity.HasField('trip_update'):
-                    trip_update = entity.trip_update
-
-                    # Only process trips on Oslo region routes
-                    route_id = trip_update.trip.route_id or "unknown"
-
-                    # Check if this route is in our Oslo region configuration
-                    if route_id not in get_all_route_codes():
-                        continue  # Skip routes not in Oslo region
-
-                    stop_updates = trip_update.stop_time_update
-                    if len(stop_updates) >= 2:
-                        for i in range(len(stop_updates) - 1):
-                            current_stop = stop_updates[i]
-                            next_stop = stop_updates[i + 1]
-
-                            # Get delay from current stop
-                            delay_seconds = 0
-                            if current_stop.HasField('departure') and current_stop.departure.HasField('delay'):
-                                delay_seconds = current_stop.departure.delay
-                            elif current_stop.HasField('arrival') and current_stop.arrival.HasField('delay'):
-                                delay_seconds = current_stop.arrival.delay
-
-                            if delay_seconds != 0:  # Only record if there's a delay
-                                delays.append({
-                                    "from_stop": current_stop.stop_id,
-                                    "to_stop": next_stop.stop_id,
-                                    "route_id": route_id,
-                                    "delay_seconds": delay_seconds,
-                                    "timestamp": datetime.fromtimestamp(trip_update.timestamp).isoformat() if trip_update.timestamp else datetime.now().isoformat()
-                                })
-
-            return {"delays": delays}
+            # Parse GTFS-RT protobuf into stop-level delays
+            feed_timestamp, stop_times = self._feed_decoder(name)(response.content)
+            if stop_times is None:
+                self.metrics.feed_not_modified.inc(feed=name)
+                print(f"Feed timestamp {feed_timestamp} unchanged since last poll, skipping parse.")
+                return {"delays": DelayBatch.empty(), "unchanged": True}
+
+            self._archive_snapshot(name, response.content, feed_timestamp)
+            raw_data = self.new_observations(stop_times)
+
+            self._remember_validators(name, response.headers, feed_timestamp)
+            return raw_data
 
         except Exception as e:
             print(f"Error fetching from Entur API: {e}")
             print("Falling back to mock data...")
+            self.metrics.mock_fallbacks.inc()
+            return self._mock_data()
 
-            # Mock data for Oslo region station-to-station delays
-            # Generate mock data for multiple routes across the Oslo region
-            mock_delays = []
-
-            # Generate delays for key routes
-            route_samples = {
-                "L1": [("Spikkestad", "Asker"), ("Asker", "Oslo S"), ("Oslo S", "Lillestrøm")],
-                "L2": [("Ski", "Oslo S"), ("Oslo S", "Stabekk")],
-                "L12": [("Kongsberg", "Drammen"), ("Drammen", "Oslo S"), ("Oslo S", "Eidsvoll")],
-                "L13": [("Drammen", "Oslo S"), ("Oslo S", "Dal")],
-                "L21": [("Stabekk", "Oslo S"), ("Oslo S", "Moss")],
-                "R10": [("Drammen", "Oslo S"), ("Oslo S", "Lillehammer")],
-                "R20": [("Oslo S", "Ski"), ("Ski", "Halden")],
-                "FLY1": [("Oslo S", "Oslo Lufthavn")],
-                "FLY2": [("Drammen", "Oslo S"), ("Oslo S", "Oslo Lufthavn")]
-            }
-
-            import random
-            for route_id, station_pairs in route_samples.items():
-                for from_stop, to_stop in station_pairs:
-                    # Generate random delay between 0-600 seconds (0-10 minutes)
-                    delay_seconds = random.randint(0, 600)
-                    if delay_seconds > 0:  # Only include delays > 0 for realism
-                        mock_delays.append({
-                            "from_stop": from_stop,
-                            "to_stop": to_stop,
-                            "route_id": route_id,
-                            "delay_seconds": delay_seconds,
-                            "timestamp": datetime.now().isoformat()
-                        })
-
-            return {"delays": mock_delays}
-
-    def process_data(self, raw_data: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    def _fetch_all_feeds(self) -> Dict[str, Any]:
         """
-        Process raw delay data and calculate statistics by station pairs.
+        Fetch every configured feed concurrently and join the results into one poll.
+        Protobuf decoding runs in worker threads, so the poll takes as long as the
+        slowest feed. Failing trip-update feeds raise (falling back to mock data);
+        failing vehicle-position or alert feeds are only reported.
         """
-        delays = raw_data.get('delays', [])
-
-        # Convert to DataFrame
-        df = pd.DataFrame(delays)
-        if df.empty:
-            # Return empty DataFrames if no data
-            return {
-                'daily_stats': pd.DataFrame(),
-                'hourly_stats': pd.DataFrame(),
-                'station_delays': pd.DataFrame()
-            }
-
-        # Add delay in minutes
-        df['delay_minutes'] = df['delay_seconds'] / 60
+        from async_fetcher import FeedResult
+
+        results = self.async_fetcher.fetch(
+            self.sources,
+            {name: self._feed_decoder(name) for name in self.sources},
+            {name: self._conditional_headers(name) for name in self.sources})
+
+        batches: List[StopTimeBatch] = []
+        vehicle_positions: Optional[int] = None
+        alerts: Optional[List[Dict[str, Any]]] = None
+        trip_results: List[FeedResult] = []
+
+        for name, result in results.items():
+            kind = feed_kind(name)
+            if kind == 'trip_updates':
+                trip_results.append(result)
+            if result.error is not None:
+                print(f"Error fetching {name} feed: {result.error}")
+                continue
+            print(f"Fetched {name} feed: HTTP {result.status_code}, "
+                  f"{result.size} bytes in {result.elapsed:.3f}s.")
+            self.metrics.feed_bytes.inc(result.size, feed=name)
+            if result.decoded is None or result.decoded[1] is None:
+                self.metrics.feed_not_modified.inc(feed=name)
+                continue  # 304 or unchanged header timestamp
+
+            self._archive_snapshot(name, result.content, result.decoded[0])
+            decoded = result.decoded[1]
+            if kind == 'trip_updates':
+                batches.append(decoded)
+            elif kind == 'vehicle_positions':
+                vehicle_positions = (vehicle_positions or 0) + decoded
+            else:
+                alerts = (alerts or []) + decoded
+
+        if all(result.error is not None for result in trip_results):
+            raise trip_results[0].error
+
+        raw_data: Dict[str, Any] = {}
+        if vehicle_positions is not None:
+            raw_data['vehicle_positions'] = vehicle_positions
+            print(f"{vehicle_positions} vehicles reporting positions on Oslo region routes.")
+        if alerts is not None:
+            # Alerts spanning several datasources are reported by each of them
+            alerts = list({alert['id']: alert for alert in alerts}.values())
+            raw_data['alerts'] = alerts
+            print(f"{len(alerts)} active alerts on Oslo region routes.")
+
+        if not batches:
+            print("Trip updates not modified since last poll.")
+            raw_data.update(delays=DelayBatch.empty(), unchanged=True)
+        else:
+            raw_data.update(self.new_observations(StopTimeBatch.concat(batches)))
+
+        # Only remember validators once the poll has been fully consumed
+        for name, result in results.items():
+            if result.error is None and result.decoded is not None:
+                self._remember_validators(name, result.headers, result.decoded[0])
+        return raw_data
+
+    def new_observations(self, stop_times: StopTimeBatch, now: Optional[float] = None) -> Dict[str, DelayBatch]:
+        """
+        Stop-pair, segment and dwell delays of decoded trips, minus observations
+        already reported with the same value on an earlier poll. The earlier values
+        of changed observations come along as superseded_<name> batches, to be taken
+        back from the running statistics (see retract_superseded).
+        Stops matched by NSR ID are renamed to their configured station name, so a
+        station aggregates and is stored under one name however the feed refers to it.
+        """
+        stop_times = stop_times.rename_stops(get_route_topology().display_names(stop_times.stop_names))
+        batch = stop_times.stop_pair_delays()
+        observations = {}
+        for name, deduplicator, delays in (
+                ('delays', self.deduplicator, batch),
+                ('segment_delays', self.segment_deduplicator, stop_times.segment_delays()),
+                ('dwell_delays', self.dwell_deduplicator, stop_times.dwell_delays())):
+            observations[name], observations[f'superseded_{name}'] = deduplicator.filter(delays, now)
+        print(f"Extracted {len(batch)} stop-pair delays, {len(observations['delays'])} new or changed "
+              f"({len(observations['segment_delays'])} segment, {len(observations['dwell_delays'])} dwell).")
+        return observations
+
+    @timed_stage('read_feed_file', rows_out=raw_data_rows)
+    def read_feed_file(self, path: str) -> Dict[str, Any]:
+        """
+        Delays from a saved trip-updates feed instead of the API, e.g. to profile a
+        feed that made a poll slow. The file is always fully processed; observations
+        already seen by this fetcher are still deduplicated.
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.metrics.feed_bytes.inc(len(content), feed='file')
+        return self.new_observations(self.feed_decoder.decode(content, get_route_code_set(), int(time.time())))
+
+    def _archive_snapshot(self, name: str, content: bytes, feed_timestamp: Optional[int]):
+        """Append a processed feed payload to its snapshot archive (if archiving is enabled)"""
+        if not self.archive_dir:
+            return
+        archive = self.archives.get(name)
+        if archive is None:
+            from snapshot_archive import SnapshotArchive
+            archive = self.archives[name] = SnapshotArchive(
+                os.path.join(self.archive_dir, name.replace(':', '-')))
+        try:
+            archive.append(content, feed_timestamp)
+        except OSError as e:
+            print(f"Failed to archive {name} snapshot: {e}")
+
+    def _mock_data(self) -> Dict[str, Any]:
+        """Mock data for Oslo region station-to-station delays"""
+        # Generate mock data for multiple routes across the Oslo region
+        mock_delays = []
+
+        # Generate delays for key routes
+        route_samples = {
+            "L1": [("Spikkestad", "Asker"), ("Asker", "Oslo S"), ("Oslo S", "Lillestrøm")],
+            "L2": [("Ski", "Oslo S"), ("Oslo S", "Stabekk")],
+            "L12": [("Kongsberg", "Drammen"), ("Drammen", "Oslo S"), ("Oslo S", "Eidsvoll")],
+            "L13": [("Drammen", "Oslo S"), ("Oslo S", "Dal")],
+            "L21": [("Stabekk", "Oslo S"), ("Oslo S", "Moss")],
+            "R10": [("Drammen", "Oslo S"), ("Oslo S", "Lillehammer")],
+            "R20": [("Oslo S", "Ski"), ("Ski", "Halden")],
+            "FLY1": [("Oslo S", "Oslo Lufthavn")],
+            "FLY2": [("Drammen", "Oslo S"), ("Oslo S", "Oslo Lufthavn")]
+        }
 
-        # Calculate daily stats by station pair
-        daily_stats = self._calculate_daily_stats(df)
+        import random
+        now = int(time.time())
+        for route_id, station_pairs in route_samples.items():
+            for from_stop, to_stop in station_pairs:
+                # Generate random delay between 0-600 seconds (0-10 minutes)
+                delay_seconds = random.randint(0, 600)
+                if delay_seconds > 0:  # Only include delays > 0 for realism
+                    mock_delays.append(StopPairDelay(from_stop, to_stop, route_id, delay_seconds, now,
+                                                     f"mock_{route_id}_{from_stop}_{now}"))
 
-        # Calculate hourly stats by station pair
-        hourly_stats = self._calculate_hourly_stats(df)
+        return {"delays": DelayBatch.from_records(mock_delays), "mock": True}
 
-        # Station delays (raw data for detailed view)
-        station_delays = df[['from_stop', 'to_stop', 'route_id', 'delay_minutes', 'timestamp']].copy()
+    @timed_stage('process_data', rows_in=raw_data_rows, rows_out=stats_rows)
+    def process_data(self, raw_data: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+        """
+        Process raw delay data and calculate statistics by station pairs.
+        Each poll's aggregates are merged into the running statistics, and the
+        returned daily/hourly/route tables cover every poll so far, not just this one.
+        """
+        delays = raw_data.get('delays') or DelayBatch.empty()
+
+        # Mock data must never leak into the persisted running statistics
+        aggregator = RunningAggregator() if raw_data.get('mock') else self.aggregator
+
+        retracted = self.retract_superseded(raw_data, aggregator)
+        merged = self.merge_delays(delays, aggregator)
+        segments = self.merge_segments(raw_data.get('segment_delays') or DelayBatch.empty(),
+                                       raw_data.get('dwell_delays') or DelayBatch.empty(), aggregator)
+        station_delays = pd.DataFrame()
+
+        if merged or segments or retracted:
+            aggregator.prune()
+            if aggregator is self.aggregator:
+                self.save_state()
+
+        if merged:
+            # Station delays (raw data for detailed view)
+            station_delays = self._station_delays(delays.delayed())
+
+        return self.running_stats(aggregator, station_delays)
+
+    @staticmethod
+    def _station_delays(delays: DelayBatch) -> pd.DataFrame:
+        """Per-record station delays with local timestamps"""
+        stop_categories = pd.Index(delays.stop_names, dtype=object)
+        return pd.DataFrame({
+            'from_stop': pd.Categorical.from_codes(delays.from_codes, categories=stop_categories),
+            'to_stop': pd.Categorical.from_codes(delays.to_codes, categories=stop_categories),
+            'route_id': pd.Categorical.from_codes(delays.route_codes,
+                                                  categories=pd.Index(delays.route_names, dtype=object)),
+            'delay_minutes': delays.delay_seconds / 60,
+            'timestamp': delays.local_times(),
+        })
+
+    @staticmethod
+    def _pair_ids(delays: DelayBatch) -> np.ndarray:
+        """Configured pair id of every delay (-1 off our routes); stops may be names or NSR StopPlace/Quay IDs"""
+        return get_route_topology().pair_ids(delays.stop_names, delays.from_codes, delays.to_codes)
+
+    def save_state(self):
+        """
+        Persist the running statistics together with the dedup state, so after a
+        restart superseded observations are still taken back from what they were merged into
+        """
+        self.aggregator.save()
+        for deduplicator in (self.deduplicator, self.segment_deduplicator, self.dwell_deduplicator):
+            deduplicator.save()
 
-        # Calculate route stats (aggregate across all station pairs for a route)
-        route_stats = self._calculate_route_stats(df)
+    def retract_superseded(self, raw_data: Dict[str, Any],
+                           aggregator: Optional[RunningAggregator] = None) -> int:
+        """
+        Take back the earlier values of observations whose delay changed, before the
+        new values are merged, so every trip stop counts once with its latest delay.
+        Returns the number of observations taken back.
+        """
+        superseded = [raw_data.get(f'superseded_{name}') or DelayBatch.empty()
+                      for name in ('delays', 'segment_delays', 'dwell_delays')]
+        return (self.merge_delays(superseded[0], aggregator, retract=True)
+                + self.merge_segments(superseded[1], superseded[2], aggregator, retract=True))
 
-        return {
-            'daily_stats': daily_stats,
-            'hourly_stats': hourly_stats,
-            'station_delays': station_delays,
-            'route_stats': route_stats
+    def merge_delays(self, delays: DelayBatch, aggregator: Optional[RunningAggregator] = None,
+                     retract: bool = False) -> int:
+        """
+        Merge one poll's daily/hourly/route aggregates into the running statistics
+        (without pruning or saving them), or take them back with retract=True.
+        On-time (zero) delays are merged too, so counts, averages, percentiles and
+        punctuality cover every observed departure. Returns the number of delays merged.
+        """
+        if aggregator is None:
+            aggregator = self.aggregator
+        if not len(delays):
+            return 0
+
+        # Tag pairs on our configured routes once for the whole batch;
+        # is_relevant is a function of the pair, so aggregations just carry it along
+        relevant = self._pair_ids(delays) >= 0
+        if self.aggregation_engine == 'pandas':
+            self._merge_delay_frame(self._delay_frame(delays, relevant), aggregator, retract)
+        else:
+            for kind, partial in aggregate_delays(delays, DELAY_KINDS, relevant).items():
+                partial.merge_into(aggregator, kind, retract)
+        return len(delays)
+
+    @staticmethod
+    def _delay_frame(delays: DelayBatch, relevant: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Per-record frame the pandas aggregations (_calculate_*) group"""
+        # Columnar view; timestamps are converted once here for all aggregations
+        df = delays.to_frame()
+        df['delay_minutes'] = df['delay_seconds'] / 60
+        df['delay_minutes_sq'] = df['delay_minutes'] ** 2
+        if relevant is not None:
+            df['is_relevant'] = relevant
+        delay_minutes = df['delay_minutes'].to_numpy()
+        df['sketch_bin'] = sketch_bins(delay_minutes)
+        df['histogram_bucket'] = histogram_buckets(delay_minutes)
+        return df
+
+    def _merge_delay_frame(self, df: pd.DataFrame, aggregator: RunningAggregator, retract: bool = False):
+        """Reference implementation of merge_delays: one groupby per running table"""
+        aggregator.merge('daily', self._calculate_daily_stats(df), retract)
+        aggregator.merge('hourly', self._calculate_hourly_stats(df), retract)
+        aggregator.merge('date_hourly', self._calculate_date_hourly_stats(df), retract)
+        aggregator.merge('route', self._calculate_route_stats(df), retract)
+
+        # Percentile sketches and punctuality histograms: merge counts per (key, bin, bucket)
+        for kind in DELAY_KINDS:
+            aggregator.merge_distribution(kind, self._calculate_distribution(df, KEY_COLUMNS[kind]), retract)
+
+    def merge_segments(self, segment_delays: DelayBatch, dwell_delays: DelayBatch,
+                       aggregator: Optional[RunningAggregator] = None, retract: bool = False) -> int:
+        """
+        Merge one poll's delay gained per segment and per dwell into the running
+        statistics, or take it back with retract=True. Returns the number of observations merged.
+        """
+        if aggregator is None:
+            aggregator = self.aggregator
+
+        for kind, batch in (('segment', segment_delays), ('dwell', dwell_delays)):
+            if not len(batch):
+                continue
+            relevant = self._pair_ids(batch) >= 0 if kind == 'segment' else None
+            if self.aggregation_engine == 'numpy':
+                aggregate_delays(batch, [kind], relevant)[kind].merge_into(aggregator, kind, retract)
+                continue
+
+            df = self._delay_frame(batch, relevant)
+            if kind == 'dwell':
+                df['stop'] = df['from_stop']  # (stop, stop) rows
+            aggregator.merge(kind, self._calculate_segment_stats(df, KEY_COLUMNS[kind]), retract)
+            aggregator.merge_distribution(kind, self._calculate_distribution(df, KEY_COLUMNS[kind]), retract)
+        return len(segment_delays) + len(dwell_delays)
+
+    def running_stats(self, aggregator: Optional[RunningAggregator] = None,
+                      station_delays: Optional[pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Running statistics in the shape generate_json_files/save_to_database expect.
+        Dated tables only hold the dates merged into since the last call, so a poll's
+        upserts and exports cost O(the dates it touched); summaries are only included
+        when a date in their window changed.
+        """
+        if aggregator is None:
+            aggregator = self.aggregator
+        dirty = aggregator.take_dirty_dates()
+        stats = {
+            'daily_stats': aggregator.to_frame('daily', dirty),
+            'hourly_stats': aggregator.to_frame('hourly'),
+            'station_delays': station_delays if station_delays is not None else pd.DataFrame(),
+            'route_stats': self._add_route_names(aggregator.to_frame('route', dirty)),
+            'date_hourly_stats': aggregator.to_frame('date_hourly', dirty),
+            # Delay gained running between consecutive stops and while dwelling at a stop
+            'segment_stats': aggregator.to_frame('segment', dirty),
+            'dwell_stats': aggregator.to_frame('dwell', dirty),
+            # Delay counts per histogram bucket (delays_early, delays_0_1, ...) for distribution charts
+            'daily_histograms': aggregator.histogram_frame('daily', dirty),
+            'route_histograms': aggregator.histogram_frame('route', dirty),
+            # Every date still in the running statistics (for shard retention and the index)
+            'retained_dates': pd.DataFrame({'date': aggregator.dates()}),
         }
+        newest = aggregator.newest_date()
+        for days in SUMMARY_WINDOWS:
+            if newest is None or not any(0 <= (newest - day).days < days for day in dirty):
+                continue
+            stats[f'pair_summary_{days}d'] = aggregator.summarize('daily', days)
+            stats[f'route_summary_{days}d'] = self._add_route_names(aggregator.summarize('route', days))
+        return stats
+
+    @staticmethod
+    def _add_route_names(route_stats: pd.DataFrame) -> pd.DataFrame:
+        """Add route name mapping from configuration"""
+        if route_stats.empty:
+            return route_stats
+        route_names = {code: route['name'] for code, route in OSLO_REGION_ROUTES.items()}
+        route_stats['route_name'] = route_stats['route_id'].astype(object).map(route_names).fillna('Unknown Route')
+        return route_stats
 
     def _calculate_daily_stats(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate daily delay statistics by station pair"""
@@ -302,35 +817,15 @@ class TrainDelayFetcher:
             return pd.DataFrame()
 
         # Group by date, from_stop, to_stop
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
-        daily_agg = df.groupby(['date', 'from_stop', 'to_stop']).agg({
-            'delay_minutes': ['mean', 'sum', 'count']
+        daily_agg = df.groupby(['date', 'from_stop', 'to_stop'], observed=True).agg({
+            'delay_minutes': ['mean', 'sum', 'count', 'min', 'max'],
+            'delay_minutes_sq': 'sum',
+            'is_relevant': 'first'
         }).reset_index()
 
         # Flatten column names
-        daily_agg.columns = ['date', 'from_stop', 'to_stop', 'avg_delay_minutes', 'total_delay_minutes', 'delay_count']
-
-        # Filter for Oslo region routes (Drammen-Gardemoen corridor and connecting lines)
-        relevant_pairs = [
-            # Drammen-Oslo direction
-            ('Drammen', 'Sandvika'),
-            ('Sandvika', 'Asker'),
-            ('Asker', 'Oslo S'),
-            # Oslo-Drammen direction
-            ('Oslo S', 'Asker'),
-            ('Asker', 'Sandvika'),
-            ('Sandvika', 'Drammen'),
-            # Oslo-Gardemoen direction
-            ('Oslo S', 'Lillestrøm'),
-            ('Lillestrøm', 'Oslo Lufthavn'),
-            # Gardemoen-Oslo direction
-            ('Oslo Lufthavn', 'Lillestrøm'),
-            ('Lillestrøm', 'Oslo S'),
-        ]
-        # For MVP, include all, but prioritize these
-        daily_agg['is_relevant'] = daily_agg.apply(
-            lambda row: (row['from_stop'], row['to_stop']) in relevant_pairs, axis=1
-        )
+        daily_agg.columns = ['date', 'from_stop', 'to_stop', 'avg_delay_minutes', 'total_delay_minutes', 'delay_count',
+                             'min_delay_minutes', 'max_delay_minutes', 'sum_sq_delay_minutes', 'is_relevant']
 
         return daily_agg
 
@@ -340,121 +835,434 @@ class TrainDelayFetcher:
             return pd.DataFrame()
 
         # Group by hour, from_stop, to_stop
-        df['hour'] = pd.to_datetime(df['timestamp']).dt.hour
-        hourly_agg = df.groupby(['hour', 'from_stop', 'to_stop']).agg({
-            'delay_minutes': ['mean', 'sum', 'count']
+        hourly_agg = df.groupby(['hour', 'from_stop', 'to_stop'], observed=True).agg({
+            'delay_minutes': ['mean', 'sum', 'count', 'min', 'max'],
+            'delay_minutes_sq': 'sum',
+            'is_relevant': 'first'
         }).reset_index()
 
         # Flatten column names
-        hourly_agg.columns = ['hour', 'from_stop', 'to_stop', 'avg_delay_minutes', 'total_delay_minutes', 'delay_count']
-
-        # Filter for Oslo region routes (Drammen-Gardemoen corridor and connecting lines)
-        relevant_pairs = [
-            # Drammen-Oslo direction
-            ('Drammen', 'Sandvika'),
-            ('Sandvika', 'Asker'),
-            ('Asker', 'Oslo S'),
-            # Oslo-Drammen direction
-            ('Oslo S', 'Asker'),
-            ('Asker', 'Sandvika'),
-            ('Sandvika', 'Drammen'),
-            # Oslo-Gardemoen direction
-            ('Oslo S', 'Lillestrøm'),
-            ('Lillestrøm', 'Oslo Lufthavn'),
-            # Gardemoen-Oslo direction
-            ('Oslo Lufthavn', 'Lillestrøm'),
-            ('Lillestrøm', 'Oslo S'),
-        ]
-        hourly_agg['is_relevant'] = hourly_agg.apply(
-            lambda row: (row['from_stop'], row['to_stop']) in relevant_pairs, axis=1
-        )
+        hourly_agg.columns = ['hour', 'from_stop', 'to_stop', 'avg_delay_minutes', 'total_delay_minutes', 'delay_count',
+                              'min_delay_minutes', 'max_delay_minutes', 'sum_sq_delay_minutes', 'is_relevant']
 
         return hourly_agg
 
-    def _calculate_route_stats(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate route-level delay statistics (aggregate across station pairs)"""
+    def _calculate_date_hourly_stats(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Calculate hour-by-hour delay statistics by station pair for each date"""
         if df.empty:
             return pd.DataFrame()
 
-        # Group by date and route_id to get overall route delays
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
-        route_agg = df.groupby(['date', 'route_id']).agg({
-            'delay_minutes': ['mean', 'sum', 'count']
+        # Group by date, hour, from_stop, to_stop
+        date_hourly_agg = df.groupby(['date', 'hour', 'from_stop', 'to_stop'], observed=True).agg({
+            'delay_minutes': ['mean', 'sum', 'count', 'min', 'max'],
+            'delay_minutes_sq': 'sum',
+            'is_relevant': 'first'
         }).reset_index()
 
         # Flatten column names
-        route_agg.columns = ['date', 'route_id', 'avg_delay_minutes', 'total_delay_minutes', 'delay_count']
+        date_hourly_agg.columns = ['date', 'hour', 'from_stop', 'to_stop', 'avg_delay_minutes',
+                                   'total_delay_minutes', 'delay_count', 'min_delay_minutes',
+                                   'max_delay_minutes', 'sum_sq_delay_minutes', 'is_relevant']
 
-        # Add route name mapping from configuration
-        route_names = {code: route['name'] for code, route in OSLO_REGION_ROUTES.items()}
-        route_agg['route_name'] = route_agg['route_id'].map(route_names).fillna('Unknown Route')
+        return date_hourly_agg
 
-        return route_agg
+    def _calculate_segment_stats(self, df: pd.DataFrame, key_columns: List[str]) -> pd.DataFrame:
+        """Calculate statistics of delay gained per segment or dwell key"""
+        if df.empty:
+            return pd.DataFrame()
 
-    def generate_json_files(self, stats: Dict[str, pd.DataFrame], output_dir: str = 'tmp'):
-        """Generate JSON files from statistics"""
-        os.makedirs(output_dir, exist_ok=True)
+        aggregations = {
+            'delay_minutes': ['mean', 'sum', 'count', 'min', 'max'],
+            'delay_minutes_sq': 'sum',
+        }
+        if 'is_relevant' in df:
+            aggregations['is_relevant'] = 'first'
+        segment_agg = df.groupby(key_columns, observed=True).agg(aggregations).reset_index()
 
-        # Daily stats
-        daily_json = stats['daily_stats'].to_dict('records')
-        with open(os.path.join(output_dir, 'daily_stats.json'), 'w') as f:
-            json.dump(daily_json, f, indent=2, default=str)
+        # Flatten column names
+        segment_agg.columns = key_columns + ['avg_delay_minutes', 'total_delay_minutes', 'delay_count',
+                                             'min_delay_minutes', 'max_delay_minutes',
+                                             'sum_sq_delay_minutes'] + (['is_relevant'] if 'is_relevant' in df else [])
 
-        # Hourly stats
-        hourly_json = stats['hourly_stats'].to_dict('records')
-        with open(os.path.join(output_dir, 'hourly_stats.json'), 'w') as f:
-            json.dump(hourly_json, f, indent=2, default=str)
+        return segment_agg
 
-        # Station delays (detailed data)
-        station_json = stats['station_delays'].to_dict('records')
-        with open(os.path.join(output_dir, 'station_delays.json'), 'w') as f:
-            json.dump(station_json, f, indent=2, default=str)
+    def _calculate_distribution(self, df: pd.DataFrame, key_columns: List[str]) -> pd.DataFrame:
+        """Count delays per key, sketch bin and histogram bucket"""
+        if df.empty:
+            return pd.DataFrame()
 
-        # Route stats
-        route_json = stats['route_stats'].to_dict('records')
-        with open(os.path.join(output_dir, 'route_stats.json'), 'w') as f:
-            json.dump(route_json, f, indent=2, default=str)
+        return (df.groupby(key_columns + ['sketch_bin', 'histogram_bucket'], observed=True)
+                .size()
+                .reset_index(name='delay_count'))
 
-        print(f"JSON files generated in {output_dir}/")
+    def _calculate_route_stats(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Calculate route-level delay statistics (aggregate across station pairs)"""
+        if df.empty:
+            return pd.DataFrame()
 
-def main():
-    """Main execution function"""
-    import argparse
+        # Group by date and route_id to get overall route delays
+        route_agg = df.groupby(['date', 'route_id'], observed=True).agg({
+            'delay_minutes': ['mean', 'sum', 'count', 'min', 'max'],
+            'delay_minutes_sq': 'sum'
+        }).reset_index()
 
-    parser = argparse.ArgumentParser(description='Train Delay Data Fetcher')
-    parser.add_argument('--use-db', action='store_true', help='Save data to database')
-    args = parser.parse_args()
+        # Flatten column names
+        route_agg.columns = ['date', 'route_id', 'avg_delay_minutes', 'total_delay_minutes', 'delay_count',
+                             'min_delay_minutes', 'max_delay_minutes', 'sum_sq_delay_minutes']
 
-    print("Starting Train Delay Data Fetcher...")
+        return self._add_route_names(route_agg)
+
+    @timed_stage('generate_json_files', rows_in=stats_rows)
+    def generate_json_files(self, stats: Dict[str, pd.DataFrame], output_dir: str = 'tmp'):
+        """
+        Generate JSON files from statistics.
+        Each table is written as row objects (<name>.json) and in a dictionary-encoded
+        columnar layout (<name>.columns.json), each with .gz/.br precompressed siblings.
+        Files are written compactly and atomically; unchanged files are left alone
+        and output_dir/manifest.json lists the hash and size of each file.
+        """
+        exporter = JsonExporter(output_dir)
+
+        for name in ('hourly_stats', 'station_delays'):
+            # station_delays only holds a poll's new observations: a poll without any
+            # keeps the last ones rather than emptying the file
+            if name == 'station_delays' and stats[name].empty:
+                continue
+            exporter.export_frame(f'{name}.json', stats[name])
+            exporter.export_columns(f'{name}.columns.json', stats[name])
 
-    fetcher = TrainDelayFetcher(use_database=args.use_db)
+        self._export_shards(exporter, stats)
 
+        changed = exporter.finish()
+        self.metrics.json_files_written.inc(changed)
+        print(f"JSON files generated in {output_dir}/ ({changed} changed).")
+
+    def _export_shards(self, exporter: JsonExporter, stats: Dict[str, pd.DataFrame]):
+        """
+        Write per-date shards (daily/<date>.json, hourly/<date>.json) for the dates that
+        changed, the latest date's flat tables, rolling summary_<N>d.json files when
+        their window changed, and index.json, so a client showing one day or one
+        window downloads only that.
+        """
+        daily = stats['daily_stats']
+        routes = stats['route_stats']
+        daily_histograms = stats.get('daily_histograms', pd.DataFrame())
+        route_histograms = stats.get('route_histograms', pd.DataFrame())
+        date_hourly = stats.get('date_hourly_stats', pd.DataFrame())
+        retained = stats['retained_dates']['date'].tolist() if 'retained_dates' in stats else []
+        changed = set()
+        for name in self.DATED_TABLES:
+            if not stats[name].empty:
+                changed.update(stats[name]['date'].unique())
+
+        for day in sorted(set(daily['date'].unique() if not daily.empty else ())
+                          | set(date_hourly['date'].unique() if not date_hourly.empty else ())):
+            iso = day.isoformat()
+            exporter.export(f'daily/{iso}.json', {
+                'date': iso,
+                'station_pairs': frame_records(daily[daily['date'] == day]) if not daily.empty else [],
+                'routes': frame_records(routes[routes['date'] == day]) if not routes.empty else [],
+                'station_pair_histograms': (frame_records(daily_histograms[daily_histograms['date'] == day])
+                                            if not daily_histograms.empty else []),
+                'route_histograms': (frame_records(route_histograms[route_histograms['date'] == day])
+                                     if not route_histograms.empty else []),
+            })
+            exporter.export_frame(f'hourly/{iso}.json',
+                                  date_hourly[date_hourly['date'] == day] if not date_hourly.empty
+                                  else pd.DataFrame())
+
+        # Drop shards of dates that fell out of the running statistics' retention
+        if retained:
+            oldest = retained[0].isoformat()
+            for name in [name for name in exporter.files if name.startswith(('daily/', 'hourly/'))]:
+                if os.path.basename(name)[:-len('.json')] < oldest:
+                    exporter.remove(name)
+
+        # The flat tables hold the latest date, rewritten whenever it changed
+        latest = retained[-1] if retained else None
+        if latest in changed:
+            for name in self.DATED_TABLES:
+                frame = stats[name]
+                latest_rows = frame[frame['date'] == latest] if not frame.empty else frame
+                exporter.export_frame(f'{name}.json', latest_rows)
+                exporter.export_columns(f'{name}.columns.json', latest_rows)
+
+        for days in SUMMARY_WINDOWS:
+            if f'pair_summary_{days}d' not in stats:
+                continue  # No date in the window changed
+            exporter.export(f'summary_{days}d.json', {
+                'days': days,
+                'end_date': latest.isoformat() if latest else None,
+                'station_pairs': frame_records(stats[f'pair_summary_{days}d']),
+                'routes': frame_records(stats[f'route_summary_{days}d']),
+            })
+
+        dates = sorted(os.path.basename(name)[:-len('.json')]
+                       for name in exporter.files if name.startswith('daily/'))
+        exporter.export('index.json', {
+            'dates': dates,
+            'latest_date': dates[-1] if dates else None,
+            'daily': 'daily/{date}.json',
+            'hourly': 'hourly/{date}.json',
+            'summaries': {f'{days}d': f'summary_{days}d.json' for days in SUMMARY_WINDOWS},
+        })
+
+def run_pipeline(fetcher: TrainDelayFetcher, use_db: bool = False, feed_file: Optional[str] = None):
+    """Run a single fetch -> process -> save -> export cycle (reading feed_file instead of fetching)"""
     # Fetch data
-    print("Fetching real-time data...")
-    raw_data = fetcher.fetch_realtime_data()
+    if feed_file:
+        print(f"Reading feed from {feed_file}...")
+        raw_data = fetcher.read_feed_file(feed_file)
+    else:
+        print("Fetching real-time data...")
+        raw_data = fetcher.fetch_realtime_data()
 
-    # Save raw delays to database if enabled
-    if args.use_db:
-        print("Saving raw delays to database...")
-        fetcher.save_raw_delays_to_database(raw_data)
+    if raw_data.get('unchanged'):
+        print("No new feed data, skipping processing.")
+        return
 
     # Process data
     print("Processing data...")
     stats = fetcher.process_data(raw_data)
 
-    # Save processed stats to database if enabled
-    if args.use_db:
-        print("Saving processed statistics to database...")
-        fetcher.save_to_database(stats)
+    # Save raw delays and processed stats to database in one transaction if enabled
+    if use_db:
+        print("Saving raw delays and processed statistics to database...")
+        fetcher.save_poll_to_database(raw_data, stats)
+
+    # Keep local history (fixed-width, date-sharded files) if enabled
+    fetcher.save_to_history(raw_data)
 
     # Generate JSON files
     print("Generating JSON files...")
     fetcher.generate_json_files(stats)
 
-    print("Data fetcher completed successfully!")
+def run_replay(fetcher: TrainDelayFetcher, archive_dir: str, start: Optional[int] = None,
+               end: Optional[int] = None, use_db: bool = False):
+    """
+    Stream archived trip-update snapshots back through extraction, deduplication and
+    aggregation as fast as they can be read and decoded, then export once at the end.
+    From the command line the fetcher uses DEFAULT_REPLAY_STATE_PATH unless --state-file
+    is given, so a backfill doesn't mix into or deduplicate against the live running state.
+    """
+    from snapshot_archive import SnapshotArchive
+
+    archive = SnapshotArchive(archive_dir)
+    fetch_times: deque = deque()
+
+    def feeds():
+        for snapshot in archive.iter_snapshots(start, end):
+            fetch_times.append(snapshot.fetched_at)
+            yield snapshot.content, snapshot.fetched_at
+
+    print(f"Replaying snapshots from {archive_dir}...")
+    started = time.perf_counter()
+    snapshots = 0
+    records = 0
+    for stop_times in fetcher.feed_decoder.decode_many(feeds(), get_route_code_set()):
+        # Dedup against the time the snapshot was fetched, not the wall clock
+        observations = fetcher.new_observations(stop_times, now=fetch_times.popleft())
+        delays = observations['delays']
+        fetcher.retract_superseded(observations)
+        fetcher.merge_delays(delays)
+        fetcher.merge_segments(observations['segment_delays'], observations['dwell_delays'])
+        if use_db and len(delays):
+            fetcher.save_raw_delays_to_database({"delays": delays})
+        fetcher.save_to_history({"delays": delays})
+        snapshots += 1
+        records += len(delays)
+
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {snapshots} snapshots ({records} new or changed delays) in {elapsed:.1f}s "
+          f"({snapshots / elapsed if elapsed else 0:.1f} snapshots/s).")
+    if not snapshots:
+        return
+
+    fetcher.aggregator.prune()
+    fetcher.save_state()
+    stats = fetcher.running_stats()
+    if use_db:
+        fetcher.save_to_database(stats)
+    fetcher.generate_json_files(stats)
+
+def run_profile(fetcher: TrainDelayFetcher, polls: int, output_dir: str,
+                feed_file: Optional[str] = None):
+    """
+    Run polls under cProfile and tracemalloc and write the CPU profile and the
+    top allocation sites per stage to output_dir (see profiling.PollProfiler).
+    Profiled polls leave the live state alone: each starts from empty running
+    statistics and dedup state and downloads the full feed, nothing is saved to
+    the database, history or snapshot archive, and each poll exports into an
+    empty output_dir/export/<poll> instead of tmp/.
+    """
+    from profiling import PollProfiler
+
+    live_state = (fetcher.aggregator, fetcher.deduplicator, fetcher.segment_deduplicator,
+                  fetcher.dwell_deduplicator, fetcher._validators, fetcher.archive_dir)
+    fetcher.archive_dir = None
+
+    profiler = PollProfiler()
+    fetcher.metrics.tracer = profiler
+    profiler.start()
+    try:
+        for poll in range(polls):
+            print(f"Profiling poll {poll + 1}/{polls}...")
+            # Unsaved state, so every poll does the full work of a first poll
+            fetcher.aggregator = RunningAggregator()
+            fetcher.deduplicator = TripDeduplicator()
+            fetcher.segment_deduplicator = TripDeduplicator()
+            fetcher.dwell_deduplicator = TripDeduplicator()
+            fetcher._validators = {}
+
+            raw_data = fetcher.read_feed_file(feed_file) if feed_file else fetcher.fetch_realtime_data()
+            fetcher.generate_json_files(fetcher.process_data(raw_data),
+                                        os.path.join(output_dir, 'export', str(poll + 1)))
+    finally:
+        profiler.stop()
+        fetcher.metrics.tracer = None
+        (fetcher.aggregator, fetcher.deduplicator, fetcher.segment_deduplicator,
+         fetcher.dwell_deduplicator, fetcher._validators, fetcher.archive_dir) = live_state
+
+    for path in profiler.write(output_dir):
+        print(f"Wrote {path}")
+
+def run_daemon(fetcher: TrainDelayFetcher, interval: float, use_db: bool = False,
+               metrics_file: Optional[str] = None):
+    """
+    Keep one fetcher alive and poll on a fixed schedule until SIGTERM/SIGINT.
+    Polls are scheduled against a monotonic clock so slow polls don't cause drift;
+    if a poll overruns its slot, the missed ticks are skipped rather than bunched up.
+    With metrics_file, the metrics are dumped after every poll.
+    """
+    stop_event = threading.Event()
+
+    def _handle_stop(signum, frame):
+        print(f"Received signal {signum}, shutting down...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _handle_stop)
+    signal.signal(signal.SIGINT, _handle_stop)
+
+    print(f"Running in daemon mode, polling every {interval} seconds.")
+    next_run = time.monotonic()
+
+    while not stop_event.is_set():
+        print(f"[{datetime.now().isoformat(timespec='seconds')}] Starting poll...")
+        try:
+            run_pipeline(fetcher, use_db)
+        except Exception as e:
+            # Keep the daemon alive; the next poll gets a fresh attempt
+            print(f"Error during poll: {e}")
+        if metrics_file:
+            fetcher.write_metrics(metrics_file)
+
+        next_run += interval
+        now = time.monotonic()
+        if next_run <= now:
+            skipped = int((now - next_run) // interval) + 1
+            next_run += skipped * interval
+            print(f"Poll overran its schedule, skipping {skipped} tick(s).")
+
+        stop_event.wait(next_run - time.monotonic())
+
+    print("Daemon stopped.")
+
+def main():
+    """Main execution function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train Delay Data Fetcher')
+    parser.add_argument('--use-db', action='store_true', help='Save data to database')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and poll the feed on a fixed schedule')
+    parser.add_argument('--interval', type=float, default=30,
+                        help='Seconds between polls in daemon mode (default: 30)')
+    parser.add_argument('--state-file',
+                        help=f'File for running statistics state (default: {DEFAULT_STATE_PATH}, '
+                             f'or {DEFAULT_REPLAY_STATE_PATH} with --replay)')
+    parser.add_argument('--all-feeds', action='store_true',
+                        help='Fetch trip updates, vehicle positions and alerts concurrently')
+    parser.add_argument('--datasource', action='append', dest='datasources', metavar='CODESPACE',
+                        help='Fetch feeds per Entur datasource (e.g. VYG); repeatable, implies --all-feeds')
+    parser.add_argument('--decode-workers', type=int, default=1,
+                        help='Processes used to decode large trip-update feeds (default: 1)')
+    parser.add_argument('--archive-dir',
+                        help='Append every processed raw feed to zstd snapshot archives in this directory')
+    parser.add_argument('--replay', metavar='ARCHIVE',
+                        help='Reprocess a trip-updates snapshot archive (e.g. archive/trip_updates) instead of fetching')
+    parser.add_argument('--replay-start', type=datetime.fromisoformat,
+                        help='Only replay snapshots with a feed timestamp at or after this ISO time')
+    parser.add_argument('--replay-end', type=datetime.fromisoformat,
+                        help='Only replay snapshots with a feed timestamp before this ISO time')
+    parser.add_argument('--gtfs-stops', metavar='STOPS_TXT',
+                        help="GTFS stops.txt (e.g. from Entur's static GTFS) mapping the NSR:Quay "
+                             "stop_ids of the feeds to their stations")
+    parser.add_argument('--history-dir',
+                        help='Keep delay history in memory-mapped, date-sharded files in this directory')
+    parser.add_argument('--aggregation-engine', choices=AGGREGATION_ENGINES, default='numpy',
+                        help='Per-poll aggregation engine; pandas is the reference implementation (default: numpy)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Run polls under cProfile and tracemalloc and write profiles to --profile-dir')
+    parser.add_argument('--profile-polls', type=int, default=1,
+                        help='Polls to run with --profile (default: 1)')
+    parser.add_argument('--profile-feed', metavar='FILE',
+                        help='Profile polls of a saved trip-updates feed (e.g. from synthetic_feed.py)')
+    parser.add_argument('--profile-dir', default='profiles',
+                        help='Directory for profile.pstats, profile.txt and allocations.txt (default: profiles)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (daemon mode)')
+    parser.add_argument('--metrics-file',
+                        help='Write Prometheus metrics to this file after the run (e.g. for the '
+                             'node_exporter textfile collector; name it *.prom)')
+    args = parser.parse_args()
+
+    if args.interval <= 0:
+        parser.error('--interval must be a positive number of seconds')
+    if args.decode_workers < 1:
+        parser.error('--decode-workers must be at least 1')
+    if args.profile and (args.daemon or args.replay or args.use_db):
+        parser.error('--profile cannot be combined with --daemon, --replay or --use-db')
+    if args.profile_feed and not args.profile:
+        parser.error('--profile-feed requires --profile')
+    if args.profile_polls < 1:
+        parser.error('--profile-polls must be at least 1')
+    if args.metrics_port is not None and not args.daemon:
+        parser.error('--metrics-port requires --daemon')
+
+    print("Starting Train Delay Data Fetcher...")
 
-    if fetcher.db_conn:
-        fetcher.db_conn.close()
+    if args.gtfs_stops:
+        print(f"Mapped {load_gtfs_quays(args.gtfs_stops)} quays of configured stations from {args.gtfs_stops}")
+
+    state_path = args.state_file or (DEFAULT_REPLAY_STATE_PATH if args.replay else DEFAULT_STATE_PATH)
+    fetcher = TrainDelayFetcher(use_database=args.use_db, state_path=state_path,
+                                all_feeds=args.all_feeds, datasources=args.datasources,
+                                decode_workers=args.decode_workers, archive_dir=args.archive_dir,
+                                history_dir=args.history_dir, aggregation_engine=args.aggregation_engine)
+    metrics_server = (MetricsServer(fetcher.metrics.registry, args.metrics_port)
+                      if args.metrics_port is not None else None)
+    if metrics_server:
+        print(f"Serving metrics on http://{metrics_server.address[0]}:{metrics_server.address[1]}/metrics")
+
+    try:
+        if args.replay:
+            run_replay(fetcher, args.replay,
+                       int(args.replay_start.timestamp()) if args.replay_start else None,
+                       int(args.replay_end.timestamp()) if args.replay_end else None,
+                       args.use_db)
+        elif args.profile:
+            run_profile(fetcher, args.profile_polls, args.profile_dir, args.profile_feed)
+        elif args.daemon:
+            run_daemon(fetcher, args.interval, args.use_db, args.metrics_file)
+        else:
+            run_pipeline(fetcher, args.use_db)
+            print("Data fetcher completed successfully!")
+    finally:
+        if metrics_server:
+            metrics_server.close()
+        if args.metrics_file:
+            fetcher.write_metrics(args.metrics_file)
+        fetcher.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Database Connection Layer
+Shared PostgreSQL connection settings and a small pooled connection manager.
+Gives the fetcher one transaction per poll, transparent reconnects after the
+server drops connections (e.g. a Postgres restart), and per-connection tracking
+of prepared statements.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Set, TypeVar
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+T = TypeVar('T')
+
+# Errors after which a connection can't be trusted and must be replaced
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+def connection_params(database: Optional[str] = None) -> Dict[str, Any]:
+    """Connection settings from the environment (.env)"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': os.getenv('DB_PORT', '5432'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'database': database or os.getenv('DB_NAME', 'train_delays'),
+    }
+
+def connect(database: Optional[str] = None):
+    """Open a single, unpooled connection (for setup scripts)"""
+    return psycopg2.connect(**connection_params(database))
+
+class PoolConnection(psycopg2.extensions.connection):
+    """Connection that remembers session state created on it (prepared statements, temp tables)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session_objects: Set[str] = set()
+
+    def reset_session_objects(self):
+        """Forget session state, e.g. after a rollback discarded temp tables"""
+        if self.session_objects and not self.closed:
+            with self.cursor() as cursor:
+                cursor.execute("DEALLOCATE ALL")
+        self.session_objects.clear()
+
+class DatabasePool:
+    """
+    Lazily created ThreadedConnectionPool with transaction helpers.
+    Broken connections are discarded instead of being returned to the pool, so the
+    next transaction transparently opens a fresh one.
+    """
+
+    def __init__(self, minconn: int = 1, maxconn: int = 4, database: Optional[str] = None):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.params = connection_params(database)
+        self._pool: Optional[ThreadedConnectionPool] = None
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            self._pool = ThreadedConnectionPool(self.minconn, self.maxconn,
+                                                connection_factory=PoolConnection, **self.params)
+        return self._pool
+
+    @contextmanager
+    def connection(self) -> Iterator[PoolConnection]:
+        """Borrow a connection, discarding it if it turns out to be broken"""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+
+        broken = False
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+    @contextmanager
+    def transaction(self) -> Iterator[PoolConnection]:
+        """Run the block in one transaction: commit on success, roll back on error"""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except CONNECTION_ERRORS:
+                raise
+            except Exception:
+                conn.rollback()
+                conn.reset_session_objects()
+                raise
+
+    def run_transaction(self, work: Callable[[PoolConnection], T], retries: int = 1) -> T:
+        """
+        Run work(conn) in a transaction, retrying on a fresh connection if the
+        server dropped the old one. Nothing was committed when a retry happens.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.transaction() as conn:
+                    return work(conn)
+            except CONNECTION_ERRORS as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                print(f"Database connection lost ({e}), reconnecting...")
+
+    def close(self):
+        """Close every pooled connection"""
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
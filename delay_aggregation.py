@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+NumPy Aggregation Engine
+Computes one poll's partial aggregates (count, sum, sum of squares, min, max and
+the sketch bin/histogram bucket counts) for every running table straight from a
+DelayBatch's integer codes. Per-record date, hour and bin columns are derived
+once; each table then combines its key columns into one int64 group key and
+reduces with np.bincount and ufunc.reduceat. It produces the same aggregates as
+the pandas groupby path in TrainDelayFetcher._calculate_*, which is kept as the
+reference implementation (see test_aggregation_engine.py).
+"""
+
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from delay_batch import DelayBatch
+from delay_sketch import HISTOGRAM_BUCKETS, histogram_buckets, sketch_bins
+from running_stats import KEY_COLUMNS, PAIR_KINDS, RunningAggregator
+
+SECONDS_PER_DAY = 86400
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+class PartialAggregates(NamedTuple):
+    """One poll's aggregates of one running table, one entry per key"""
+    keys: List[Tuple]
+    count: np.ndarray
+    total: np.ndarray
+    sum_sq: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+    relevant: Optional[np.ndarray]  # per key, for tables keyed by station pair
+    # Delay counts per (key, sketch bin, histogram bucket)
+    distribution_keys: List[Tuple]
+    sketch_bins: np.ndarray
+    histogram_buckets: np.ndarray
+    distribution_counts: np.ndarray
+
+    def merge_into(self, aggregator: RunningAggregator, kind: str, retract: bool = False):
+        """Merge into (or with retract=True take back from) the running table `kind`, distributions included"""
+        aggregator.merge_rows(
+            kind, self.keys,
+            zip(self.count.tolist(), self.total.tolist(), self.sum_sq.tolist(),
+                self.minimum.tolist(), self.maximum.tolist()),
+            self.relevant.tolist() if self.relevant is not None else None, retract)
+        aggregator.merge_distribution_rows(
+            kind, self.distribution_keys,
+            zip(self.sketch_bins.tolist(), self.histogram_buckets.tolist(), self.distribution_counts.tolist()),
+            retract)
+
+class _KeyColumn(NamedTuple):
+    codes: np.ndarray  # int64 per record
+    values: List  # key value of every code
+
+def _key_columns(delays: DelayBatch) -> Dict[str, _KeyColumn]:
+    """Integer codes of every possible key column, computed once per batch"""
+    local_seconds = delays.local_seconds()
+    days, day_codes = np.unique(local_seconds // SECONDS_PER_DAY, return_inverse=True)
+    stops = _KeyColumn(delays.from_codes.astype(np.int64), delays.stop_names)
+    return {
+        'date': _KeyColumn(day_codes.astype(np.int64),
+                           [date.fromordinal(EPOCH_ORDINAL + day) for day in days.tolist()]),
+        'hour': _KeyColumn((local_seconds // 3600) % 24, list(range(24))),
+        'from_stop': stops,
+        'to_stop': _KeyColumn(delays.to_codes.astype(np.int64), delays.stop_names),
+        'stop': stops,  # dwell rows are (stop, stop)
+        'route_id': _KeyColumn(delays.route_codes.astype(np.int64), delays.route_names),
+    }
+
+def _group(columns: Sequence[_KeyColumn]) -> Tuple[np.ndarray, List[Tuple]]:
+    """
+    Group id of every record and the key of every group. Key columns are combined
+    into one mixed-radix int64, so groups sort like the key tuples' codes.
+    """
+    combined = np.zeros(len(columns[0].codes), dtype=np.int64)
+    for column in columns:
+        combined = combined * len(column.values) + column.codes
+    uniques, group_ids = np.unique(combined, return_inverse=True)
+
+    key_codes = []
+    for column in reversed(columns):
+        uniques, codes = np.divmod(uniques, len(column.values))
+        key_codes.append([column.values[code] for code in codes.tolist()])
+    return group_ids, list(zip(*reversed(key_codes)))
+
+def _aggregate(group_ids: np.ndarray, keys: List[Tuple], minutes: np.ndarray, bins: np.ndarray,
+               buckets: np.ndarray, relevant: Optional[np.ndarray]) -> PartialAggregates:
+    n_groups = len(keys)
+    count = np.bincount(group_ids, minlength=n_groups)
+    # Records sorted by group, so each group is one contiguous run for reduceat
+    order = np.argsort(group_ids, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    sorted_minutes = minutes[order]
+
+    bin_values, bin_codes = np.unique(bins, return_inverse=True)
+    cells, cell_counts = np.unique((group_ids * len(bin_values) + bin_codes) * HISTOGRAM_BUCKETS + buckets,
+                                   return_counts=True)
+    cell_groups, cell_buckets = np.divmod(cells, HISTOGRAM_BUCKETS)
+    cell_groups, cell_bins = np.divmod(cell_groups, len(bin_values))
+
+    return PartialAggregates(
+        keys, count,
+        np.bincount(group_ids, weights=minutes, minlength=n_groups),
+        np.bincount(group_ids, weights=minutes * minutes, minlength=n_groups),
+        np.minimum.reduceat(sorted_minutes, starts),
+        np.maximum.reduceat(sorted_minutes, starts),
+        relevant[order[starts]] if relevant is not None else None,
+        [keys[group] for group in cell_groups.tolist()],
+        bin_values[cell_bins], cell_buckets, cell_counts)
+
+def aggregate_delays(delays: DelayBatch, kinds: Sequence[str],
+                     relevant: Optional[np.ndarray] = None) -> Dict[str, PartialAggregates]:
+    """
+    Partial aggregates of a batch for each running table in kinds.
+    relevant (per record) is carried along for the tables keyed by station pair.
+    """
+    if not len(delays):
+        return {}
+
+    columns = _key_columns(delays)
+    minutes = delays.delay_seconds / 60
+    bins = sketch_bins(minutes)
+    buckets = histogram_buckets(minutes)
+
+    partials = {}
+    for kind in kinds:
+        group_ids, keys = _group([columns[name] for name in KEY_COLUMNS[kind]])
+        partials[kind] = _aggregate(group_ids, keys, minutes, bins, buckets,
+                                    relevant if kind in PAIR_KINDS else None)
+    return partials
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Columnar Delay Batch
+Typed, column-oriented container for the stop-pair delays of one poll.
+Carries data from fetch_realtime_data to process_data and the database writers
+without materializing a dict per record or re-parsing timestamp strings.
+StopTimeBatch holds the stop-level arrival/departure delays a feed was decoded
+into; stop-pair, segment and dwell delays are derived from it with array diffs.
+"""
+
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+import numpy as np
+import pandas as pd
+from zoneinfo import ZoneInfo
+
+# Timestamps are stored as UTC epoch seconds and shown in Norwegian local time
+LOCAL_TIMEZONE = "Europe/Oslo"
+
+# Arrival/departure delay not reported in the stop_time_update
+MISSING_DELAY = np.iinfo(np.int32).min
+
+class StopPairDelay(NamedTuple):
+    """Compact delay record for one consecutive stop pair of a trip"""
+    from_stop: str
+    to_stop: str
+    route_id: str
+    delay_seconds: int
+    timestamp: int  # epoch seconds
+    trip_id: str = ""
+    start_date: int = 0  # YYYYMMDD, 0 if unknown
+    stop_sequence: int = 0  # of from_stop
+
+class DelayBatch:
+    """
+    Column arrays for a batch of stop-pair delays.
+    Stops, routes and trips are dictionary-encoded: from_codes/to_codes index into
+    stop_names, route_codes into route_names and trip_codes into trip_names.
+    """
+
+    __slots__ = ('stop_names', 'route_names', 'trip_names', 'from_codes', 'to_codes',
+                 'route_codes', 'delay_seconds', 'timestamps', 'trip_codes',
+                 'start_dates', 'stop_sequences')
+
+    def __init__(self, stop_names: List[str], route_names: List[str], trip_names: List[str],
+                 from_codes: np.ndarray, to_codes: np.ndarray, route_codes: np.ndarray,
+                 delay_seconds: np.ndarray, timestamps: np.ndarray, trip_codes: np.ndarray,
+                 start_dates: np.ndarray, stop_sequences: np.ndarray):
+        self.stop_names = stop_names
+        self.route_names = route_names
+        self.trip_names = trip_names
+        self.from_codes = from_codes          # int32
+        self.to_codes = to_codes              # int32
+        self.route_codes = route_codes        # int32
+        self.delay_seconds = delay_seconds    # int32
+        self.timestamps = timestamps          # int64 epoch seconds
+        self.trip_codes = trip_codes          # int32
+        self.start_dates = start_dates        # int32 YYYYMMDD
+        self.stop_sequences = stop_sequences  # int32
+
+    @classmethod
+    def from_records(cls, records: Iterable[StopPairDelay]) -> 'DelayBatch':
+        """Build a batch from a stream of records in a single pass"""
+        stop_index: Dict[str, int] = {}
+        route_index: Dict[str, int] = {}
+        trip_index: Dict[str, int] = {}
+        from_codes = array('i')
+        to_codes = array('i')
+        route_codes = array('i')
+        delay_seconds = array('i')
+        timestamps = array('q')
+        trip_codes = array('i')
+        start_dates = array('i')
+        stop_sequences = array('i')
+
+        for from_stop, to_stop, route_id, delay, timestamp, trip_id, start_date, stop_sequence in records:
+            from_codes.append(stop_index.setdefault(from_stop, len(stop_index)))
+            to_codes.append(stop_index.setdefault(to_stop, len(stop_index)))
+            route_codes.append(route_index.setdefault(route_id, len(route_index)))
+            delay_seconds.append(delay)
+            timestamps.append(timestamp)
+            trip_codes.append(trip_index.setdefault(trip_id, len(trip_index)))
+            start_dates.append(start_date)
+            stop_sequences.append(stop_sequence)
+
+        return cls(
+            list(stop_index), list(route_index), list(trip_index),
+            np.frombuffer(from_codes, dtype=np.int32),
+            np.frombuffer(to_codes, dtype=np.int32),
+            np.frombuffer(route_codes, dtype=np.int32),
+            np.frombuffer(delay_seconds, dtype=np.int32),
+            np.frombuffer(timestamps, dtype=np.int64),
+            np.frombuffer(trip_codes, dtype=np.int32),
+            np.frombuffer(start_dates, dtype=np.int32),
+            np.frombuffer(stop_sequences, dtype=np.int32),
+        )
+
+    @classmethod
+    def empty(cls) -> 'DelayBatch':
+        """Batch with no records"""
+        return cls.from_records(())
+
+    @classmethod
+    def concat(cls, batches: Iterable['DelayBatch']) -> 'DelayBatch':
+        """
+        Join batches decoded separately (e.g. one per feed) into one.
+        Each batch's dictionary codes are remapped onto merged dictionaries with
+        a single fancy-indexing pass per column.
+        """
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        def merge_names(name_lists: List[List[str]]) -> Tuple[List[str], List[np.ndarray]]:
+            index: Dict[str, int] = {}
+            remaps = [np.array([index.setdefault(name, len(index)) for name in names], dtype=np.int32)
+                      for names in name_lists]
+            return list(index), remaps
+
+        stop_names, stop_maps = merge_names([batch.stop_names for batch in batches])
+        route_names, route_maps = merge_names([batch.route_names for batch in batches])
+        trip_names, trip_maps = merge_names([batch.trip_names for batch in batches])
+
+        return cls(
+            stop_names, route_names, trip_names,
+            np.concatenate([remap[batch.from_codes] for batch, remap in zip(batches, stop_maps)]),
+            np.concatenate([remap[batch.to_codes] for batch, remap in zip(batches, stop_maps)]),
+            np.concatenate([remap[batch.route_codes] for batch, remap in zip(batches, route_maps)]),
+            np.concatenate([batch.delay_seconds for batch in batches]),
+            np.concatenate([batch.timestamps for batch in batches]),
+            np.concatenate([remap[batch.trip_codes] for batch, remap in zip(batches, trip_maps)]),
+            np.concatenate([batch.start_dates for batch in batches]),
+            np.concatenate([batch.stop_sequences for batch in batches]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.delay_seconds)
+
+    def take(self, selector: np.ndarray) -> 'DelayBatch':
+        """Subset of the batch by boolean mask or index array (dictionaries are shared)"""
+        return DelayBatch(self.stop_names, self.route_names, self.trip_names,
+                          self.from_codes[selector], self.to_codes[selector],
+                          self.route_codes[selector], self.delay_seconds[selector],
+                          self.timestamps[selector], self.trip_codes[selector],
+                          self.start_dates[selector], self.stop_sequences[selector])
+
+    def delayed(self) -> 'DelayBatch':
+        """Rows with a nonzero delay (on-time observations are only kept for deduplication)"""
+        return self.take(self.delay_seconds != 0)
+
+    def iter_records(self) -> Iterator[StopPairDelay]:
+        """Iterate records row by row (for writers that need Python values)"""
+        stops = self.stop_names
+        routes = self.route_names
+        trips = self.trip_names
+        for from_code, to_code, route_code, delay, timestamp, trip_code, start_date, stop_sequence in zip(
+                self.from_codes.tolist(), self.to_codes.tolist(), self.route_codes.tolist(),
+                self.delay_seconds.tolist(), self.timestamps.tolist(), self.trip_codes.tolist(),
+                self.start_dates.tolist(), self.stop_sequences.tolist()):
+            yield StopPairDelay(stops[from_code], stops[to_code], routes[route_code], delay, timestamp,
+                                trips[trip_code], start_date, stop_sequence)
+
+    def local_times(self) -> pd.DatetimeIndex:
+        """Timestamps converted once to naive Norwegian local time"""
+        return (pd.to_datetime(self.timestamps, unit='s', utc=True)
+                .tz_convert(LOCAL_TIMEZONE)
+                .tz_localize(None))
+
+    def local_seconds(self) -> np.ndarray:
+        """
+        Epoch seconds shifted to Norwegian wall-clock time, without pandas.
+        The UTC offset only changes on whole UTC hours, so it is looked up once per
+        distinct hour of the batch rather than per record.
+        """
+        hours, inverse = np.unique(self.timestamps // 3600, return_inverse=True)
+        zone = ZoneInfo(LOCAL_TIMEZONE)
+        offsets = np.array([datetime.fromtimestamp(hour * 3600, zone).utcoffset().total_seconds()
+                            for hour in hours.tolist()], dtype=np.int64)
+        return self.timestamps + offsets[inverse]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        View the batch as a DataFrame with categorical stop/route columns.
+        date and hour are derived from the epoch column here, once, for all aggregations.
+        """
+        stop_categories = pd.Index(self.stop_names, dtype=object)
+        route_categories = pd.Index(self.route_names, dtype=object)
+        local_times = self.local_times()
+
+        return pd.DataFrame({
+            'from_stop': pd.Categorical.from_codes(self.from_codes, categories=stop_categories),
+            'to_stop': pd.Categorical.from_codes(self.to_codes, categories=stop_categories),
+            'route_id': pd.Categorical.from_codes(self.route_codes, categories=route_categories),
+            'delay_seconds': self.delay_seconds,
+            'timestamp': local_times,
+            'date': local_times.date,
+            'hour': local_times.hour.astype(np.int8),
+        }, copy=False)
+
+class StopTime(NamedTuple):
+    """Arrival and departure delay reported for one stop of a trip"""
+    stop_id: str
+    route_id: str
+    trip_id: str
+    start_date: int  # YYYYMMDD, 0 if unknown
+    stop_sequence: int
+    position: int  # index of the stop_time_update within its trip, 0 starts a trip
+    arrival_delay: int  # seconds, MISSING_DELAY if not reported
+    departure_delay: int  # seconds, MISSING_DELAY if not reported
+    timestamp: int  # epoch seconds
+
+class StopTimeBatch:
+    """
+    Column arrays for the stop_time_updates of a batch of trips, in feed order.
+    Each trip's stops are contiguous and positions restarts at 0 for every trip, so
+    per-trip calculations are diffs between neighbouring rows masked where a new
+    trip starts, with no grouping or sorting pass.
+    """
+
+    __slots__ = ('stop_names', 'route_names', 'trip_names', 'stop_codes', 'route_codes',
+                 'trip_codes', 'start_dates', 'stop_sequences', 'positions',
+                 'arrival_delays', 'departure_delays', 'timestamps')
+
+    def __init__(self, stop_names: List[str], route_names: List[str], trip_names: List[str],
+                 stop_codes: np.ndarray, route_codes: np.ndarray, trip_codes: np.ndarray,
+                 start_dates: np.ndarray, stop_sequences: np.ndarray, positions: np.ndarray,
+                 arrival_delays: np.ndarray, departure_delays: np.ndarray, timestamps: np.ndarray):
+        self.stop_names = stop_names
+        self.route_names = route_names
+        self.trip_names = trip_names
+        self.stop_codes = stop_codes              # int32
+        self.route_codes = route_codes            # int32
+        self.trip_codes = trip_codes              # int32
+        self.start_dates = start_dates            # int32 YYYYMMDD
+        self.stop_sequences = stop_sequences      # int32
+        self.positions = positions                # int32
+        self.arrival_delays = arrival_delays      # int32 seconds or MISSING_DELAY
+        self.departure_delays = departure_delays  # int32 seconds or MISSING_DELAY
+        self.timestamps = timestamps              # int64 epoch seconds
+
+    @classmethod
+    def from_records(cls, records: Iterable[StopTime]) -> 'StopTimeBatch':
+        """Build a batch from a stream of records (trip by trip) in a single pass"""
+        stop_index: Dict[str, int] = {}
+        route_index: Dict[str, int] = {}
+        trip_index: Dict[str, int] = {}
+        columns = [array('i') for _ in range(8)]
+        timestamps = array('q')
+        (stop_codes, route_codes, trip_codes, start_dates, stop_sequences, positions,
+         arrival_delays, departure_delays) = columns
+
+        for (stop_id, route_id, trip_id, start_date, stop_sequence, position,
+             arrival_delay, departure_delay, timestamp) in records:
+            stop_codes.append(stop_index.setdefault(stop_id, len(stop_index)))
+            route_codes.append(route_index.setdefault(route_id, len(route_index)))
+            trip_codes.append(trip_index.setdefault(trip_id, len(trip_index)))
+            start_dates.append(start_date)
+            stop_sequences.append(stop_sequence)
+            positions.append(position)
+            arrival_delays.append(arrival_delay)
+            departure_delays.append(departure_delay)
+            timestamps.append(timestamp)
+
+        return cls(list(stop_index), list(route_index), list(trip_index),
+                   *(np.frombuffer(column, dtype=np.int32) for column in columns),
+                   np.frombuffer(timestamps, dtype=np.int64))
+
+    @classmethod
+    def empty(cls) -> 'StopTimeBatch':
+        """Batch with no records"""
+        return cls.from_records(())
+
+    @classmethod
+    def concat(cls, batches: Iterable['StopTimeBatch']) -> 'StopTimeBatch':
+        """Join batches decoded separately (whole trips each), remapping dictionary codes"""
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        remapped = {}
+        for names, codes in (('stop_names', 'stop_codes'), ('route_names', 'route_codes'),
+                             ('trip_names', 'trip_codes')):
+            index: Dict[str, int] = {}
+            parts = []
+            for batch in batches:
+                remap = np.array([index.setdefault(name, len(index)) for name in getattr(batch, names)],
+                                 dtype=np.int32)
+                parts.append(remap[getattr(batch, codes)])
+            remapped[names] = list(index)
+            remapped[codes] = np.concatenate(parts)
+
+        return cls(
+            remapped['stop_names'], remapped['route_names'], remapped['trip_names'],
+            remapped['stop_codes'], remapped['route_codes'], remapped['trip_codes'],
+            *(np.concatenate([getattr(batch, column) for batch in batches])
+              for column in ('start_dates', 'stop_sequences', 'positions', 'arrival_delays',
+                             'departure_delays', 'timestamps')))
+
+    def __len__(self) -> int:
+        return len(self.stop_codes)
+
+    def rename_stops(self, names: List[str]) -> 'StopTimeBatch':
+        """
+        Batch with stop_names[i] renamed to names[i]. Stops renamed to the same name
+        share one code, so they aggregate as one stop.
+        """
+        index: Dict[str, int] = {}
+        remap = np.array([index.setdefault(name, len(index)) for name in names], dtype=np.int32)
+        return StopTimeBatch(list(index), self.route_names, self.trip_names, remap[self.stop_codes],
+                             self.route_codes, self.trip_codes, self.start_dates, self.stop_sequences,
+                             self.positions, self.arrival_delays, self.departure_delays, self.timestamps)
+
+    def _next_in_trip(self) -> np.ndarray:
+        """Row indices i whose row i + 1 is the next stop of the same trip"""
+        return np.flatnonzero(self.positions[1:] != 0)
+
+    def _pairs(self, rows: np.ndarray, next_rows: np.ndarray, delays: np.ndarray) -> DelayBatch:
+        """DelayBatch of (rows -> next_rows) stop pairs, keyed by the trip stop of rows"""
+        return DelayBatch(self.stop_names, self.route_names, self.trip_names,
+                          self.stop_codes[rows], self.stop_codes[next_rows], self.route_codes[rows],
+                          delays.astype(np.int32), self.timestamps[rows], self.trip_codes[rows],
+                          self.start_dates[rows], self.stop_sequences[rows])
+
+    def stop_pair_delays(self) -> DelayBatch:
+        """
+        Absolute delay at the departure stop of every consecutive stop pair (the
+        departure delay, else the arrival delay), for pairs whose departure stop
+        reports a delay. On-time (zero) delays are included, so a stop that recovers
+        to on time supersedes its earlier delay.
+        """
+        departures, arrivals = self.departure_delays, self.arrival_delays
+        delays = np.where(departures != MISSING_DELAY, departures, arrivals)
+        rows = self._next_in_trip()
+        rows = rows[delays[rows] != MISSING_DELAY]
+        return self._pairs(rows, rows + 1, delays[rows])
+
+    def filled_delays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (arrival, departure) delay of every stop with GTFS-RT defaults applied: a missing
+        arrival or departure delay equals the other one, and a stop with neither takes
+        the departure delay of the last earlier stop of its trip that had one.
+        Stops with no delay information at or before them stay MISSING_DELAY.
+        """
+        arrivals = np.where(self.arrival_delays != MISSING_DELAY, self.arrival_delays, self.departure_delays)
+        departures = np.where(self.departure_delays != MISSING_DELAY, self.departure_delays, self.arrival_delays)
+
+        index = np.arange(len(self))
+        known = departures != MISSING_DELAY
+        last_known = np.maximum.accumulate(np.where(known, index, -1))
+        trip_start = np.maximum.accumulate(np.where(self.positions == 0, index, 0))
+        source = np.where(known | (last_known < trip_start), index, last_known)
+        return np.where(known, arrivals, departures[source]), departures[source]
+
+    def segment_delays(self) -> DelayBatch:
+        """
+        Delay gained (positive) or recovered (negative) while running between each
+        pair of consecutive stops: arrival delay at the next stop minus departure
+        delay at this one. Pairs without delay information at either end are skipped.
+        """
+        arrivals, departures = self.filled_delays()
+        rows = self._next_in_trip()
+        rows = rows[(departures[rows] != MISSING_DELAY) & (arrivals[rows + 1] != MISSING_DELAY)]
+        return self._pairs(rows, rows + 1, arrivals[rows + 1] - departures[rows])
+
+    def dwell_delays(self) -> DelayBatch:
+        """
+        Delay gained while standing at a stop (departure delay minus arrival delay),
+        for stops reporting both. Rows are (stop, stop) pairs so they share the
+        DelayBatch layout and deduplication.
+        """
+        rows = np.flatnonzero((self.arrival_delays != MISSING_DELAY) & (self.departure_delays != MISSING_DELAY))
+        return self._pairs(rows, rows, self.departure_delays[rows].astype(np.int64) - self.arrival_delays[rows])
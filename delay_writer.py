@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Bulk Delay Ingestion
+Streams station_pair_delays rows into PostgreSQL with COPY ... FROM STDIN through
+an in-memory CSV buffer, and upserts aggregate rows via a COPY-loaded staging
+table merged with INSERT ... ON CONFLICT. Far cheaper than row-wise INSERTs
+once every stop pair is stored at 30s polling or history is backfilled.
+"""
+
+import csv
+import io
+import time
+from typing import Iterable, List, Sequence
+import numpy as np
+from psycopg2 import sql
+from delay_batch import DelayBatch
+
+RAW_DELAY_COLUMNS = ['trip_id', 'route_id', 'from_station', 'to_station',
+                     'scheduled_departure', 'actual_departure', 'delay_minutes', 'recorded_at']
+
+class DelayCopyWriter:
+    """
+    Buffers raw delay rows as CSV and COPYs them into station_pair_delays.
+    The buffer is flushed automatically once it holds max_rows rows or max_bytes bytes;
+    call flush() at the end of a poll. Committing is left to the caller.
+    """
+
+    def __init__(self, max_rows: int = 50_000, max_bytes: int = 8 * 1024 * 1024):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._buffered_rows = 0
+        # Lifetime throughput counters
+        self.rows_written = 0
+        self.copy_seconds = 0.0
+
+    def add(self, conn, batch: DelayBatch):
+        """Buffer a batch of delays, flushing through conn when a threshold is crossed"""
+        if len(batch) == 0:
+            return
+
+        stops = batch.stop_names
+        routes = batch.route_names
+        trips = batch.trip_names
+        # delay_minutes is an INTEGER column; round once for the whole batch
+        delay_minutes = np.rint(batch.delay_seconds / 60).astype(np.int64)
+        recorded_at = batch.local_times().strftime('%Y-%m-%d %H:%M:%S')
+
+        self._writer.writerows(zip(
+            (trips[code] for code in batch.trip_codes.tolist()),
+            (routes[code] for code in batch.route_codes.tolist()),
+            (stops[code] for code in batch.from_codes.tolist()),
+            (stops[code] for code in batch.to_codes.tolist()),
+            ('' for _ in range(len(batch))),  # scheduled_departure (not available)
+            ('' for _ in range(len(batch))),  # actual_departure (not available)
+            delay_minutes.tolist(),
+            recorded_at,
+        ))
+        self._buffered_rows += len(batch)
+
+        if self._buffered_rows >= self.max_rows or self._buffer.tell() >= self.max_bytes:
+            self.flush(conn)
+
+    def flush(self, conn) -> int:
+        """COPY buffered rows into station_pair_delays, returning the number written"""
+        rows = self._buffered_rows
+        if not rows:
+            return 0
+
+        self._buffer.seek(0)
+        started = time.perf_counter()
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                sql.SQL("COPY station_pair_delays ({}) FROM STDIN WITH (FORMAT csv)").format(
+                    sql.SQL(', ').join(map(sql.Identifier, RAW_DELAY_COLUMNS))),
+                self._buffer)
+        elapsed = time.perf_counter() - started
+
+        self.rows_written += rows
+        self.copy_seconds += elapsed
+        print(f"Copied {rows} raw delay records in {elapsed:.3f}s "
+              f"({rows / elapsed if elapsed else float('inf'):.0f} rows/s).")
+
+        self.discard()
+        return rows
+
+    def discard(self):
+        """Drop buffered rows (e.g. after the transaction they belonged to failed)"""
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffered_rows = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        """Average COPY throughput over the writer's lifetime"""
+        return self.rows_written / self.copy_seconds if self.copy_seconds else 0.0
+
+def copy_upsert(conn, table: str, columns: Sequence[str], rows: Iterable[Sequence],
+                conflict_columns: Sequence[str]) -> int:
+    """
+    Upsert rows into table by COPYing them into a temporary staging table and
+    merging with a single INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+    On pooled connections the staging table and the merge statement are created
+    and PREPAREd once per session and reused on later polls.
+    Returns the number of rows staged. Committing is left to the caller.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+
+    staging = sql.Identifier(f"staging_{table}")
+    statement = sql.Identifier(f"merge_{table}")
+    target = sql.Identifier(table)
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    update_columns: List[str] = [column for column in columns if column not in conflict_columns]
+    merge = sql.SQL(
+        "INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging} "
+        "ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+    ).format(
+        target=target,
+        columns=column_list,
+        staging=staging,
+        conflict=sql.SQL(', ').join(map(sql.Identifier, conflict_columns)),
+        updates=sql.SQL(', ').join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column))
+            for column in update_columns),
+    )
+    # Plain connections have no session tracking: stage in a throwaway table
+    session_objects = getattr(conn, 'session_objects', None)
+
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        if session_objects is None:
+            cursor.execute(sql.SQL(
+                "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+            ).format(staging, target))
+        else:
+            if f"staging_{table}" not in session_objects:
+                cursor.execute(sql.SQL(
+                    "CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS)"
+                ).format(staging, target))
+                cursor.execute(sql.SQL("PREPARE {} AS ").format(statement) + merge)
+                session_objects.update((f"staging_{table}", f"merge_{table}"))
+            # A rollback resets session_objects but keeps a staging table created in an
+            # earlier transaction, along with the rows that transaction committed
+            cursor.execute(sql.SQL("TRUNCATE {}").format(staging))
+
+        cursor.copy_expert(
+            sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(staging, column_list),
+            buffer)
+
+        if session_objects is None:
+            cursor.execute(merge)
+        else:
+            cursor.execute(sql.SQL("EXECUTE {}").format(statement))
+    elapsed = time.perf_counter() - started
+
+    print(f"Upserted {count} rows into {table} in {elapsed:.3f}s "
+          f"({count / elapsed if elapsed else float('inf'):.0f} rows/s).")
+    return count
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+GTFS-RT Wire Format Helpers
+Minimal protobuf wire-format scanning for GTFS-RT FeedMessage payloads.
+Lets the fetcher look at parts of a feed (e.g. the FeedHeader) without paying
+for a full ParseFromString of the multi-megabyte national feed.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+from google.transit import gtfs_realtime_pb2
+
+# FeedMessage field numbers (gtfs-realtime.proto)
+FEED_HEADER_FIELD = 1
+FEED_ENTITY_FIELD = 2
+
+# Protobuf wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+def read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    """Decode a base-128 varint at pos, returning (value, new_pos)"""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise ValueError("Malformed varint in protobuf payload")
+
+def iter_top_level_spans(buf: bytes) -> Iterator[Tuple[int, int, int, int, int]]:
+    """
+    Walk the top-level fields of a serialized message.
+    Yields (field_number, wire_type, field_start, value_start, value_end) without
+    decoding values; buf[field_start:value_end] is the field including its key.
+    """
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        field_start = pos
+        key, pos = read_varint(buf, pos)
+        field_number, wire_type = key >> 3, key & 0x07
+
+        if wire_type == WIRE_VARINT:
+            start = pos
+            _, pos = read_varint(buf, pos)
+        elif wire_type == WIRE_FIXED64:
+            start, pos = pos, pos + 8
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, start = read_varint(buf, pos)
+            pos = start + length
+        elif wire_type == WIRE_FIXED32:
+            start, pos = pos, pos + 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type} in protobuf payload")
+
+        if pos > end:
+            raise ValueError("Truncated protobuf payload")
+        yield field_number, wire_type, field_start, start, pos
+
+def iter_top_level_fields(buf: bytes) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Walk the top-level fields of a serialized message.
+    Yields (field_number, wire_type, value_start, value_end) without decoding values.
+    """
+    for field_number, wire_type, _, start, end in iter_top_level_spans(buf):
+        yield field_number, wire_type, start, end
+
+def read_feed_header(content: bytes) -> Optional[gtfs_realtime_pb2.FeedHeader]:
+    """Parse only the FeedHeader of a serialized FeedMessage (None if absent)"""
+    for field_number, wire_type, start, end in iter_top_level_fields(content):
+        if field_number == FEED_HEADER_FIELD and wire_type == WIRE_LENGTH_DELIMITED:
+            header = gtfs_realtime_pb2.FeedHeader()
+            header.ParseFromString(content[start:end])
+            return header
+    return None
+
+def split_feed(content: bytes, parts: int) -> List[bytes]:
+    """
+    Split a serialized FeedMessage into up to `parts` smaller FeedMessages of
+    contiguous entities with roughly equal byte sizes. Each part is a valid feed:
+    the (required) FeedHeader bytes are repeated in front of its entities, and
+    entity bytes are copied as-is, never decoded.
+    """
+    header = b''
+    entities: List[Tuple[int, int]] = []
+    for field_number, _, field_start, _, end in iter_top_level_spans(content):
+        if field_number == FEED_ENTITY_FIELD:
+            entities.append((field_start, end))
+        elif field_number == FEED_HEADER_FIELD:
+            header = content[field_start:end]
+
+    if parts <= 1 or len(entities) <= 1:
+        return [content]
+
+    view = memoryview(content)
+    target = sum(end - start for start, end in entities) / parts
+    chunks: List[bytes] = []
+    current: List[memoryview] = []
+    size = 0
+    for start, end in entities:
+        current.append(view[start:end])
+        size += end - start
+        if size >= target and len(chunks) < parts - 1:
+            chunks.append(b''.join([header, *current]))
+            current, size = [], 0
+    if current:
+        chunks.append(b''.join([header, *current]))
+    return chunks
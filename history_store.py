@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Local Delay History Store
+Embedded, append-only history of stop-pair delays for machines without PostgreSQL.
+Records are fixed-width (timestamp, route, from stop, to stop, delay) rows in one
+file per local day, read back through np.memmap. A small per-shard min/max
+timestamp index lets time-range queries skip whole shards, so "pair X over the
+last 30 days" scans only the shards involved and returns NumPy arrays directly.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from atomic_write import write_atomic
+from delay_batch import DelayBatch, LOCAL_TIMEZONE
+
+# One history row; stops and routes are ids into the store's dictionary
+RECORD_DTYPE = np.dtype([('timestamp', '<i8'), ('route', '<u4'), ('from_stop', '<u4'),
+                         ('to_stop', '<u4'), ('delay_seconds', '<i4')])
+
+SHARD_SUFFIX = '.bin'
+STATE_VERSION = 1
+
+class HistoryStore:
+    """
+    Date-sharded history of delays under `directory`:
+    YYYYMMDD.bin shards of RECORD_DTYPE rows, dictionary.json (stop and route names,
+    append-only so ids never change) and index.json (per-shard min/max timestamp, rows).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.stop_names: List[str] = []
+        self.route_names: List[str] = []
+        self._stop_ids: Dict[str, int] = {}
+        self._route_ids: Dict[str, int] = {}
+        # shard day -> [min timestamp, max timestamp, rows]
+        self.index: Dict[str, List[int]] = {}
+        # shard day -> (rows mapped, memmap), reopened once the shard has grown
+        self._maps: Dict[str, Tuple[int, np.memmap]] = {}
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        """Load the dictionary and index, repairing index entries for shards that moved on"""
+        if not os.path.isdir(self.directory):
+            return
+        try:
+            if os.path.exists(self._path('dictionary.json')):
+                with open(self._path('dictionary.json')) as f:
+                    dictionary = json.load(f)
+                self.stop_names = dictionary['stops']
+                self.route_names = dictionary['routes']
+                self._stop_ids = {name: i for i, name in enumerate(self.stop_names)}
+                self._route_ids = {name: i for i, name in enumerate(self.route_names)}
+            if os.path.exists(self._path('index.json')):
+                with open(self._path('index.json')) as f:
+                    state = json.load(f)
+                if state.get('version') == STATE_VERSION:
+                    self.index = state['shards']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Failed to load history store metadata from {self.directory}: {e}")
+
+        # Shards written after the index was last saved (e.g. a crash mid-append)
+        for name in os.listdir(self.directory):
+            if not name.endswith(SHARD_SUFFIX):
+                continue
+            day = name[:-len(SHARD_SUFFIX)]
+            rows = os.path.getsize(self._path(name)) // RECORD_DTYPE.itemsize
+            if self.index.get(day, [0, 0, -1])[2] != rows:
+                timestamps = self._shard(day)['timestamp']
+                self.index[day] = ([int(timestamps.min()), int(timestamps.max()), rows]
+                                   if rows else [0, 0, 0])
+
+    def _save_json(self, name: str, data: Any):
+        """Write metadata atomically (write to a temp file, then rename)"""
+        write_atomic(self._path(name), json.dumps(data, separators=(',', ':')).encode(), durable=True)
+
+    def _shard(self, day: str) -> np.ndarray:
+        """Memory-mapped, read-only view of a shard's complete rows"""
+        path = self._path(f"{day}{SHARD_SUFFIX}")
+        rows = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+        if not rows:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        cached = self._maps.get(day)
+        if cached is None or cached[0] != rows:
+            cached = (rows, np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(rows,)))
+            self._maps[day] = cached
+        return cached[1]
+
+    @staticmethod
+    def _encode(ids: Dict[str, int], new_names: List[str]) -> np.ndarray:
+        """Map a batch's dictionary onto store ids, adding names never seen before"""
+        return np.array([ids.setdefault(name, len(ids)) for name in new_names], dtype=np.uint32)
+
+    def append(self, batch: DelayBatch) -> int:
+        """Append a batch of delays to the shards of their local days; returns rows written"""
+        if len(batch) == 0:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+
+        stop_map = self._encode(self._stop_ids, batch.stop_names)
+        route_map = self._encode(self._route_ids, batch.route_names)
+        self.stop_names = list(self._stop_ids)
+        self.route_names = list(self._route_ids)
+        # Names first: every id written to a shard must already be resolvable
+        self._save_json('dictionary.json', {'stops': self.stop_names, 'routes': self.route_names})
+
+        records = np.empty(len(batch), dtype=RECORD_DTYPE)
+        records['timestamp'] = batch.timestamps
+        records['route'] = route_map[batch.route_codes]
+        records['from_stop'] = stop_map[batch.from_codes]
+        records['to_stop'] = stop_map[batch.to_codes]
+        records['delay_seconds'] = batch.delay_seconds
+
+        days = np.asarray(batch.local_times().strftime('%Y%m%d'))
+        for day in np.unique(days).tolist():
+            rows = records[days == day]
+            path = self._path(f"{day}{SHARD_SUFFIX}")
+            with open(path, 'ab') as f:
+                # Drop a torn trailing row left by an interrupted append
+                f.truncate(f.tell() - f.tell() % RECORD_DTYPE.itemsize)
+                f.write(rows.tobytes())
+
+            minimum, maximum = int(rows['timestamp'].min()), int(rows['timestamp'].max())
+            entry = self.index.get(day)
+            if entry is None or not entry[2]:
+                self.index[day] = [minimum, maximum, len(rows)]
+            else:
+                self.index[day] = [min(entry[0], minimum), max(entry[1], maximum), entry[2] + len(rows)]
+
+        self._save_json('index.json', {'version': STATE_VERSION, 'shards': self.index})
+        return len(records)
+
+    def iter_shards(self, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """
+        Memory-mapped (day, rows) for every shard that may hold timestamps in
+        [start, end). Only the index is consulted to skip shards; rows are not filtered.
+        """
+        for day in sorted(self.index):
+            minimum, maximum, rows = self.index[day]
+            if not rows or (start is not None and maximum < start) or (end is not None and minimum >= end):
+                continue
+            yield day, self._shard(day)
+
+    def query(self, start: Optional[int] = None, end: Optional[int] = None,
+              from_stop: Optional[str] = None, to_stop: Optional[str] = None,
+              route_id: Optional[str] = None) -> np.ndarray:
+        """
+        Rows with start <= timestamp < end, optionally for one stop pair and/or route.
+        Shards entirely inside the range with no filters are returned as zero-copy views.
+        """
+        filters = []
+        for name, value, ids in (('from_stop', from_stop, self._stop_ids),
+                                 ('to_stop', to_stop, self._stop_ids),
+                                 ('route', route_id, self._route_ids)):
+            if value is not None:
+                if value not in ids:
+                    return np.empty(0, dtype=RECORD_DTYPE)  # Never recorded
+                filters.append((name, ids[value]))
+
+        parts = []
+        for day, shard in self.iter_shards(start, end):
+            minimum, maximum, _ = self.index[day]
+            mask = None
+            if start is not None and minimum < start:
+                mask = shard['timestamp'] >= start
+            if end is not None and maximum >= end:
+                below = shard['timestamp'] < end
+                mask = below if mask is None else mask & below
+            for name, value in filters:
+                matches = shard[name] == value
+                mask = matches if mask is None else mask & matches
+            parts.append(shard if mask is None else shard[mask])
+
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def pair_history(self, from_stop: str, to_stop: str, days: int = 30,
+                     now: Optional[float] = None) -> np.ndarray:
+        """Rows for one stop pair over the last `days` days"""
+        now = int(now if now is not None else time.time())
+        return self.query(now - days * 86400, None, from_stop, to_stop)
+
+    def to_frame(self, rows: np.ndarray) -> pd.DataFrame:
+        """Decode query rows into a DataFrame with names and local times"""
+        stops = pd.Index(self.stop_names, dtype=object)
+        routes = pd.Index(self.route_names, dtype=object)
+        return pd.DataFrame({
+            'timestamp': (pd.to_datetime(rows['timestamp'], unit='s', utc=True)
+                          .tz_convert(LOCAL_TIMEZONE).tz_localize(None)),
+            'route_id': pd.Categorical.from_codes(rows['route'].astype(np.int32), categories=routes),
+            'from_stop': pd.Categorical.from_codes(rows['from_stop'].astype(np.int32), categories=stops),
+            'to_stop': pd.Categorical.from_codes(rows['to_stop'].astype(np.int32), categories=stops),
+            'delay_seconds': rows['delay_seconds'],
+        })
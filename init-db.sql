@@ -3,31 +3,46 @@
 
 -- Create stations table
 CREATE TABLE IF NOT EXISTS stations (
-    station_code VARCHAR(10) PRIMARY KEY,
+    station_code VARCHAR(255) PRIMARY KEY,
     station_name VARCHAR(255) NOT NULL,
     latitude FLOAT,
     longitude FLOAT,
     station_order INTEGER
 );
 
--- Create station_pair_delays table
+-- Create station_pair_delays table, range-partitioned by day on recorded_at
+-- (further partitions are created by data_fetcher.py and `setup_database.py --maintain`)
 CREATE TABLE IF NOT EXISTS station_pair_delays (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     trip_id VARCHAR(255),
     route_id VARCHAR(255),
-    from_station VARCHAR(10),
-    to_station VARCHAR(10),
+    from_station VARCHAR(255),
+    to_station VARCHAR(255),
     scheduled_departure TIMESTAMP,
     actual_departure TIMESTAMP,
     delay_minutes INTEGER,
-    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+-- Create daily partitions from yesterday through a week ahead
+DO $$
+DECLARE
+    day DATE;
+BEGIN
+    FOR day IN SELECT generate_series(CURRENT_DATE - 1, CURRENT_DATE + 7, INTERVAL '1 day')::DATE LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF station_pair_delays FOR VALUES FROM (%L) TO (%L)',
+            'station_pair_delays_p' || to_char(day, 'YYYYMMDD'), day, day + 1
+        );
+    END LOOP;
+END $$;
 
 -- Create daily_station_stats table
 CREATE TABLE IF NOT EXISTS daily_station_stats (
     id SERIAL PRIMARY KEY,
-    from_station VARCHAR(10),
-    to_station VARCHAR(10),
+    from_station VARCHAR(255),
+    to_station VARCHAR(255),
     date DATE,
     avg_delay_minutes FLOAT,
     total_trips INTEGER,
@@ -51,8 +66,8 @@ CREATE TABLE IF NOT EXISTS daily_route_stats (
 -- Create hourly_station_stats table
 CREATE TABLE IF NOT EXISTS hourly_station_stats (
     id SERIAL PRIMARY KEY,
-    from_station VARCHAR(10),
-    to_station VARCHAR(10),
+    from_station VARCHAR(255),
+    to_station VARCHAR(255),
     hour INTEGER,
     avg_delay_minutes FLOAT,
     total_trips INTEGER,
@@ -85,7 +100,7 @@ VALUES
 ON CONFLICT (station_code) DO NOTHING;
 
 -- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_station_pair_delays_recorded_at ON station_pair_delays(recorded_at);
-CREATE INDEX IF NOT EXISTS idx_station_pair_delays_route ON station_pair_delays(route_id);
+CREATE INDEX IF NOT EXISTS idx_station_pair_delays_pair_time ON station_pair_delays(from_station, to_station, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_station_pair_delays_route_time ON station_pair_delays(route_id, recorded_at);
 CREATE INDEX IF NOT EXISTS idx_daily_station_stats_date ON daily_station_stats(date);
 CREATE INDEX IF NOT EXISTS idx_daily_route_stats_date ON daily_route_stats(date);
\ No newline at end of file
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Static JSON Exporter
+Writes the dashboard's JSON files compactly (orjson) and atomically: each file is
+written to a temp file and renamed over the old one, so the frontend never reads
+a half-written file. Files whose content hash is unchanged are not rewritten, and
+manifest.json records the hash, size and update time of every file so the static
+frontend and CDN can cache aggressively. Every file also gets precompressed .gz
+and .br siblings for static hosts that serve them directly.
+"""
+
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+import numpy as np
+import orjson
+import pandas as pd
+from atomic_write import write_atomic
+
+try:
+    import brotli
+except ImportError:  # .br siblings are skipped without the brotli package
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+
+# Columns sharing one dictionary in the columnar layout; other text columns get their own
+SHARED_DICTIONARIES = {'from_stop': 'stations', 'to_stop': 'stations'}
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Files are recompressed on every poll: quality 11 (brotli's default) is ~20x slower
+# than 9 for ~20-30% smaller output, which costs seconds per poll on large tables
+BROTLI_QUALITY = 9
+# Likewise gzip level 9 is ~3x slower than 6 for ~7% smaller output
+GZIP_LEVEL = 6
+
+def _json_default(value: Any) -> str:
+    """Serialize dates/timestamps as ISO 8601, anything else via str()"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+def serialize(data: Any) -> bytes:
+    """Compact JSON bytes (NaN/inf become null)"""
+    return orjson.dumps(data, default=_json_default, option=ORJSON_OPTIONS)
+
+def frame_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Row objects for a DataFrame, like to_dict('records') but with column-wise
+    conversion: timestamps are formatted once per column and values are plain
+    Python types from Series.tolist().
+    """
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime('%Y-%m-%dT%H:%M:%S')
+        columns.append(column.tolist())
+    names = [str(name) for name in frame.columns]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+def _dictionary_value(value: Any) -> Any:
+    """Dictionary entry for a text-like value (dates as ISO strings, missing as null)"""
+    if isinstance(value, str) or value is None:
+        return value
+    if pd.isna(value):
+        return None
+    return _json_default(value)
+
+def frame_columns(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Columnar layout of a DataFrame: one array per field instead of one object per row.
+    Text columns (stations, routes, dates) are dictionary-encoded: the column holds
+    integer codes into dictionaries[encoding[column]]. Numeric and boolean columns
+    are plain arrays.
+    """
+    dictionaries: Dict[str, Dict[Any, int]] = {}
+    encoding: Dict[str, str] = {}
+    columns: Dict[str, Any] = {}
+
+    for name in frame.columns:
+        column = frame[name]
+        key = str(name)
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime('%Y-%m-%dT%H:%M:%S')
+        if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column):
+            columns[key] = column.to_numpy()
+            continue
+
+        dictionary_name = SHARED_DICTIONARIES.get(key, key)
+        dictionary = dictionaries.setdefault(dictionary_name, {})
+        values, uniques = pd.factorize(column.astype(object), use_na_sentinel=False)
+        remap = np.array([dictionary.setdefault(_dictionary_value(value), len(dictionary))
+                          for value in uniques], dtype=np.int32)
+        columns[key] = remap[values] if len(values) else values.astype(np.int32)
+        encoding[key] = dictionary_name
+
+    return {
+        'length': len(frame),
+        'dictionaries': {name: list(values) for name, values in dictionaries.items()},
+        'encoding': encoding,
+        'columns': columns,
+    }
+
+class JsonExporter:
+    """
+    Writes files under output_dir and keeps manifest.json in step.
+    Call finish() after the last write to publish the manifest.
+    """
+
+    def __init__(self, output_dir: str, compress: bool = True):
+        self.output_dir = output_dir
+        self.compress = compress
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.changed: List[str] = []
+
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'rb') as f:
+                    self.files = orjson.loads(f.read()).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable JSON manifest {manifest_path}: {e}")
+
+    def _current_hash(self, name: str, path: str) -> str:
+        """Hash of the file on disk, trusting the manifest when its size still matches"""
+        entry = self.files.get(name)
+        if not os.path.exists(path):
+            return ''
+        if entry is not None and os.path.getsize(path) == entry.get('bytes'):
+            return entry['sha256']
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def write(self, name: str, content: bytes) -> bool:
+        """Atomically write content to output_dir/name unless it is unchanged"""
+        path = os.path.join(self.output_dir, name)
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self._current_hash(name, path) and self._siblings_present(path):
+            return False
+
+        write_atomic(path, content)
+        entry = {
+            'sha256': digest,
+            'bytes': len(content),
+            'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        if self.compress:
+            # Fixed mtime keeps the .gz byte-identical for identical content
+            compressed = gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+            write_atomic(f"{path}.gz", compressed)
+            entry['gzip_bytes'] = len(compressed)
+            if brotli is not None:
+                compressed = brotli.compress(content, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+                write_atomic(f"{path}.br", compressed)
+                entry['brotli_bytes'] = len(compressed)
+        self.files[name] = entry
+        self.changed.append(name)
+        return True
+
+    def _siblings_present(self, path: str) -> bool:
+        """Whether the precompressed siblings an unchanged file should have exist"""
+        if not self.compress:
+            return True
+        return os.path.exists(f"{path}.gz") and (brotli is None or os.path.exists(f"{path}.br"))
+
+    def remove(self, name: str):
+        """Delete a previously exported file, its compressed siblings and its manifest entry"""
+        path = os.path.join(self.output_dir, name)
+        for candidate in (path, f"{path}.gz", f"{path}.br"):
+            if os.path.exists(candidate):
+                os.remove(candidate)
+        if self.files.pop(name, None) is not None:
+            self.changed.append(name)
+
+    def export(self, name: str, data: Any) -> bool:
+        """Serialize data compactly and write it"""
+        return self.write(name, serialize(data))
+
+    def export_frame(self, name: str, frame: pd.DataFrame) -> bool:
+        """Write a DataFrame as an array of row objects"""
+        return self.export(name, frame_records(frame))
+
+    def export_columns(self, name: str, frame: pd.DataFrame) -> bool:
+        """Write a DataFrame in the dictionary-encoded columnar layout"""
+        return self.export(name, frame_columns(frame))
+
+    def finish(self) -> int:
+        """Publish the manifest if anything changed; returns the number of files rewritten"""
+        if self.changed:
+            manifest = {
+                'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'files': dict(sorted(self.files.items())),
+            }
+            write_atomic(os.path.join(self.output_dir, MANIFEST_NAME),
+                          orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+        return len(self.changed)
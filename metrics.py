@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics
+Lightweight in-process counters, gauges and latency histograms for the data
+fetcher, rendered in the Prometheus text exposition format. Daemon mode serves
+them on a local HTTP /metrics endpoint; cron runs dump them to a file for the
+node_exporter textfile collector. Recording a sample is a lock, a bisect and two
+additions, so instrumentation costs microseconds per pipeline stage.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from atomic_write import write_atomic
+
+METRIC_PREFIX = 'train_delays_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Stage latency buckets (seconds): sub-10 ms aggregations up to slow feed downloads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """'{name="value",...}' or '' without labels"""
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """One metric family; samples are keyed by their label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(suffix, rendered labels, value) of every sample"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{labels} {_number(value)}" for suffix, labels, value in self.samples())
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    """Monotonically increasing total"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # Without labels there is exactly one sample, exported as 0 before the first inc()
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            return [('', _labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+class Gauge(Counter):
+    """Value that is set, not accumulated"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram with a running sum and count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count per bucket (last one is +Inf), then the sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = entry
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    samples.append(('_bucket', _labels(self.labelnames + ('le',), key + (_number(bound),)),
+                                    cumulative))
+                samples.append(('_sum', _labels(self.labelnames, key), total[0]))
+                samples.append(('_count', _labels(self.labelnames, key), cumulative))
+        return samples
+
+class MetricsRegistry:
+    """Ordered collection of metric families that renders them all at once"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(METRIC_PREFIX + name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(METRIC_PREFIX + name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(METRIC_PREFIX + name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        return ''.join(metric.render() + '\n' for metric in self.metrics.values())
+
+    def write_textfile(self, path: str):
+        """
+        Atomically write the metrics for node_exporter's textfile collector
+        (the collector only reads *.prom files, so name the file accordingly)
+        """
+        write_atomic(path, self.render().encode('utf-8'))
+
+class MetricsServer:
+    """Serves a registry on http://host:port/metrics from a background thread"""
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = '127.0.0.1'):
+        # Only daemons with --metrics-port serve, so cron runs don't import http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes every few seconds would flood the cron log
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+class PipelineMetrics:
+    """The data fetcher's metrics: stage latency, rows in/out, feed bytes and failures"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        registry = self.registry
+        self.stage_seconds = registry.histogram(
+            'stage_duration_seconds', 'Wall-clock time of a pipeline stage.', ['stage'])
+        self.stage_errors = registry.counter(
+            'stage_errors_total', 'Pipeline stage calls that raised an exception.', ['stage'])
+        self.rows_in = registry.counter(
+            'stage_rows_in_total', 'Rows handed to a pipeline stage.', ['stage'])
+        self.rows_out = registry.counter(
+            'stage_rows_out_total', 'Rows produced by a pipeline stage.', ['stage'])
+        self.feed_bytes = registry.counter(
+            'feed_bytes_total', 'GTFS-RT response bytes downloaded.', ['feed'])
+        self.feed_not_modified = registry.counter(
+            'feed_not_modified_total', 'Polls where a feed had not changed since the last one.', ['feed'])
+        self.mock_fallbacks = registry.counter(
+            'mock_fallbacks_total', 'Polls that fell back to mock data after a fetch error.')
+        self.db_errors = registry.counter(
+            'db_errors_total', 'Failed database connections and transactions.')
+        self.json_files_written = registry.counter(
+            'json_files_written_total', 'JSON files rewritten because their content changed.')
+        self.last_success = registry.gauge(
+            'stage_last_success_timestamp_seconds', 'Unix time a pipeline stage last completed.', ['stage'])
+        # Optional object whose stage(name) context wraps every stage too (e.g. a PollProfiler)
+        self.tracer: Optional[Any] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as one run of stage `name`"""
+        started = time.perf_counter()
+        try:
+            with self.tracer.stage(name) if self.tracer is not None else nullcontext():
+                yield
+        except Exception:
+            self.stage_errors.inc(stage=name)
+            raise
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, stage=name)
+        self.last_success.set(time.time(), stage=name)
+
+    def rows(self, stage: str, rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+        if rows_in is not None:
+            self.rows_in.inc(rows_in, stage=stage)
+        if rows_out is not None:
+            self.rows_out.inc(rows_out, stage=stage)
+
+def timed_stage(name: str, rows_in: Optional[Callable[..., int]] = None,
+                rows_out: Optional[Callable[..., int]] = None):
+    """
+    Method decorator recording a call as one run of stage `name` on self.metrics.
+    rows_in is called with the method's arguments and rows_out with its result.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics: PipelineMetrics = self.metrics
+            if rows_in is not None:
+                metrics.rows(name, rows_in=rows_in(*args, **kwargs))
+            with metrics.stage(name):
+                result = method(self, *args, **kwargs)
+            if rows_out is not None:
+                metrics.rows(name, rows_out=rows_out(result))
+            return result
+        return wrapper
+    return decorate
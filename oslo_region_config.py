@@ -5,7 +5,9 @@ This file contains all train routes and stations in the Oslo region.
 Used by the train delay dashboard to process and display delay information.
 """
 
-from typing import Dict, List, Any
+import csv
+from typing import Dict, List, Any, FrozenSet, Iterable, Optional, Sequence, Tuple
+import numpy as np
 
 # Oslo Region Train Routes Configuration
 OSLO_REGION_ROUTES = {
@@ -124,35 +126,50 @@ OSLO_REGION_ROUTES = {
     }
 }
 
-# Station coordinates and information (approximate coordinates for Oslo region stations)
+# Station coordinates and information (approximate coordinates for Oslo region stations).
+# stop_place_id is the station's NSR StopPlace ID, as used for stop_id in Entur's feeds
 OSLO_REGION_STATIONS = {
-    "Spikkestad": {"name": "Spikkestad", "latitude": 59.9467, "longitude": 10.4100},
-    "Asker": {"name": "Asker", "latitude": 59.8333, "longitude": 10.4378},
-    "Oslo S": {"name": "Oslo Central Station", "latitude": 59.9111, "longitude": 10.7550},
-    "Lillestrøm": {"name": "Lillestrøm", "latitude": 59.9550, "longitude": 11.0492},
-    "Eidsvoll": {"name": "Eidsvoll", "latitude": 60.3286, "longitude": 11.1581},
-    "Ski": {"name": "Ski", "latitude": 59.7194, "longitude": 10.8389},
+    "Spikkestad": {"name": "Spikkestad", "latitude": 59.9467, "longitude": 10.4100, "stop_place_id": "NSR:StopPlace:596"},
+    "Asker": {"name": "Asker", "latitude": 59.8333, "longitude": 10.4378, "stop_place_id": "NSR:StopPlace:444"},
+    "Oslo S": {"name": "Oslo Central Station", "latitude": 59.9111, "longitude": 10.7550, "stop_place_id": "NSR:StopPlace:337"},
+    "Lillestrøm": {"name": "Lillestrøm", "latitude": 59.9550, "longitude": 11.0492, "stop_place_id": "NSR:StopPlace:550"},
+    "Eidsvoll": {"name": "Eidsvoll", "latitude": 60.3286, "longitude": 11.1581, "stop_place_id": "NSR:StopPlace:165"},
+    "Ski": {"name": "Ski", "latitude": 59.7194, "longitude": 10.8389, "stop_place_id": "NSR:StopPlace:588"},
     "Stabekk": {"name": "Stabekk", "latitude": 59.9072, "longitude": 10.5878},
-    "Kongsberg": {"name": "Kongsberg", "latitude": 59.6686, "longitude": 9.6502},
-    "Drammen": {"name": "Drammen", "latitude": 59.7440, "longitude": 10.2045},
+    "Kongsberg": {"name": "Kongsberg", "latitude": 59.6686, "longitude": 9.6502, "stop_place_id": "NSR:StopPlace:313"},
+    "Drammen": {"name": "Drammen", "latitude": 59.7440, "longitude": 10.2045, "stop_place_id": "NSR:StopPlace:160"},
     "Dal": {"name": "Dal", "latitude": 60.4167, "longitude": 11.1167},
-    "Kongsvinger": {"name": "Kongsvinger", "latitude": 60.1911, "longitude": 12.0039},
-    "Moss": {"name": "Moss", "latitude": 59.4344, "longitude": 10.6572},
-    "Mysen": {"name": "Mysen", "latitude": 59.5536, "longitude": 11.3258},
-    "Lillehammer": {"name": "Lillehammer", "latitude": 61.1153, "longitude": 10.4662},
-    "Skien": {"name": "Skien", "latitude": 59.2096, "longitude": 9.6089},
-    "Halden": {"name": "Halden", "latitude": 59.1222, "longitude": 11.3875},
+    "Kongsvinger": {"name": "Kongsvinger", "latitude": 60.1911, "longitude": 12.0039, "stop_place_id": "NSR:StopPlace:315"},
+    "Moss": {"name": "Moss", "latitude": 59.4344, "longitude": 10.6572, "stop_place_id": "NSR:StopPlace:416"},
+    "Mysen": {"name": "Mysen", "latitude": 59.5536, "longitude": 11.3258, "stop_place_id": "NSR:StopPlace:425"},
+    "Lillehammer": {"name": "Lillehammer", "latitude": 61.1153, "longitude": 10.4662, "stop_place_id": "NSR:StopPlace:367"},
+    "Skien": {"name": "Skien", "latitude": 59.2096, "longitude": 9.6089, "stop_place_id": "NSR:StopPlace:590"},
+    "Halden": {"name": "Halden", "latitude": 59.1222, "longitude": 11.3875, "stop_place_id": "NSR:StopPlace:220"},
     "Göteborg": {"name": "Göteborg", "latitude": 57.7089, "longitude": 11.9746},
-    "Rakkestad": {"name": "Rakkestad", "latitude": 59.4286, "longitude": 11.3450},
-    "Sarpsborg": {"name": "Sarpsborg", "latitude": 59.2833, "longitude": 11.1094},
-    "Fredrikstad": {"name": "Fredrikstad", "latitude": 59.2181, "longitude": 10.9298},
-    "Oslo Lufthavn": {"name": "Oslo Lufthavn", "latitude": 60.1939, "longitude": 11.1004}
+    "Rakkestad": {"name": "Rakkestad", "latitude": 59.4286, "longitude": 11.3450, "stop_place_id": "NSR:StopPlace:514"},
+    "Sarpsborg": {"name": "Sarpsborg", "latitude": 59.2833, "longitude": 11.1094, "stop_place_id": "NSR:StopPlace:548"},
+    "Fredrikstad": {"name": "Fredrikstad", "latitude": 59.2181, "longitude": 10.9298, "stop_place_id": "NSR:StopPlace:196"},
+    "Oslo Lufthavn": {"name": "Oslo Lufthavn", "latitude": 60.1939, "longitude": 11.1004, "stop_place_id": "NSR:StopPlace:598"}
 }
 
+# NSR Quay ID -> NSR StopPlace ID of configured stations. Entur's trip updates usually
+# name the platform (quay) rather than the station; filled by load_gtfs_quays()
+OSLO_REGION_QUAYS: Dict[str, str] = {}
+
 def get_all_route_codes() -> List[str]:
     """Get all route codes in the Oslo region"""
     return list(OSLO_REGION_ROUTES.keys())
 
+# Cached frozenset of route codes for hot-path membership checks
+_route_code_set: Optional[FrozenSet[str]] = None
+
+def get_route_code_set() -> FrozenSet[str]:
+    """Get all route codes as a frozenset for O(1) lookups (built once, cached)"""
+    global _route_code_set
+    if _route_code_set is None:
+        _route_code_set = frozenset(OSLO_REGION_ROUTES)
+    return _route_code_set
+
 def get_all_station_names() -> List[str]:
     """Get all station names in the Oslo region"""
     return list(OSLO_REGION_STATIONS.keys())
@@ -181,6 +198,143 @@ def get_all_station_pairs() -> List[tuple]:
         all_pairs.update(pairs)
     return list(all_pairs)
 
+def _index_lists(lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Flatten per-item id lists into (offsets, ids) arrays: item i owns ids[offsets[i]:offsets[i + 1]]"""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(ids) for ids in lists])
+    flat = np.fromiter((i for ids in lists for i in ids), dtype=np.int16, count=int(offsets[-1]))
+    return offsets, flat
+
+class RouteTopology:
+    """
+    Compiled, read-only view of the route configuration for hot-path lookups.
+    Stations and routes get integer ids (their configuration order). Stop pairs are
+    the consecutive stations of every route, in both travel directions, numbered
+    0..n_pairs-1; pair_index[from_id, to_id] gives the pair id or -1. Pair -> routes
+    and station -> routes are inverted indexes in offsets/ids array form.
+    Stations are found by display name, NSR StopPlace ID or the NSR Quay ID of one
+    of their platforms.
+    """
+
+    __slots__ = ('station_names', 'route_codes', 'stop_place_ids', 'station_ids', 'route_ids',
+                 'pair_index', 'pair_from', 'pair_to', 'pair_route_offsets', 'pair_route_ids',
+                 'station_route_offsets', 'station_route_ids')
+
+    def __init__(self, routes: Dict[str, Dict[str, Any]], stations: Dict[str, Dict[str, Any]],
+                 quays: Optional[Dict[str, str]] = None):
+        # Stations only named in a route still get an id
+        names = list(stations)
+        for route in routes.values():
+            names.extend(name for name in route['stations'] if name not in names)
+        self.station_names: Tuple[str, ...] = tuple(names)
+        self.route_codes: Tuple[str, ...] = tuple(routes)
+        self.stop_place_ids: Tuple[Optional[str], ...] = tuple(
+            stations.get(name, {}).get('stop_place_id') for name in names)
+        self.route_ids: Dict[str, int] = {code: i for i, code in enumerate(self.route_codes)}
+        # Lookup keys: display names, NSR StopPlace IDs and NSR Quay IDs
+        self.station_ids: Dict[str, int] = {name: i for i, name in enumerate(names)}
+        self.station_ids.update((stop_place_id, i) for i, stop_place_id in enumerate(self.stop_place_ids)
+                                if stop_place_id)
+        self.station_ids.update((quay_id, self.station_ids[stop_place_id])
+                                for quay_id, stop_place_id in (quays or {}).items()
+                                if stop_place_id in self.station_ids)
+
+        # The extra row/column n_stations stands for "not one of our stations"
+        n_stations = len(names)
+        pair_index = np.full((n_stations + 1, n_stations + 1), -1, dtype=np.int16)
+        pair_routes: List[List[int]] = []
+        station_routes: List[List[int]] = [[] for _ in names]
+        for route_id, route in enumerate(routes.values()):
+            ids = [self.station_ids[name] for name in route['stations']]
+            for station in ids:
+                if route_id not in station_routes[station]:
+                    station_routes[station].append(route_id)
+            for from_id, to_id in zip(ids, ids[1:]):
+                for pair in ((from_id, to_id), (to_id, from_id)):
+                    if pair_index[pair] < 0:
+                        pair_index[pair] = len(pair_routes)
+                        pair_routes.append([])
+                    if route_id not in pair_routes[pair_index[pair]]:
+                        pair_routes[pair_index[pair]].append(route_id)
+
+        self.pair_index = pair_index
+        pairs = np.argwhere(pair_index >= 0)
+        order = np.argsort(pair_index[pairs[:, 0], pairs[:, 1]])
+        self.pair_from = pairs[order, 0].astype(np.int16)
+        self.pair_to = pairs[order, 1].astype(np.int16)
+        self.pair_route_offsets, self.pair_route_ids = _index_lists(pair_routes)
+        self.station_route_offsets, self.station_route_ids = _index_lists(station_routes)
+        for array in (self.pair_index, self.pair_from, self.pair_to, self.pair_route_offsets,
+                      self.pair_route_ids, self.station_route_offsets, self.station_route_ids):
+            array.flags.writeable = False
+
+    @property
+    def n_pairs(self) -> int:
+        return len(self.pair_from)
+
+    def display_name(self, stop: str) -> Optional[str]:
+        """Configured station name for a display name, NSR StopPlace ID or NSR Quay ID"""
+        station_id = self.station_ids.get(stop)
+        return None if station_id is None else self.station_names[station_id]
+
+    def display_names(self, stops: Iterable[str]) -> List[str]:
+        """Configured station name of every stop name/NSR ID, unknown stops unchanged"""
+        names, ids = self.station_names, self.station_ids
+        return [names[ids[stop]] if stop in ids else stop for stop in stops]
+
+    def station_codes(self, stops: Iterable[str]) -> np.ndarray:
+        """Station id of every stop name/NSR ID, with unknown stops mapped to the extra id n_stations"""
+        unknown = len(self.station_names)
+        return np.array([self.station_ids.get(stop, unknown) for stop in stops], dtype=np.int16)
+
+    def pair_ids(self, stops: Sequence[str], from_codes: np.ndarray, to_codes: np.ndarray) -> np.ndarray:
+        """
+        Pair id (-1 if not a configured pair) of dictionary-coded stop pairs, e.g. a
+        DelayBatch's from_codes/to_codes into its stop_names. Only the dictionary is
+        looked up by string; the rows are two array gathers.
+        """
+        stations = self.station_codes(stops)
+        if not len(stations):
+            return np.full(len(from_codes), -1, dtype=np.int16)
+        return self.pair_index[stations[from_codes], stations[to_codes]]
+
+    def pair_id(self, from_stop: str, to_stop: str) -> int:
+        """Pair id of one stop pair, -1 if it is not a configured pair"""
+        from_id, to_id = self.station_codes((from_stop, to_stop)).tolist()
+        return int(self.pair_index[from_id, to_id])
+
+    def routes_for_pair(self, from_stop: str, to_stop: str) -> List[str]:
+        """Codes of the routes that run directly between two stations"""
+        pair = self.pair_id(from_stop, to_stop)
+        if pair < 0:
+            return []
+        ids = self.pair_route_ids[self.pair_route_offsets[pair]:self.pair_route_offsets[pair + 1]]
+        return [self.route_codes[i] for i in ids.tolist()]
+
+    def routes_for_station(self, stop: str) -> List[str]:
+        """Codes of the routes that call at a station"""
+        station = self.station_ids.get(stop)
+        if station is None:
+            return []
+        ids = self.station_route_ids[self.station_route_offsets[station]:self.station_route_offsets[station + 1]]
+        return [self.route_codes[i] for i in ids.tolist()]
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        """All pairs as station names, in pair id order"""
+        names = self.station_names
+        return [(names[from_id], names[to_id])
+                for from_id, to_id in zip(self.pair_from.tolist(), self.pair_to.tolist())]
+
+# Cached compiled topology, see get_route_topology()
+_route_topology: Optional[RouteTopology] = None
+
+def get_route_topology() -> RouteTopology:
+    """Get the compiled route topology (built once, cached until the configuration changes)"""
+    global _route_topology
+    if _route_topology is None:
+        _route_topology = RouteTopology(OSLO_REGION_ROUTES, OSLO_REGION_STATIONS, OSLO_REGION_QUAYS)
+    return _route_topology
+
 def is_valid_route(route_code: str) -> bool:
     """Check if a route code is valid"""
     return route_code in OSLO_REGION_ROUTES
@@ -191,11 +345,35 @@ def is_valid_station(station_name: str) -> bool:
 
 def add_custom_route(route_code: str, route_info: Dict[str, Any]) -> None:
     """Add a custom route to the configuration (for future expansion)"""
+    global _route_code_set, _route_topology
     OSLO_REGION_ROUTES[route_code] = route_info
+    _route_code_set = None
+    _route_topology = None
 
 def add_custom_station(station_name: str, station_info: Dict[str, Any]) -> None:
     """Add a custom station to the configuration (for future expansion)"""
+    global _route_topology
     OSLO_REGION_STATIONS[station_name] = station_info
+    _route_topology = None
+
+def add_custom_quays(quays: Dict[str, str]) -> None:
+    """Map NSR Quay IDs to the NSR StopPlace ID of their station"""
+    global _route_topology
+    OSLO_REGION_QUAYS.update(quays)
+    _route_topology = None
+
+def load_gtfs_quays(path: str) -> int:
+    """
+    Map the quays of configured stations from a GTFS stops.txt (e.g. Entur's static
+    GTFS export), where each quay's parent_station is its StopPlace ID.
+    Returns the number of quays mapped.
+    """
+    stop_place_ids = {station.get('stop_place_id') for station in OSLO_REGION_STATIONS.values()}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        quays = {row['stop_id']: row['parent_station'] for row in csv.DictReader(f)
+                 if row.get('parent_station') in stop_place_ids}
+    add_custom_quays(quays)
+    return len(quays)
 
 if __name__ == "__main__":
     # Print summary information
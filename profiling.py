@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Poll Profiler
+Runs polls under cProfile and tracemalloc and attributes allocations to the
+pipeline stages the fetcher's metrics already delimit (fetch_realtime_data,
+process_data, the database saves, generate_json_files). Writes:
+- profile.pstats: the CPU profile, for pstats, snakeviz or flameprof/gprof2dot
+  (flame graphs and call graphs)
+- profile.txt: the top functions by cumulative and by own time
+- allocations.txt: wall time, peak and net traced memory, and the top allocation
+  sites (by line) of every stage
+Timings are inflated by tracemalloc; compare them with each other, not with the
+unprofiled stage latencies.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple
+
+# Functions listed per ordering in profile.txt and allocation sites per stage
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 15
+
+# Frames kept per allocation; 1 is cheapest and enough to group by line
+TRACEMALLOC_FRAMES = 1
+
+class StageProfile(NamedTuple):
+    """Time and allocations of one run of a stage"""
+    name: str
+    seconds: float
+    peak_bytes: int  # peak traced memory above the stage's starting point
+    net_bytes: int  # traced memory still held when the stage ended
+    top_allocations: List[tracemalloc.StatisticDiff]
+
+class PollProfiler:
+    """
+    Attach as PipelineMetrics.tracer so every stage() block is profiled,
+    and call start()/stop() around the polls.
+    """
+
+    def __init__(self, top_allocations: int = TOP_ALLOCATIONS):
+        self.top_allocations = top_allocations
+        self.profile = cProfile.Profile()
+        self.stages: List[StageProfile] = []
+
+    def start(self):
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        tracemalloc.stop()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        """Traced allocations, minus tracemalloc's and this module's own bookkeeping"""
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile the enclosed block as one run of stage `name`"""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+
+        # Snapshots are taken with the CPU profiler paused so they don't show up in it
+        self.profile.disable()
+        before = self._snapshot()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.profile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.profile.disable()
+            ended, peak = tracemalloc.get_traced_memory()
+            diffs = self._snapshot().compare_to(before, 'lineno')
+            self.stages.append(StageProfile(
+                name, elapsed, peak - current, ended - current,
+                [diff for diff in diffs if diff.size_diff > 0][:self.top_allocations]))
+            self.profile.enable()
+
+    def cpu_report(self) -> str:
+        """Top functions by cumulative and by own time"""
+        output = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=output).strip_dirs()
+        for ordering in ('cumulative', 'tottime'):
+            output.write(f"Top {TOP_FUNCTIONS} functions by {ordering} time\n")
+            stats.sort_stats(ordering).print_stats(TOP_FUNCTIONS)
+        return output.getvalue()
+
+    def allocation_report(self) -> str:
+        """Time, memory and top allocation sites of every profiled stage run"""
+        lines = []
+        for stage in self.stages:
+            lines.append(f"{stage.name}: {stage.seconds:.3f}s, peak +{stage.peak_bytes / 1024:.1f} KiB, "
+                         f"net {stage.net_bytes / 1024:+.1f} KiB")
+            for diff in stage.top_allocations:
+                frame = diff.traceback[0]
+                lines.append(f"  {diff.size_diff / 1024:10.1f} KiB {diff.count_diff:+9d} blocks  "
+                             f"{frame.filename}:{frame.lineno}")
+            lines.append('')
+        return '\n'.join(lines)
+
+    def write(self, output_dir: str) -> List[str]:
+        """Write profile.pstats, profile.txt and allocations.txt; returns their paths"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = [os.path.join(output_dir, name)
+                 for name in ('profile.pstats', 'profile.txt', 'allocations.txt')]
+        self.profile.dump_stats(paths[0])
+        with open(paths[1], 'w') as f:
+            f.write(self.cpu_report())
+        with open(paths[2], 'w') as f:
+            f.write(self.allocation_report())
+        return paths
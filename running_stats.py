@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Running Delay Statistics
+Incremental count/sum/sum-of-squares/min/max aggregates per (date, pair),
+(hour, pair) and (date, route), of the delay gained per (date, pair) segment
+and per (date, stop) dwell, plus a quantile sketch and a fixed-bucket
+histogram per key for percentiles and punctuality. Each poll's partial
+aggregates are merged in, so daily and hourly statistics cover every poll of
+the day rather than only the latest snapshot. State is persisted to JSON files
+(one per date, rewritten only when that date changed) to survive restarts.
+"""
+
+import math
+import os
+from datetime import date, timedelta
+from typing import AbstractSet, Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import orjson
+import pandas as pd
+from atomic_write import write_atomic
+from delay_sketch import DelaySketch, HISTOGRAM_BUCKETS, HISTOGRAM_LABELS, ON_TIME_BUCKETS
+
+# Column layout of the partial aggregates produced by TrainDelayFetcher._calculate_*
+PARTIAL_VALUE_COLUMNS = ['delay_count', 'total_delay_minutes', 'sum_sq_delay_minutes',
+                         'min_delay_minutes', 'max_delay_minutes']
+
+# Key columns of each running table
+KEY_COLUMNS = {
+    'daily': ['date', 'from_stop', 'to_stop'],
+    'hourly': ['hour', 'from_stop', 'to_stop'],
+    'date_hourly': ['date', 'hour', 'from_stop', 'to_stop'],
+    'route': ['date', 'route_id'],
+    'segment': ['date', 'from_stop', 'to_stop'],
+    'dwell': ['date', 'stop'],
+}
+
+# Tables of absolute delays (the others hold delay gained on a segment or at a stop)
+DELAY_KINDS = ('daily', 'hourly', 'date_hourly', 'route')
+
+# Tables keyed by date first (pruned by retention, exported as per-date shards)
+DATED_KINDS = ('daily', 'date_hourly', 'route', 'segment', 'dwell')
+
+# Tables whose keys end with (from_stop, to_stop)
+PAIR_KINDS = ('daily', 'hourly', 'date_hourly', 'segment')
+
+# Column layout of the partial distributions (one row per key, sketch bin and bucket)
+PARTIAL_DISTRIBUTION_COLUMNS = ['sketch_bin', 'histogram_bucket', 'delay_count']
+
+# Derived statistics columns of the exported tables
+DERIVED_COLUMNS = ['avg_delay_minutes', 'total_delay_minutes', 'delay_count', 'min_delay_minutes',
+                   'max_delay_minutes', 'std_delay_minutes', 'p50_delay_minutes', 'p90_delay_minutes',
+                   'p99_delay_minutes', 'delayed_count', 'on_time_percentage']
+
+# Version 2 added the histogram and sketch to every entry; version 3 moved the dated
+# tables into one file per date. Version 1 and 2 state (a single file) still loads
+STATE_VERSION = 3
+
+class RunningStats:
+    """
+    Mergeable count/sum/sum-of-squares/min/max accumulator for one key, with a
+    fixed-bucket histogram and a quantile sketch of the same delays
+    """
+
+    __slots__ = ('count', 'total', 'sum_sq', 'minimum', 'maximum', 'histogram', 'sketch')
+
+    def __init__(self, count: int = 0, total: float = 0.0, sum_sq: float = 0.0,
+                 minimum: float = math.inf, maximum: float = -math.inf,
+                 histogram: Optional[List[int]] = None, sketch: Optional[DelaySketch] = None):
+        self.count = count
+        self.total = total
+        self.sum_sq = sum_sq
+        self.minimum = minimum
+        self.maximum = maximum
+        self.histogram = histogram if histogram is not None else [0] * HISTOGRAM_BUCKETS
+        self.sketch = sketch if sketch is not None else DelaySketch()
+
+    def merge(self, count: int, total: float, sum_sq: float, minimum: float, maximum: float):
+        """Fold in another partial aggregate"""
+        self.count += count
+        self.total += total
+        self.sum_sq += sum_sq
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    def retract(self, count: int, total: float, sum_sq: float):
+        """
+        Take back a partial aggregate merged earlier (superseded observations).
+        The extremes cannot be taken back: they stay those of every delay merged
+        since the key last had no observations.
+        """
+        self.count -= count
+        self.total -= total
+        self.sum_sq -= sum_sq
+        if self.count <= 0:
+            self.count, self.total, self.sum_sq = 0, 0.0, 0.0
+            self.minimum, self.maximum = math.inf, -math.inf
+
+    def merge_stats(self, other: 'RunningStats'):
+        """Fold in another accumulator, distributions included"""
+        self.merge(*other.to_list())
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.sketch.merge(other.sketch)
+
+    def copy(self) -> 'RunningStats':
+        return RunningStats(*self.to_list(), list(self.histogram), DelaySketch(dict(self.sketch.bins)))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        variance = self.sum_sq / self.count - self.mean ** 2
+        return math.sqrt(max(variance, 0.0))
+
+    @property
+    def delayed_count(self) -> Optional[int]:
+        """Delays of DELAYED_THRESHOLD_MINUTES or more (None without a histogram)"""
+        observed = sum(self.histogram)
+        return observed - sum(self.histogram[:ON_TIME_BUCKETS]) if observed else None
+
+    @property
+    def on_time_percentage(self) -> Optional[float]:
+        """Share of delays under DELAYED_THRESHOLD_MINUTES, in percent"""
+        observed = sum(self.histogram)
+        return 100.0 * sum(self.histogram[:ON_TIME_BUCKETS]) / observed if observed else None
+
+    def to_list(self) -> List[float]:
+        return [self.count, self.total, self.sum_sq, self.minimum, self.maximum]
+
+# Derived statistics of one key, in _stats_frame column order
+DerivedRow = Tuple[float, float, int, float, float, float, Optional[float], Optional[float],
+                   Optional[float], Optional[int], Optional[float]]
+
+class RunningAggregator:
+    """
+    Running daily/hourly/route statistics merged poll by poll.
+    Daily keys older than retention_days are pruned so state stays bounded.
+    Keys of dated tables are also indexed by date, and the derived statistics
+    (mean, std, percentiles, ...) of every key are cached until it is merged into
+    again, so exporting the dates a poll touched costs O(those dates), not O(state).
+    """
+
+    def __init__(self, state_path: Optional[str] = None, retention_days: int = 35):
+        self.state_path = state_path
+        self.retention_days = retention_days
+        self.tables: Dict[str, Dict[Tuple, RunningStats]] = {kind: {} for kind in KEY_COLUMNS}
+        # Relevance is a property of the station pair, remembered alongside the stats
+        self.relevant: Dict[Tuple[str, str], bool] = {}
+        # Dates merged into since take_dirty_dates() was last called
+        self.dirty_dates: Set[date] = set()
+        # Keys of each dated table by their date
+        self._date_keys: Dict[str, Dict[date, Set[Tuple]]] = {kind: {} for kind in DATED_KINDS}
+        # Cached derived statistics per key; keys merged into since are stale
+        self._rows: Dict[str, Dict[Tuple, DerivedRow]] = {kind: {} for kind in KEY_COLUMNS}
+        self._stale: Dict[str, Set[Tuple]] = {kind: set() for kind in KEY_COLUMNS}
+        # Merge counter, and the count at which each date of a dated table last changed
+        self._version = 0
+        self._date_versions: Dict[str, Dict[date, int]] = {kind: {} for kind in DATED_KINDS}
+        # Dates of dated tables changed or pruned since the last save()
+        self._unsaved_dates: Set[date] = set()
+        # (kind, days) -> (first date, newest date, version, merged stats of first..newest - 1)
+        self._summary_bases: Dict[Tuple[str, int], Tuple[date, date, int, Dict[Tuple, RunningStats]]] = {}
+
+    @classmethod
+    def load(cls, state_path: str, retention_days: int = 35) -> 'RunningAggregator':
+        """Load persisted state, starting empty if there is none"""
+        aggregator = cls(state_path, retention_days)
+        if not os.path.exists(state_path):
+            return aggregator
+
+        try:
+            with open(state_path, 'rb') as f:
+                state = orjson.loads(f.read())
+            version = state.get('version')
+            if version not in (1, 2, STATE_VERSION):
+                print(f"Ignoring running stats state with unknown version in {state_path}")
+                return aggregator
+
+            if version == STATE_VERSION:
+                aggregator._load_entries('hourly', state.get('hourly', []), version)
+                dates_dir = aggregator._dates_dir()
+                for name in sorted(os.listdir(dates_dir)) if os.path.isdir(dates_dir) else []:
+                    if not name.endswith('.json'):
+                        continue
+                    with open(os.path.join(dates_dir, name), 'rb') as f:
+                        shard = orjson.loads(f.read())
+                    for kind in DATED_KINDS:
+                        aggregator._load_entries(kind, shard.get(kind, []), version)
+            else:
+                for kind in KEY_COLUMNS:
+                    aggregator._load_entries(kind, state.get(kind, []), version)
+                # Older single-file state: write every date out as a shard on the next save
+                aggregator._unsaved_dates.update(aggregator.dates())
+            for from_stop, to_stop, is_relevant in state.get('relevant', []):
+                aggregator.relevant[(from_stop, to_stop)] = is_relevant
+            print(f"Loaded running stats from {state_path}")
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Failed to load running stats from {state_path}: {e}")
+        return aggregator
+
+    def _load_entries(self, kind: str, entries: List[List[Any]], version: int):
+        """Add persisted [*key, *values(, histogram, sketch)] entries to a table"""
+        table = self.tables[kind]
+        loaded = []
+        for entry in entries:
+            if version == 1:
+                # No distributions were kept yet
+                key, values, histogram, sketch = entry[:-5], entry[-5:], None, None
+            else:
+                key, values = entry[:-7], entry[-7:-2]
+                histogram, sketch = entry[-2], DelaySketch.from_list(entry[-1])
+            if kind != 'hourly':
+                key = [date.fromisoformat(key[0])] + key[1:]
+            key = tuple(key)
+            table[key] = RunningStats(*values, histogram, sketch)
+            loaded.append(key)
+        self._index(kind, loaded)
+        self._stale[kind].update(loaded)
+
+    def _dates_dir(self) -> str:
+        """Directory of the per-date state files (state/running_stats.dates/<date>.json)"""
+        return f"{os.path.splitext(self.state_path)[0]}.dates"
+
+    def _entries(self, kind: str, keys: Iterable[Tuple]) -> List[List[Any]]:
+        """Persisted form of a table's keys"""
+        table = self.tables[kind]
+        entries = []
+        for key in sorted(keys):
+            stats = table[key]
+            entries.append([key[0].isoformat() if isinstance(key[0], date) else key[0], *key[1:],
+                            *stats.to_list(), stats.histogram, stats.sketch.to_list()])
+        return entries
+
+    def save(self):
+        """
+        Persist state: one file per date for the dated tables, rewritten only for dates
+        that changed (or deleted once pruned), plus the hourly table and pair relevance
+        in state_path. Every file is written atomically (temp file, then rename).
+        """
+        if not self.state_path:
+            return
+
+        dates_dir = self._dates_dir()
+        os.makedirs(dates_dir, exist_ok=True)
+        for day in sorted(self._unsaved_dates):
+            path = os.path.join(dates_dir, f"{day.isoformat()}.json")
+            if not any(day in self._date_keys[kind] for kind in DATED_KINDS):
+                if os.path.exists(path):
+                    os.remove(path)  # Pruned
+                continue
+            shard: Dict[str, Any] = {'version': STATE_VERSION, 'date': day.isoformat()}
+            for kind in DATED_KINDS:
+                shard[kind] = self._entries(kind, self._date_keys[kind].get(day, ()))
+            write_atomic(path, orjson.dumps(shard), durable=True)
+        self._unsaved_dates.clear()
+
+        write_atomic(self.state_path, orjson.dumps({
+            'version': STATE_VERSION,
+            'hourly': self._entries('hourly', self.tables['hourly']),
+            'relevant': [[from_stop, to_stop, is_relevant]
+                         for (from_stop, to_stop), is_relevant in self.relevant.items()],
+        }), durable=True)
+
+    def merge(self, kind: str, partial: pd.DataFrame, retract: bool = False):
+        """
+        Merge one poll's partial aggregates (one row per key) into the running state,
+        or with retract=True take back the aggregates of superseded observations
+        """
+        if partial.empty:
+            return
+
+        keys = list(zip(*(partial[column].tolist() for column in KEY_COLUMNS[kind])))
+        values = zip(*(partial[column].tolist() for column in PARTIAL_VALUE_COLUMNS))
+        self.merge_rows(kind, keys, values,
+                        partial['is_relevant'].tolist() if 'is_relevant' in partial else None, retract)
+
+    def merge_rows(self, kind: str, keys: Sequence[Tuple], values: Iterable[Tuple],
+                   relevant: Optional[Sequence[bool]] = None, retract: bool = False):
+        """
+        Merge partial aggregates given as key tuples and (count, total, sum_sq, min, max)
+        rows, optionally with the relevance of each (..., from_stop, to_stop) key.
+        With retract=True the rows are taken back instead (keys no longer held are skipped).
+        """
+        table = self.tables[kind]
+        if retract:
+            retracted = []
+            for key, (count, total, sum_sq, _, _) in zip(keys, values):
+                stats = table.get(key)
+                if stats is not None:
+                    stats.retract(count, total, sum_sq)
+                    retracted.append(key)
+            self._touch(kind, retracted)
+            if kind in DATED_KINDS:
+                self.dirty_dates.update(key[0] for key in retracted)
+            return
+
+        added = []
+        for key, (count, total, sum_sq, minimum, maximum) in zip(keys, values):
+            stats = table.get(key)
+            if stats is None:
+                table[key] = RunningStats(count, total, sum_sq, minimum, maximum)
+                added.append(key)
+            else:
+                stats.merge(count, total, sum_sq, minimum, maximum)
+        self._index(kind, added)
+        self._touch(kind, keys)
+
+        if kind in DATED_KINDS:
+            self.dirty_dates.update(key[0] for key in keys)
+
+        if relevant is not None:
+            self.relevant.update(zip((key[-2:] for key in keys), relevant))
+
+    def _index(self, kind: str, keys: Iterable[Tuple]):
+        """Add new keys of a dated table to the date index"""
+        if kind not in DATED_KINDS:
+            return
+        date_keys = self._date_keys[kind]
+        for key in keys:
+            keys_of_date = date_keys.get(key[0])
+            if keys_of_date is None:
+                keys_of_date = date_keys[key[0]] = set()
+            keys_of_date.add(key)
+
+    def _touch(self, kind: str, keys: Iterable[Tuple]):
+        """Mark keys whose statistics changed: their derived rows and dates are stale"""
+        self._version += 1
+        stale = self._stale[kind]
+        if kind not in DATED_KINDS:
+            stale.update(keys)
+            return
+        versions = self._date_versions[kind]
+        for key in keys:
+            stale.add(key)
+            versions[key[0]] = self._version
+            self._unsaved_dates.add(key[0])
+
+    def prune(self, newest: Optional[date] = None):
+        """
+        Drop dated keys that fell out of the retention window.
+        The window ends at the newest date seen (not the wall clock), so replays
+        of historical data are not pruned away as they are merged.
+        """
+        if newest is None:
+            newest = self.newest_date()
+            if newest is None:
+                return
+
+        cutoff = newest - timedelta(days=self.retention_days)
+        for kind in DATED_KINDS:
+            table, rows, stale = self.tables[kind], self._rows[kind], self._stale[kind]
+            date_keys = self._date_keys[kind]
+            for day in [day for day in date_keys if day < cutoff]:
+                for key in date_keys.pop(day):
+                    del table[key]
+                    rows.pop(key, None)
+                    stale.discard(key)
+                self._date_versions[kind].pop(day, None)
+                self._unsaved_dates.add(day)
+
+    def merge_distribution(self, kind: str, partial: pd.DataFrame, retract: bool = False):
+        """
+        Merge one poll's partial distributions (delay counts per key, sketch bin and
+        histogram bucket) into keys already merged with merge(), or take them back
+        with retract=True
+        """
+        if partial.empty:
+            return
+
+        keys = zip(*(partial[column].tolist() for column in KEY_COLUMNS[kind]))
+        values = zip(*(partial[column].tolist() for column in PARTIAL_DISTRIBUTION_COLUMNS))
+        self.merge_distribution_rows(kind, keys, values, retract)
+
+    def merge_distribution_rows(self, kind: str, keys: Iterable[Tuple], values: Iterable[Tuple],
+                                retract: bool = False):
+        """
+        Merge delay counts given as key tuples and (sketch_bin, histogram_bucket, count)
+        rows, or take them back with retract=True
+        """
+        table = self.tables[kind]
+        touched = []
+        for key, (sketch_bin, bucket, count) in zip(keys, values):
+            stats = table.get(key) if retract else table[key]
+            if stats is None:
+                continue
+            if retract:
+                stats.histogram[bucket] = max(stats.histogram[bucket] - count, 0)
+                stats.sketch.remove(sketch_bin, count)
+            else:
+                stats.histogram[bucket] += count
+                stats.sketch.add(sketch_bin, count)
+            touched.append(key)
+        self._touch(kind, touched)
+
+    def take_dirty_dates(self) -> Set[date]:
+        """Dates whose statistics changed since the last call (and reset the set)"""
+        dirty, self.dirty_dates = self.dirty_dates, set()
+        return dirty
+
+    def dates(self, kind: Optional[str] = None) -> List[date]:
+        """Retained dates of one dated table (or of any), oldest first"""
+        kinds = DATED_KINDS if kind is None else (kind,)
+        return sorted({day for kind in kinds for day in self._date_keys[kind]})
+
+    def newest_date(self, kind: Optional[str] = None) -> Optional[date]:
+        """Newest date of one dated table (or of any), None while empty"""
+        kinds = DATED_KINDS if kind is None else (kind,)
+        return max((max(self._date_keys[kind]) for kind in kinds if self._date_keys[kind]), default=None)
+
+    def to_frame(self, kind: str, dates: Optional[AbstractSet[date]] = None) -> pd.DataFrame:
+        """
+        Running statistics for one table, in the same shape as the per-poll stats.
+        For dated tables, `dates` limits the rows to those dates.
+        """
+        keys = self._keys(kind, dates)
+        if not keys:
+            return pd.DataFrame()
+        return self._stats_frame(KEY_COLUMNS[kind], keys, self._derived_rows(kind, keys), kind in PAIR_KINDS)
+
+    def _keys(self, kind: str, dates: Optional[AbstractSet[date]] = None) -> List[Tuple]:
+        """Sorted keys of a table, limited to `dates` for dated tables"""
+        if dates is not None and kind in DATED_KINDS:
+            date_keys = self._date_keys[kind]
+            keys = [key for day in dates for key in date_keys.get(day, ())]
+        else:
+            keys = list(self.tables[kind])
+        keys.sort()
+        return keys
+
+    def _derived_rows(self, kind: str, keys: List[Tuple]) -> List[DerivedRow]:
+        """Derived statistics of keys, recomputed only for keys merged into since last time"""
+        rows, stale, table = self._rows[kind], self._stale[kind], self.tables[kind]
+        for key in stale:
+            rows[key] = self._derive(table[key])
+        stale.clear()
+        return [rows[key] for key in keys]
+
+    @staticmethod
+    def _derive(stats: RunningStats) -> DerivedRow:
+        p50, p90, p99 = stats.sketch.quantiles((0.5, 0.9, 0.99))
+        # A key whose observations were all superseded has no extremes
+        minimum, maximum = (stats.minimum, stats.maximum) if stats.count else (None, None)
+        return (stats.mean, stats.total, stats.count, minimum, maximum, stats.std,
+                p50, p90, p99, stats.delayed_count, stats.on_time_percentage)
+
+    def histogram_frame(self, kind: str, dates: Optional[AbstractSet[date]] = None) -> pd.DataFrame:
+        """
+        Key columns plus one delays_<bucket> count column per histogram bucket.
+        For dated tables, `dates` limits the rows to those dates.
+        """
+        keys = self._keys(kind, dates)
+        if not keys:
+            return pd.DataFrame()
+
+        table = self.tables[kind]
+        frame = pd.DataFrame(keys, columns=KEY_COLUMNS[kind])
+        counts = pd.DataFrame([table[key].histogram for key in keys],
+                              columns=[f'delays_{label}' for label in HISTOGRAM_LABELS])
+        return pd.concat([frame, counts], axis=1)
+
+    def summarize(self, kind: str, days: int, newest: Optional[date] = None) -> pd.DataFrame:
+        """
+        Statistics of a dated table merged over the last `days` days (ending at the
+        newest date seen), keyed by the remaining key columns, e.g. per pair for 'daily'.
+        The days before the newest one are merged once and cached until one of them
+        changes, so a poll that only touched the newest day merges just that day.
+        """
+        date_keys = self._date_keys[kind]
+        if not date_keys:
+            return pd.DataFrame()
+        if newest is None:
+            newest = max(date_keys)
+        first = newest - timedelta(days=days - 1)
+
+        table = self.tables[kind]
+        merged = dict(self._summary_base(kind, days, first, newest))
+        for key in date_keys.get(newest, ()):
+            total = merged.get(key[1:])
+            if total is None:
+                merged[key[1:]] = table[key]
+            else:
+                total = merged[key[1:]] = total.copy()
+                total.merge_stats(table[key])
+        if not merged:
+            return pd.DataFrame()
+
+        keys = sorted(merged)
+        return self._stats_frame(KEY_COLUMNS[kind][1:], keys, [self._derive(merged[key]) for key in keys],
+                                 kind in PAIR_KINDS)
+
+    def _summary_base(self, kind: str, days: int, first: date, newest: date) -> Dict[Tuple, RunningStats]:
+        """Stats of first..newest - 1 merged per remaining key (cached; treat as read-only)"""
+        versions = self._date_versions[kind]
+        window = [first + timedelta(days=offset) for offset in range(days - 1)]
+        cached = self._summary_bases.get((kind, days))
+        if (cached is not None and cached[:2] == (first, newest)
+                and all(versions.get(day, 0) <= cached[2] for day in window)):
+            return cached[3]
+
+        table, date_keys = self.tables[kind], self._date_keys[kind]
+        base: Dict[Tuple, RunningStats] = {}
+        for day in window:
+            for key in date_keys.get(day, ()):
+                total = base.get(key[1:])
+                if total is None:
+                    base[key[1:]] = table[key].copy()
+                else:
+                    total.merge_stats(table[key])
+        self._summary_bases[(kind, days)] = (first, newest, self._version, base)
+        return base
+
+    def _stats_frame(self, key_columns: List[str], keys: List[Tuple], rows: List[DerivedRow],
+                     pair_keyed: bool) -> pd.DataFrame:
+        """Frame of key columns plus derived statistics (and is_relevant for pair keys)"""
+        frame = pd.DataFrame(keys, columns=key_columns)
+        columns = list(zip(*rows))
+        for name, values in zip(DERIVED_COLUMNS, columns):
+            frame[name] = list(values)
+
+        if pair_keyed:
+            # Pair tables end their keys with (from_stop, to_stop)
+            frame['is_relevant'] = [self.relevant.get(key[-2:], False) for key in keys]
+        return frame
@@ -5,25 +5,34 @@ Creates PostgreSQL database and tables for storing train delay data.
 """
 
 import os
+from datetime import date, timedelta
+from typing import List, Optional
 import psycopg2
 from psycopg2 import sql
 from dotenv import load_dotenv
+from db_pool import connect
 from oslo_region_config import OSLO_REGION_STATIONS
 
 # Load environment variables
 load_dotenv()
 
+# How many days of station_pair_delays partitions to keep created ahead of time
+PARTITION_DAYS_AHEAD = 7
+
+# Station columns, created as VARCHAR(10) by earlier versions: too short for names like
+# 'Oslo Lufthavn' or NSR IDs like 'NSR:StopPlace:337'
+STATION_COLUMNS = {
+    'stations': ['station_code'],
+    'station_pair_delays': ['from_station', 'to_station'],
+    'daily_station_stats': ['from_station', 'to_station'],
+    'hourly_station_stats': ['from_station', 'to_station'],
+}
+
 def create_database():
     """Create the train_delays database if it doesn't exist"""
     try:
         # Connect to default postgres database to create our database
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST', 'localhost'),
-            port=os.getenv('DB_PORT', '5432'),
-            user=os.getenv('DB_USER', 'postgres'),
-            password=os.getenv('DB_PASSWORD', ''),
-            database='postgres'
-        )
+        conn = connect(database='postgres')
         conn.autocommit = True
         cursor = conn.cursor()
 
@@ -56,23 +65,102 @@ def create_database():
         print(f"Error creating database: {e}")
         return False
 
+def is_partitioned(cursor, table: str) -> bool:
+    """Check whether a table is a declaratively partitioned parent"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+def partition_name(day: date) -> str:
+    """Name of the daily station_pair_delays partition holding a given day"""
+    return f"station_pair_delays_p{day:%Y%m%d}"
+
+def ensure_partitions(cursor, start: date, days_ahead: int = PARTITION_DAYS_AHEAD) -> int:
+    """
+    Create daily station_pair_delays partitions from start through today + days_ahead.
+    Existing partitions are left alone. Returns the number of partitions created.
+    """
+    end = max(start, date.today()) + timedelta(days=days_ahead)
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'station_pair_delays'
+    """)
+    existing = {row[0] for row in cursor.fetchall()}
+
+    created = 0
+    day = start
+    while day <= end:
+        name = partition_name(day)
+        if name not in existing:
+            cursor.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {} PARTITION OF station_pair_delays
+                FOR VALUES FROM (%s) TO (%s)
+            """).format(sql.Identifier(name)), (day, day + timedelta(days=1)))
+            created += 1
+        day += timedelta(days=1)
+    return created
+
+def drop_old_partitions(cursor, retention_days: int) -> List[str]:
+    """
+    Detach and drop daily partitions older than retention_days.
+    Each partition goes in O(1) metadata operations instead of a DELETE scan.
+    """
+    cutoff = partition_name(date.today() - timedelta(days=retention_days))
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'station_pair_delays'
+        ORDER BY child.relname
+    """)
+    # Partition names embed YYYYMMDD, so name order is date order
+    expired = [row[0] for row in cursor.fetchall()
+               if row[0].startswith('station_pair_delays_p') and row[0] < cutoff]
+
+    for name in expired:
+        cursor.execute(sql.SQL("ALTER TABLE station_pair_delays DETACH PARTITION {}").format(sql.Identifier(name)))
+        cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        print(f"Dropped expired partition {name}.")
+    return expired
+
+def maintain_partitions(retention_days: Optional[int] = None,
+                        days_ahead: int = PARTITION_DAYS_AHEAD) -> bool:
+    """Create upcoming partitions and apply the retention policy (for a daily cron job)"""
+    try:
+        conn = connect()
+        cursor = conn.cursor()
+
+        created = ensure_partitions(cursor, date.today(), days_ahead)
+        print(f"Created {created} new daily partitions.")
+
+        if retention_days is not None:
+            dropped = drop_old_partitions(cursor, retention_days)
+            print(f"Dropped {len(dropped)} partitions older than {retention_days} days.")
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+
+    except Exception as e:
+        print(f"Error maintaining partitions: {e}")
+        return False
+
 def create_tables():
     """Create all necessary tables for the train delay system"""
     try:
         # Connect to our database
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST', 'localhost'),
-            port=os.getenv('DB_PORT', '5432'),
-            user=os.getenv('DB_USER', 'postgres'),
-            password=os.getenv('DB_PASSWORD', ''),
-            database=os.getenv('DB_NAME', 'train_delays')
-        )
+        conn = connect()
         cursor = conn.cursor()
 
         # Create stations table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS stations (
-                station_code VARCHAR(10) PRIMARY KEY,
+                station_code VARCHAR(255) PRIMARY KEY,
                 station_name VARCHAR(255) NOT NULL,
                 latitude FLOAT,
                 longitude FLOAT,
@@ -81,28 +169,43 @@ def create_tables():
         """)
         print("Created stations table.")
 
-        # Create station_pair_delays table
+        # Create station_pair_delays table, range-partitioned by day on recorded_at
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS station_pair_delays (
-                id SERIAL PRIMARY KEY,
+                id BIGSERIAL,
                 trip_id VARCHAR(255),
                 route_id VARCHAR(255),
-                from_station VARCHAR(10),
-                to_station VARCHAR(10),
+                from_station VARCHAR(255),
+                to_station VARCHAR(255),
                 scheduled_departure TIMESTAMP,
                 actual_departure TIMESTAMP,
                 delay_minutes INTEGER,
-                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
+                recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, recorded_at)
+            ) PARTITION BY RANGE (recorded_at);
         """)
-        print("Created station_pair_delays table.")
+        if not is_partitioned(cursor, 'station_pair_delays'):
+            print("WARNING: station_pair_delays exists as a plain (unpartitioned) table.")
+            print("Rename it, rerun this script and copy the rows over to enable partitioning and retention.")
+        else:
+            # Indexes on the parent are created on every partition automatically
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_station_pair_delays_pair_time
+                ON station_pair_delays (from_station, to_station, recorded_at);
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_station_pair_delays_route_time
+                ON station_pair_delays (route_id, recorded_at);
+            """)
+            created = ensure_partitions(cursor, date.today() - timedelta(days=1), PARTITION_DAYS_AHEAD)
+            print(f"Created partitioned station_pair_delays table ({created} new daily partitions).")
 
         # Create daily_station_stats table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS daily_station_stats (
                 id SERIAL PRIMARY KEY,
-                from_station VARCHAR(10),
-                to_station VARCHAR(10),
+                from_station VARCHAR(255),
+                to_station VARCHAR(255),
                 date DATE,
                 avg_delay_minutes FLOAT,
                 total_trips INTEGER,
@@ -132,8 +235,8 @@ def create_tables():
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS hourly_station_stats (
                 id SERIAL PRIMARY KEY,
-                from_station VARCHAR(10),
-                to_station VARCHAR(10),
+                from_station VARCHAR(255),
+                to_station VARCHAR(255),
                 hour INTEGER,
                 avg_delay_minutes FLOAT,
                 total_trips INTEGER,
@@ -159,6 +262,14 @@ def create_tables():
         """)
         print("Created hourly_route_stats table.")
 
+        # Widen station columns of tables created by earlier versions (a no-op otherwise)
+        for table, columns in STATION_COLUMNS.items():
+            cursor.execute(sql.SQL("ALTER TABLE {} {}").format(
+                sql.Identifier(table),
+                sql.SQL(', ').join(sql.SQL("ALTER COLUMN {} TYPE VARCHAR(255)").format(sql.Identifier(column))
+                                   for column in columns)))
+        print("Checked station column widths.")
+
         # Insert all Oslo region stations from configuration
         stations_data = []
         for i, (station_code, station_info) in enumerate(OSLO_REGION_STATIONS.items(), 1):
@@ -190,6 +301,23 @@ def create_tables():
 
 def main():
     """Main setup function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train Delay Dashboard Database Setup')
+    parser.add_argument('--maintain', action='store_true',
+                        help='Only create upcoming partitions and apply retention (for daily cron)')
+    parser.add_argument('--retention-days', type=int, default=None,
+                        help='Drop station_pair_delays partitions older than this many days')
+    parser.add_argument('--partitions-ahead', type=int, default=PARTITION_DAYS_AHEAD,
+                        help=f'Days of partitions to create ahead of time (default: {PARTITION_DAYS_AHEAD})')
+    args = parser.parse_args()
+
+    if args.maintain:
+        print("Maintaining station_pair_delays partitions...")
+        if not maintain_partitions(args.retention_days, args.partitions_ahead):
+            print("Partition maintenance failed.")
+        return
+
     print("Setting up Train Delay Dashboard Database...")
 
     # Create database
@@ -202,6 +330,9 @@ def main():
         print("Failed to create tables. Exiting.")
         return
 
+    if args.retention_days is not None:
+        maintain_partitions(args.retention_days, args.partitions_ahead)
+
     print("Database setup completed successfully!")
     print("\nNext steps:")
     print("1. Update your .env file with database credentials")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Raw Feed Snapshot Archive
+Append-only storage of raw GTFS-RT payloads, so history can be recomputed when
+the extraction or aggregation logic changes. Each snapshot is stored as its own
+zstd frame behind a small length-prefixed header in a rolling segment file.
+Every segment has a fixed-width offset index keyed by feed timestamp, so a time
+range can be located without decompressing anything.
+"""
+
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+import numpy as np
+import zstandard
+
+# Record header: feed timestamp, fetch time (epoch seconds), compressed length
+RECORD_HEADER = struct.Struct('<qqI')
+# Index entry: feed timestamp, fetch time, byte offset of the record in the segment
+INDEX_DTYPE = np.dtype([('feed_timestamp', '<i8'), ('fetched_at', '<i8'), ('offset', '<u8')])
+
+SEGMENT_SUFFIX = '.snap'
+INDEX_SUFFIX = '.idx'
+
+class Snapshot(NamedTuple):
+    """One archived feed payload"""
+    feed_timestamp: int  # FeedHeader timestamp (fetch time if the feed had none)
+    fetched_at: int  # epoch seconds
+    content: bytes  # raw protobuf payload
+
+class SnapshotArchive:
+    """
+    Directory of rolling snapshot segments for one feed.
+    A new segment starts every UTC day and whenever the current one would grow
+    past segment_max_bytes. Segments are named segment-YYYYMMDD-NNNN.snap with a
+    matching .idx file.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 256 * 1024 * 1024, level: int = 3):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._segment: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+        self._segment_day: Optional[str] = None
+
+    def segments(self) -> List[str]:
+        """Segment paths in chronological order"""
+        if not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory))
+                if name.endswith(SEGMENT_SUFFIX)]
+
+    def append(self, content: bytes, feed_timestamp: Optional[int] = None,
+               fetched_at: Optional[int] = None):
+        """Compress and append one payload, then record it in the segment's index"""
+        fetched_at = int(fetched_at if fetched_at is not None else time.time())
+        feed_timestamp = feed_timestamp or fetched_at
+        frame = self._compressor.compress(content)
+        self._open_segment(fetched_at, RECORD_HEADER.size + len(frame))
+
+        offset = self._segment.tell()
+        self._segment.write(RECORD_HEADER.pack(feed_timestamp, fetched_at, len(frame)))
+        self._segment.write(frame)
+        self._segment.flush()
+        # The index entry is only written once the record is complete on disk
+        self._index.write(np.array([(feed_timestamp, fetched_at, offset)], dtype=INDEX_DTYPE).tobytes())
+        self._index.flush()
+
+    def _open_segment(self, fetched_at: int, record_size: int):
+        """Roll over to a new segment on a new UTC day or when the current one is full"""
+        day = datetime.fromtimestamp(fetched_at, timezone.utc).strftime('%Y%m%d')
+        if (self._segment is not None and day == self._segment_day
+                and self._segment.tell() + record_size <= self.segment_max_bytes):
+            return
+
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        existing = [path for path in self.segments()
+                    if os.path.basename(path).startswith(f"segment-{day}-")]
+        if existing and os.path.getsize(existing[-1]) + record_size <= self.segment_max_bytes:
+            path = existing[-1]  # Resume today's segment after a restart
+        else:
+            path = os.path.join(self.directory, f"segment-{day}-{len(existing):04d}{SEGMENT_SUFFIX}")
+
+        self._recover(path)
+        self._segment = open(path, 'ab')
+        self._index = open(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX, 'ab')
+        self._segment_day = day
+
+    def _recover(self, path: str):
+        """Cut a segment and its index back to the last complete record (after a crash)"""
+        index_path = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        if not os.path.exists(path):
+            return
+
+        index = self.read_index(path)
+        valid_end = 0
+        if len(index):
+            last = int(index['offset'][-1])
+            with open(path, 'rb') as f:
+                f.seek(last)
+                header = f.read(RECORD_HEADER.size)
+            if len(header) == RECORD_HEADER.size:
+                valid_end = last + RECORD_HEADER.size + RECORD_HEADER.unpack(header)[2]
+            if len(header) < RECORD_HEADER.size or valid_end > os.path.getsize(path):
+                # The last indexed record's header or payload never fully reached the disk
+                index, valid_end = index[:-1], last
+
+        if os.path.getsize(path) != valid_end:
+            print(f"Truncating incomplete snapshot segment {path} to {valid_end} bytes")
+            with open(path, 'r+b') as f:
+                f.truncate(valid_end)
+        with open(index_path, 'wb') as f:
+            f.write(index.tobytes())
+
+    @staticmethod
+    def read_index(segment_path: str) -> np.ndarray:
+        """Index entries of a segment (ignoring a torn trailing entry)"""
+        index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        if not os.path.exists(index_path):
+            return np.empty(0, dtype=INDEX_DTYPE)
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_DTYPE.itemsize
+        return np.frombuffer(data[:usable], dtype=INDEX_DTYPE)
+
+    def iter_snapshots(self, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Snapshot]:
+        """
+        Stream snapshots with start <= feed timestamp < end, in archive order.
+        Segments and records outside the range are skipped using the indexes alone.
+        """
+        for path in self.segments():
+            index = self.read_index(path)
+            if not len(index):
+                continue
+            timestamps = index['feed_timestamp']
+            selected = np.ones(len(index), dtype=bool)
+            if start is not None:
+                selected &= timestamps >= start
+            if end is not None:
+                selected &= timestamps < end
+            if not selected.any():
+                continue
+
+            with open(path, 'rb') as f:
+                for offset in index['offset'][selected].tolist():
+                    f.seek(offset)
+                    feed_timestamp, fetched_at, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                    yield Snapshot(feed_timestamp, fetched_at, self._decompressor.decompress(f.read(length)))
+
+    def close(self):
+        """Close the open segment and index files"""
+        for handle in (self._segment, self._index):
+            if handle is not None:
+                handle.close()
+        self._segment = self._index = None
+        self._segment_day = None
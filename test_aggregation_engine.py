@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Aggregation Engine Equivalence Test
+Checks that the NumPy aggregation engine (delay_aggregation) produces the same
+running statistics as the pandas groupby reference implementation, on synthetic
+feeds spread over several days (DST changes included) and on mock data.
+"""
+
+import math
+import sys
+import numpy as np
+import pandas as pd
+from data_fetcher import TrainDelayFetcher
+from delay_batch import DelayBatch, StopTimeBatch
+from feed_decode import decode_trip_updates
+from oslo_region_config import get_route_code_set
+from running_stats import KEY_COLUMNS, RunningAggregator
+from synthetic_feed import build_feed_bytes
+
+# Spread synthetic timestamps over this window, which contains the October 2025 DST change
+SPREAD_START = 1761260400  # 2025-10-24 01:00 Oslo
+SPREAD_SECONDS = 4 * 86400
+
+def spread_timestamps(delays: DelayBatch, seed: int = 0) -> DelayBatch:
+    """The batch with its timestamps spread over several local days and hours"""
+    rng = np.random.default_rng(seed)
+    timestamps = SPREAD_START + rng.integers(0, SPREAD_SECONDS, len(delays))
+    return DelayBatch(delays.stop_names, delays.route_names, delays.trip_names, delays.from_codes,
+                      delays.to_codes, delays.route_codes, delays.delay_seconds, timestamps,
+                      delays.trip_codes, delays.start_dates, delays.stop_sequences)
+
+def synthetic_poll(seed: int, trips: int = 1500) -> dict:
+    """Stop-pair, segment and dwell delays of a synthetic feed, half of its trips on Oslo region routes"""
+    stop_times: StopTimeBatch = decode_trip_updates(
+        build_feed_bytes(trips, 12, 0.5, seed, SPREAD_START), get_route_code_set(), SPREAD_START)
+    return {
+        'delays': spread_timestamps(stop_times.stop_pair_delays(), seed),
+        'segment_delays': spread_timestamps(stop_times.segment_delays(), seed + 1),
+        'dwell_delays': spread_timestamps(stop_times.dwell_delays(), seed + 2),
+    }
+
+def merged_state(engine: str, polls: list) -> RunningAggregator:
+    """Running statistics after merging every poll with the given engine"""
+    fetcher = TrainDelayFetcher(state_path=None, aggregation_engine=engine)
+    aggregator = RunningAggregator()
+    for raw_data in polls:
+        fetcher.merge_delays(raw_data['delays'], aggregator)
+        fetcher.merge_segments(raw_data.get('segment_delays') or DelayBatch.empty(),
+                               raw_data.get('dwell_delays') or DelayBatch.empty(), aggregator)
+    fetcher.close()
+    return aggregator
+
+def assert_same_state(reference: RunningAggregator, candidate: RunningAggregator):
+    """Same keys (in the same order), counts, extremes, distributions and sums up to rounding"""
+    for kind in KEY_COLUMNS:
+        expected, actual = reference.tables[kind], candidate.tables[kind]
+        assert list(expected) == list(actual), f"{kind}: keys differ"
+        for key, stats in expected.items():
+            other = actual[key]
+            assert (other.count, other.minimum, other.maximum) == (stats.count, stats.minimum, stats.maximum), \
+                f"{kind} {key}: count/min/max differ"
+            assert math.isclose(other.total, stats.total, rel_tol=1e-9, abs_tol=1e-9), f"{kind} {key}: sum differs"
+            assert math.isclose(other.sum_sq, stats.sum_sq, rel_tol=1e-9, abs_tol=1e-9), \
+                f"{kind} {key}: sum of squares differs"
+            assert other.histogram == stats.histogram, f"{kind} {key}: histogram differs"
+            assert other.sketch.bins == stats.sketch.bins, f"{kind} {key}: sketch differs"
+    assert candidate.relevant == reference.relevant, "relevance differs"
+    assert candidate.dirty_dates == reference.dirty_dates, "dirty dates differ"
+
+def test_synthetic_polls_match_pandas():
+    """Several synthetic polls merge into the same running statistics with both engines"""
+    polls = [synthetic_poll(seed) for seed in range(3)]
+    assert len(polls[0]['delays']) and len(polls[0]['segment_delays']) and len(polls[0]['dwell_delays'])
+    assert_same_state(merged_state('pandas', polls), merged_state('numpy', polls))
+
+def test_mock_data_matches_pandas():
+    """Mock polls (delays only) merge identically"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    polls = [fetcher._mock_data() for _ in range(3)]
+    fetcher.close()
+    assert_same_state(merged_state('pandas', polls), merged_state('numpy', polls))
+
+def test_local_time_matches_pandas():
+    """Local dates and hours match pandas' time zone conversion, across both DST changes"""
+    timestamps = np.concatenate([
+        np.arange(1774746000 - 7200, 1774746000 + 7200, 900),  # 2026-03-29 01:00 UTC
+        np.arange(1792890000 - 7200, 1792890000 + 7200, 900),  # 2026-10-25 01:00 UTC
+        np.arange(SPREAD_START, SPREAD_START + SPREAD_SECONDS, 1799),
+    ]).astype(np.int64)
+    delays = DelayBatch(['A', 'B'], ['R'], [''], np.zeros(len(timestamps), np.int32),
+                        np.ones(len(timestamps), np.int32), np.zeros(len(timestamps), np.int32),
+                        np.zeros(len(timestamps), np.int32), timestamps,
+                        np.zeros(len(timestamps), np.int32), np.zeros(len(timestamps), np.int32),
+                        np.zeros(len(timestamps), np.int32))
+    expected = delays.local_times()
+    actual = pd.to_datetime(delays.local_seconds(), unit='s')
+    assert (actual == expected).all(), "local times differ"
+
+def test_process_data_matches_pandas():
+    """process_data returns the same tables with both engines"""
+    raw_data = synthetic_poll(7)
+    results = {}
+    for engine in ('pandas', 'numpy'):
+        fetcher = TrainDelayFetcher(state_path=None, aggregation_engine=engine)
+        results[engine] = fetcher.process_data(raw_data)
+        fetcher.close()
+    assert list(results['pandas']) == list(results['numpy'])
+    for name, expected in results['pandas'].items():
+        pd.testing.assert_frame_equal(results['numpy'][name], expected, check_exact=False, rtol=1e-9,
+                                      obj=name)
+
+def main():
+    """Run the equivalence checks"""
+    tests = [
+        ("Synthetic Polls", test_synthetic_polls_match_pandas),
+        ("Mock Data", test_mock_data_matches_pandas),
+        ("Local Time", test_local_time_matches_pandas),
+        ("process_data Tables", test_process_data_matches_pandas),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
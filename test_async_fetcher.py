@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Concurrent Fetch Test
+Checks that feeds are fetched concurrently and decoded off the event loop, with
+304s and failures reported per feed, and that the fetcher joins per-datasource
+trip updates, vehicle positions and alerts into one poll.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import httpx
+from async_fetcher import AsyncFeedFetcher, FeedResult
+from data_fetcher import TrainDelayFetcher
+from delay_batch import StopTime, StopTimeBatch
+
+LATENCY = 0.3  # seconds every fake endpoint takes to answer
+
+def test_feeds_fetched_concurrently():
+    """Four slow feeds take about as long as one; decoding runs in the worker pool"""
+    responses = {'/a': (200, b"a"), '/b': (304, b""), '/c': (500, b""), '/d': (200, b"d")}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(LATENCY)
+        status, content = responses[request.url.path]
+        return httpx.Response(status, content=content, headers={'ETag': request.url.path})
+
+    decode_threads = []
+
+    def decode(content: bytes) -> bytes:
+        decode_threads.append(threading.current_thread().name)
+        return content.upper()
+
+    fetcher = AsyncFeedFetcher()
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    sources = {name: f"http://feeds.test/{name}" for name in 'abcd'}
+    started = time.perf_counter()
+    results = fetcher.fetch(sources, {name: decode for name in sources})
+    elapsed = time.perf_counter() - started
+    fetcher.close()
+
+    assert elapsed < 2.5 * LATENCY, f"{elapsed:.2f}s"
+    assert (results['a'].decoded, results['d'].decoded) == (b"A", b"D")
+    assert results['a'].content == b"a" and results['a'].headers['ETag'] == '/a'
+    assert results['b'].status_code == 304 and results['b'].decoded is None and results['b'].error is None
+    assert isinstance(results['c'].error, httpx.HTTPStatusError)
+    assert len(decode_threads) == 2 and all(name.startswith('feed-decode') for name in decode_threads)
+
+def stop_times(trip_id: str) -> StopTimeBatch:
+    return StopTimeBatch.from_records([
+        StopTime("Asker", "L1", trip_id, 20261016, 1, 0, 60, 60, 1792990000),
+        StopTime("Oslo S", "L1", trip_id, 20261016, 2, 1, 120, 120, 1792990000),
+    ])
+
+def test_feeds_joined_into_one_poll():
+    """Per-datasource results are summed and deduplicated; a failed datasource is only reported"""
+    def result(name, decoded=None, error=None):
+        return FeedResult(name, 200 if error is None else 0, {'ETag': name}, 10, 0.01,
+                          decoded, error, b"")
+
+    fetcher = TrainDelayFetcher(state_path=None, datasources=['VYG', 'GOA'])
+    fetcher.async_fetcher.fetch = lambda sources, decoders, headers: {
+        'trip_updates:VYG': result('trip_updates:VYG', (1000, stop_times("T1"))),
+        'trip_updates:GOA': result('trip_updates:GOA', error=RuntimeError("timeout")),
+        'vehicle_positions:VYG': result('vehicle_positions:VYG', (1000, 3)),
+        'vehicle_positions:GOA': result('vehicle_positions:GOA', (1000, 2)),
+        'alerts:VYG': result('alerts:VYG', (1000, [{'id': 'a1'}])),
+        'alerts:GOA': result('alerts:GOA', (1000, [{'id': 'a1'}, {'id': 'a2'}])),
+    }
+    raw_data = fetcher.fetch_realtime_data()
+    validators = set(fetcher._validators)
+    fetcher.close()
+
+    assert not raw_data.get('mock') and not raw_data.get('unchanged')
+    assert [(record.from_stop, record.to_stop) for record in raw_data['delays'].iter_records()] == \
+        [("Asker", "Oslo S")]
+    assert raw_data['vehicle_positions'] == 5
+    assert [alert['id'] for alert in raw_data['alerts']] == ['a1', 'a2']
+    assert 'trip_updates:GOA' not in validators and len(validators) == 5
+
+def test_all_trip_feeds_failing_falls_back():
+    """When every trip-updates feed fails, the poll falls back to mock data"""
+    fetcher = TrainDelayFetcher(state_path=None, datasources=['VYG'])
+    fetcher.async_fetcher.fetch = lambda sources, decoders, headers: {
+        name: FeedResult(name, 0, {}, 0, 0.01, None, RuntimeError("down")) for name in sources}
+    raw_data = fetcher.fetch_realtime_data()
+    fetcher.close()
+    assert raw_data.get('mock')
+    assert fetcher._validators == {}
+
+def main():
+    """Run the concurrent fetch checks"""
+    tests = [
+        ("Feeds Fetched Concurrently", test_feeds_fetched_concurrently),
+        ("Feeds Joined Into One Poll", test_feeds_joined_into_one_poll),
+        ("All Trip Feeds Failing Falls Back", test_all_trip_feeds_failing_falls_back),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Atomic Write Test
+Checks that write_atomic replaces files whole, creates missing directories and
+leaves the previous file (and no temp file) behind when a write fails.
+"""
+
+import os
+import sys
+import tempfile
+from atomic_write import write_atomic
+
+def test_replaces_file():
+    """The target holds exactly the new content, in a directory created on demand"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state', 'running_stats.json')
+        write_atomic(path, b'old')
+        write_atomic(path, b'new', durable=True)
+        with open(path, 'rb') as f:
+            assert f.read() == b'new'
+        assert os.listdir(os.path.dirname(path)) == ['running_stats.json']
+
+def test_failed_write_keeps_old_file():
+    """A write that fails midway leaves the previous content and removes its temp file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'index.json')
+        write_atomic(path, b'old')
+        try:
+            write_atomic(path, 'not bytes')  # Fails inside f.write, after the temp file was opened
+            assert False, "write did not fail"
+        except TypeError:
+            pass
+        with open(path, 'rb') as f:
+            assert f.read() == b'old'
+        assert os.listdir(tmp) == ['index.json']
+
+def main():
+    """Run the atomic write checks"""
+    tests = [
+        ("Replaces File", test_replaces_file),
+        ("Failed Write Keeps Old File", test_failed_write_keeps_old_file),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
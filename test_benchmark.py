@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark Harness Test
+Checks that synthetic feeds are reproducible and shaped as configured, that a
+benchmark run times every pipeline stage offline, and that comparing results
+flags only real regressions.
+"""
+
+import contextlib
+import io
+import sys
+from google.transit import gtfs_realtime_pb2
+from benchmark import MIN_REGRESSION_SECONDS, compare_results, run_benchmark
+from feed_decode import decode_trip_updates
+from oslo_region_config import get_route_code_set
+from synthetic_feed import build_feed, build_feed_bytes
+
+TIMESTAMP = 1792990000
+
+def test_synthetic_feed_shape():
+    """The same seed gives the same feed; trips, stops and the Oslo share follow the parameters"""
+    assert build_feed_bytes(50, seed=3, timestamp=TIMESTAMP) == build_feed_bytes(50, seed=3, timestamp=TIMESTAMP)
+    assert build_feed_bytes(50, seed=3, timestamp=TIMESTAMP) != build_feed_bytes(50, seed=4, timestamp=TIMESTAMP)
+
+    route_codes = get_route_code_set()
+    feed = build_feed(trips=2000, stops_per_trip=8, oslo_share=1.0, seed=1, timestamp=TIMESTAMP)
+    assert len(feed.entity) == 2000 and feed.header.timestamp == TIMESTAMP
+    assert all(entity.trip_update.trip.route_id in route_codes for entity in feed.entity)
+    assert all(len(entity.trip_update.stop_time_update) == 8 for entity in feed.entity)
+    # Trips report a departure but no arrival at their first stop, and the reverse at their last
+    first = [entity.trip_update.stop_time_update[0] for entity in feed.entity]
+    last = [entity.trip_update.stop_time_update[-1] for entity in feed.entity]
+    assert not any(stop.HasField('arrival') for stop in first) and all(stop.departure.delay >= 0 for stop in first)
+    assert not any(stop.HasField('departure') for stop in last)
+
+    content = build_feed_bytes(200, oslo_share=0.0, seed=1, timestamp=TIMESTAMP)
+    assert len(decode_trip_updates(content, route_codes, TIMESTAMP)) == 0
+    assert len(gtfs_realtime_pb2.FeedMessage.FromString(content).entity) == 200
+
+def test_benchmark_times_every_stage():
+    """A run times each stage `repeat` times, with no network or database"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        stages = run_benchmark(build_feed_bytes(100, seed=2), repeat=2)
+    for name in ('decode', 'extract', 'segment_delays', 'new_observations', 'process_data',
+                 'merge_delays (numpy)', 'merge_delays (pandas)', 'generate_json_files'):
+        assert name in stages, name
+    for name, stage in stages.items():
+        assert len(stage['runs']) == 2 and stage['min'] <= stage['median'], name
+
+def test_compare_flags_regressions():
+    """Slowdowns beyond the threshold are flagged unless the stage is too fast to measure"""
+    def results(**stages):
+        return {'parameters': {'trips': 100}, 'stages': {name: {'min': seconds} for name, seconds in stages.items()}}
+
+    tiny = MIN_REGRESSION_SECONDS / 4
+    baseline = results(decode=0.100, extract=0.100, tiny=tiny)
+    current = results(decode=0.105, extract=0.150, tiny=tiny * 3, new_stage=0.01)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        assert compare_results(baseline, current, threshold=0.10) == ['extract']
+    assert 'new' in output.getvalue()
+
+def main():
+    """Run the benchmark harness checks"""
+    tests = [
+        ("Synthetic Feed Shape", test_synthetic_feed_shape),
+        ("Benchmark Times Every Stage", test_benchmark_times_every_stage),
+        ("Compare Flags Regressions", test_compare_flags_regressions),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Conditional GET Test
+Checks that the trip-updates fetch sends the last processed response's ETag and
+Last-Modified back, treats HTTP 304 and an unchanged feed header timestamp as
+"unchanged" without decoding, and only remembers validators of consumed feeds.
+"""
+
+import sys
+from data_fetcher import TrainDelayFetcher
+from synthetic_feed import build_feed_bytes
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: bytes = b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class FakeSession:
+    """Answers each get() with the next queued response and records the request headers"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent_headers.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+    def close(self):
+        pass
+
+def test_conditional_fetch():
+    """Validators are sent back; 304s and repeated header timestamps skip decoding"""
+    first = build_feed_bytes(trips=100, seed=1, timestamp=1000)
+    second = build_feed_bytes(trips=100, seed=2, timestamp=1060)
+    v1 = {'ETag': '"v1"', 'Last-Modified': 'Fri, 16 Oct 2026 08:00:00 GMT'}
+    session = FakeSession([
+        FakeResponse(200, first, v1),
+        FakeResponse(304),
+        FakeResponse(200, first, {'ETag': '"v1b"'}),  # Server ignoring validators, same feed
+        FakeResponse(500),
+        FakeResponse(200, second, {'ETag': '"v2"'}),
+        FakeResponse(304),
+    ])
+    fetcher = TrainDelayFetcher(state_path=None)
+    fetcher.session = session
+    polls = [fetcher.fetch_realtime_data() for _ in range(6)]
+    fetcher.close()
+
+    assert session.sent_headers[0] == {}
+    assert len(polls[0]['delays']) > 0 and not polls[0].get('unchanged')
+    expected_v1 = {'If-None-Match': '"v1"', 'If-Modified-Since': v1['Last-Modified']}
+    assert session.sent_headers[1] == expected_v1
+    assert polls[1].get('unchanged') and len(polls[1]['delays']) == 0
+    # An unchanged header timestamp is not a new feed, so its validators are not taken either
+    assert polls[2].get('unchanged')
+    assert session.sent_headers[3] == expected_v1
+    # A failed fetch falls back to mock data and keeps the last validators
+    assert polls[3].get('mock')
+    assert session.sent_headers[4] == expected_v1
+    assert len(polls[4]['delays']) > 0 and not polls[4].get('unchanged')
+    assert session.sent_headers[5] == {'If-None-Match': '"v2"'}
+    assert fetcher.metrics.feed_not_modified.value(feed='trip_updates') == 3
+
+def main():
+    """Run the conditional GET checks"""
+    tests = [
+        ("Conditional Fetch", test_conditional_fetch),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Daemon Mode Test
+Checks that the polling daemon reuses one fetcher across polls, survives a
+failing poll, skips the ticks a slow poll overran, and stops on SIGTERM.
+"""
+
+import io
+import os
+import signal
+import sys
+import time
+from contextlib import redirect_stdout
+import data_fetcher
+from data_fetcher import TrainDelayFetcher, run_daemon
+
+INTERVAL = 0.2
+
+def test_daemon_polls_until_stopped():
+    """Polls keep coming after a failure and an overrun; SIGTERM ends the loop"""
+    calls = []
+
+    def fake_pipeline(fetcher, use_db=False, feed_file=None):
+        calls.append(fetcher)
+        if len(calls) == 1:
+            raise RuntimeError("feed down")
+        if len(calls) == 2:
+            time.sleep(3.5 * INTERVAL)  # Overruns its slot by three ticks
+        if len(calls) == 3:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    original = data_fetcher.run_pipeline
+    data_fetcher.run_pipeline = fake_pipeline
+    fetcher = TrainDelayFetcher(state_path=None)
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            run_daemon(fetcher, INTERVAL)
+    finally:
+        data_fetcher.run_pipeline = original
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        fetcher.close()
+
+    assert len(calls) == 3, len(calls)
+    assert all(call is fetcher for call in calls)
+    log = output.getvalue()
+    assert "Error during poll: feed down" in log
+    assert "skipping 3 tick(s)" in log, log
+    assert log.rstrip().endswith("Daemon stopped.")
+
+def main():
+    """Run the daemon mode checks"""
+    tests = [
+        ("Daemon Polls Until Stopped", test_daemon_polls_until_stopped),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Database Retry Test
+Runs the fetcher's raw delay writes against fake connections (no PostgreSQL
+needed) to check that a transaction retried after the server dropped the
+connection starts over: rows are copied once and partitions are created again
+on the new connection.
+"""
+
+import sys
+import psycopg2
+from data_fetcher import TrainDelayFetcher
+from db_pool import DatabasePool
+from delay_writer import DelayCopyWriter
+
+class FakeCursor:
+    """Records statements and COPY payloads; COPY drops the connection if asked to"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        self.conn.statements.append(statement)
+
+    def fetchall(self):
+        return []  # No partitions exist yet
+
+    def copy_expert(self, statement, file):
+        if self.conn.drop_on_copy:
+            self.conn.closed = 1
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.copied.append(file.read())
+
+class FakeConnection:
+    def __init__(self, drop_on_copy: bool = False):
+        self.drop_on_copy = drop_on_copy
+        self.closed = 0
+        self.statements = []
+        self.copied = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def reset_session_objects(self):
+        pass
+
+class FakePool:
+    """Hands out the given connections in order"""
+
+    def __init__(self, connections):
+        self.connections = list(connections)
+        self.returned = []
+
+    def getconn(self):
+        return self.connections.pop(0)
+
+    def putconn(self, conn, close=False):
+        self.returned.append((conn, close))
+
+    def closeall(self):
+        pass
+
+def fetcher_with(connections) -> TrainDelayFetcher:
+    """A fetcher whose database pool hands out fake connections"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    fetcher.use_database = True
+    fetcher.db_pool = DatabasePool()
+    fetcher.db_pool._pool = FakePool(connections)
+    fetcher.delay_writer = DelayCopyWriter()
+    fetcher._partitioned = True
+    return fetcher
+
+def test_retry_starts_over():
+    """After a dropped connection the retry copies each row once and recreates partitions"""
+    dropped, fresh = FakeConnection(drop_on_copy=True), FakeConnection()
+    fetcher = fetcher_with([dropped, fresh])
+    delays = fetcher._mock_data()['delays']
+    relevant = int((fetcher._pair_ids(delays) >= 0).sum())
+    assert relevant
+
+    fetcher._save_in_transaction({'delays': delays}, None)
+
+    assert dropped.statements and fresh.statements, "partitions not ensured on both attempts"
+    assert len(fresh.copied) == 1
+    assert len(fresh.copied[0].splitlines()) == relevant, "rows of the failed attempt copied again"
+    assert fresh.commits == 1 and dropped.commits == 0
+    assert fetcher.db_pool._pool.returned == [(dropped, True), (fresh, False)]
+    fetcher.close()
+
+def test_gives_up_after_retries():
+    """A second dropped connection fails the save without leaving rows buffered"""
+    fetcher = fetcher_with([FakeConnection(drop_on_copy=True), FakeConnection(drop_on_copy=True)])
+    fetcher._save_in_transaction({'delays': fetcher._mock_data()['delays']}, None)
+    assert fetcher.metrics.db_errors.value() == 1
+    assert fetcher.delay_writer.flush(None) == 0
+    assert fetcher._partitions_covered is None
+    fetcher.close()
+
+def main():
+    """Run the retry checks"""
+    tests = [
+        ("Retry Starts Over", test_retry_starts_over),
+        ("Gives Up After Retries", test_gives_up_after_retries),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Delay Batch Test
+Checks that DelayBatch keeps records intact through its dictionary-encoded
+columns: building from records, concatenating batches with different
+dictionaries, subsetting, and Norwegian local time across a DST change.
+"""
+
+import sys
+from delay_batch import DelayBatch, StopPairDelay
+
+# 2026-03-29 00:30 and 01:30 UTC, either side of the spring DST change in Oslo
+BEFORE_DST = 1774744200
+AFTER_DST = 1774747800
+
+FIRST = [
+    StopPairDelay("Asker", "Oslo S", "L1", 60, BEFORE_DST, "T1", 20260329, 1),
+    StopPairDelay("Oslo S", "Lillestrøm", "L1", 120, BEFORE_DST, "T1", 20260329, 2),
+]
+SECOND = [
+    StopPairDelay("Oslo S", "Ski", "L2", 30, AFTER_DST, "T2", 20260329, 4),
+    StopPairDelay("Asker", "Oslo S", "L1", 90, AFTER_DST, "T1", 20260329, 1),
+]
+
+def test_records_round_trip():
+    """Records come back unchanged, with each stop, route and trip stored once"""
+    batch = DelayBatch.from_records(FIRST + SECOND)
+    assert list(batch.iter_records()) == FIRST + SECOND
+    assert batch.stop_names == ["Asker", "Oslo S", "Lillestrøm", "Ski"]
+    assert batch.route_names == ["L1", "L2"]
+    assert batch.trip_names == ["T1", "T2"]
+    assert len(DelayBatch.empty()) == 0
+
+def test_concat_merges_dictionaries():
+    """Batches with their own dictionaries join into one batch with merged dictionaries"""
+    batch = DelayBatch.concat([DelayBatch.from_records(FIRST), DelayBatch.empty(),
+                               DelayBatch.from_records(SECOND)])
+    assert list(batch.iter_records()) == FIRST + SECOND
+    assert sorted(batch.stop_names) == ["Asker", "Lillestrøm", "Oslo S", "Ski"]
+
+def test_take():
+    """A mask or index array selects rows and keeps the dictionaries"""
+    batch = DelayBatch.from_records(FIRST + SECOND)
+    assert list(batch.take(batch.delay_seconds > 60).iter_records()) == [FIRST[1], SECOND[1]]
+    assert list(batch.take([2]).iter_records()) == [SECOND[0]]
+
+def test_local_time_across_dst():
+    """Local time follows the UTC offset in force at each record, with and without pandas"""
+    batch = DelayBatch.from_records(FIRST + SECOND)
+    frame = batch.to_frame()
+    assert frame['hour'].tolist() == [1, 1, 3, 3]
+    assert [str(day) for day in frame['date']] == ["2026-03-29"] * 4
+    assert (batch.local_seconds() - batch.timestamps).tolist() == [3600, 3600, 7200, 7200]
+    assert frame['from_stop'].tolist() == [record.from_stop for record in FIRST + SECOND]
+
+def main():
+    """Run the delay batch checks"""
+    tests = [
+        ("Records Round Trip", test_records_round_trip),
+        ("Concat Merges Dictionaries", test_concat_merges_dictionaries),
+        ("Take", test_take),
+        ("Local Time Across DST", test_local_time_across_dst),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
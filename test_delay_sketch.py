@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Delay Distribution Test
+Checks the quantile sketch against exact quantiles (within its relative
+accuracy), that merged sketches answer like one sketch of all delays, that the
+per-key histograms reach the exported daily shards, and that punctuality is a
+share of every observed departure, on-time ones included.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+import numpy as np
+import delay_writer
+from data_fetcher import TrainDelayFetcher
+from delay_batch import DelayBatch, StopPairDelay
+from delay_sketch import (HISTOGRAM_BUCKETS, HISTOGRAM_LABELS, RELATIVE_ACCURACY, DelaySketch,
+                          histogram_buckets, sketch_bins)
+
+# The earliest bins may be folded together (MAX_BINS), so the lowest quantiles are not checked
+QUANTILES = (0.1, 0.5, 0.9, 0.99)
+
+def sketch_of(delay_minutes: np.ndarray) -> DelaySketch:
+    sketch = DelaySketch()
+    bins, counts = np.unique(sketch_bins(delay_minutes), return_counts=True)
+    for signed_bin, count in zip(bins.tolist(), counts.tolist()):
+        sketch.add(signed_bin, count)
+    return sketch
+
+def exact_quantile(values: np.ndarray, q: float) -> float:
+    """Nearest-rank quantile, as the sketch defines it"""
+    return float(np.sort(values)[round(q * (len(values) - 1))])
+
+def test_quantiles_within_accuracy():
+    """Sketch quantiles of whole-second delays are within the relative accuracy of the exact ones"""
+    rng = np.random.default_rng(3)
+    seconds = np.concatenate([rng.exponential(240, 20000), -rng.exponential(60, 1000)]).round()
+    delays = seconds[seconds != 0] / 60
+    sketch = sketch_of(delays)
+    for q, estimate in zip(QUANTILES, sketch.quantiles(QUANTILES)):
+        exact = exact_quantile(delays, q)
+        assert abs(estimate - exact) <= RELATIVE_ACCURACY * abs(exact) + 1e-9, (q, estimate, exact)
+        assert estimate == sketch.quantile(q)
+
+def test_merge_matches_single_sketch():
+    """Merging per-poll sketches gives the same bins as sketching every delay at once"""
+    rng = np.random.default_rng(4)
+    polls = [rng.exponential(3.0, 1000) for _ in range(5)]
+    merged = DelaySketch()
+    for poll in polls:
+        merged.merge(sketch_of(poll))
+    assert merged.bins == sketch_of(np.concatenate(polls)).bins
+
+def test_bounded_bins():
+    """A sketch never holds more than MAX_BINS bins; folding keeps every count"""
+    delays = np.concatenate([-np.geomspace(0.01, 500, 400), np.geomspace(0.01, 500, 400)])
+    sketch = sketch_of(delays)
+    assert len(sketch.bins) <= 256
+    assert sum(sketch.bins.values()) == len(delays)
+    # The upper quantiles are untouched by folding the earliest bins
+    assert abs(sketch.quantile(1.0) - 500) <= RELATIVE_ACCURACY * 500
+
+def test_histograms_exported():
+    """Daily shards carry per-pair and per-route histogram counts"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    raw_data = fetcher._mock_data()
+    raw_data.pop('mock')  # Export like a real poll
+    delays = raw_data['delays']
+    with tempfile.TemporaryDirectory() as output_dir:
+        fetcher.generate_json_files(fetcher.process_data(raw_data), output_dir)
+        with open(os.path.join(output_dir, 'index.json')) as f:
+            latest = json.load(f)['latest_date']
+        with open(os.path.join(output_dir, f'daily/{latest}.json')) as f:
+            shard = json.load(f)
+    fetcher.close()
+
+    columns = [f'delays_{label}' for label in HISTOGRAM_LABELS]
+    pairs = shard['station_pair_histograms']
+    assert len(pairs) == len(shard['station_pairs'])
+    expected = np.bincount(histogram_buckets(delays.delay_seconds / 60), minlength=HISTOGRAM_BUCKETS)
+    assert [sum(row[column] for row in pairs) for column in columns] == expected.tolist()
+    assert sum(row[column] for row in shard['route_histograms'] for column in columns) == len(delays)
+
+def test_punctuality_over_all_departures():
+    """Nine on-time departures and one 5 minutes late: 10% delayed, p50 on time, with either engine"""
+    noon = int(datetime.fromisoformat('2026-10-16 12:00:00+02:00').timestamp())
+    delays = DelayBatch.from_records(StopPairDelay("Asker", "Oslo S", "L1", 300 if trip == 0 else 0, noon,
+                                                   f"T{trip}", 20261016, 1) for trip in range(10))
+    upserted = {}
+    copy_upsert = delay_writer.copy_upsert
+    delay_writer.copy_upsert = lambda conn, table, columns, rows, conflict_columns: \
+        len(upserted.setdefault(table, [dict(zip(columns, row)) for row in rows]))
+    try:
+        for engine in ('numpy', 'pandas'):
+            fetcher = TrainDelayFetcher(state_path=None, aggregation_engine=engine)
+            stats = fetcher.process_data({'delays': delays})
+            fetcher._write_stats(None, stats)
+            fetcher.close()
+
+            daily = stats['daily_stats'].iloc[0]
+            assert (daily['delay_count'], daily['delayed_count']) == (10, 1), engine
+            assert daily['on_time_percentage'] == 90.0 and daily['avg_delay_minutes'] == 0.5, engine
+            assert daily['p50_delay_minutes'] == 0.0 and daily['p99_delay_minutes'] > 4, engine
+            assert stats['route_stats'].iloc[0]['on_time_percentage'] == 90.0, engine
+            # Only the late departure is a raw delay record
+            assert len(stats['station_delays']) == 1, engine
+            for table in ('daily_station_stats', 'daily_route_stats'):
+                row = upserted.pop(table)[0]
+                assert (row['total_trips'], row['delayed_trips']) == (10, 1), (engine, table)
+                assert abs(row['delay_percentage'] - 10.0) < 1e-9, (engine, table)
+    finally:
+        delay_writer.copy_upsert = copy_upsert
+
+def main():
+    """Run the delay distribution checks"""
+    tests = [
+        ("Quantile Accuracy", test_quantiles_within_accuracy),
+        ("Merge", test_merge_matches_single_sketch),
+        ("Bounded Bins", test_bounded_bins),
+        ("Histograms Exported", test_histograms_exported),
+        ("Punctuality Over All Departures", test_punctuality_over_all_departures),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
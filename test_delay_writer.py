@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Bulk Ingestion Test
+Runs the COPY writers against a fake connection (no PostgreSQL needed): raw
+delays are buffered as CSV and flushed at the row threshold, and aggregate
+upserts stage rows with COPY, creating the staging table and merge statement
+once per pooled session and emptying it before every poll, also after a rollback.
+"""
+
+import sys
+from psycopg2 import sql
+from db_pool import PoolConnection
+from delay_batch import DelayBatch, StopPairDelay
+from delay_writer import DelayCopyWriter, copy_upsert
+
+TIMESTAMP = 1792138800  # 2026-10-16 10:20 Oslo
+
+def text(statement) -> str:
+    """Statement as SQL text, without needing a server connection to quote identifiers"""
+    if isinstance(statement, sql.Composed):
+        return ''.join(text(part) for part in statement.seq)
+    if isinstance(statement, sql.Identifier):
+        return '.'.join(f'"{name}"' for name in statement.strings)
+    if isinstance(statement, sql.SQL):
+        return statement.string
+    return statement
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        self.conn.statements.append(text(statement))
+        if self.conn.statements[-1].startswith('TRUNCATE'):
+            self.conn.staged.clear()
+        elif self.conn.statements[-1].startswith('EXECUTE'):
+            self.conn.merged.append(list(self.conn.staged))
+
+    def copy_expert(self, statement, file):
+        self.conn.statements.append(text(statement))
+        self.conn.copied.append(file.read())
+        self.conn.staged.extend(self.conn.copied[-1].splitlines())
+
+class FakeConnection:
+    """Records statements; the staging table's rows survive like a session temp table's"""
+    closed = False
+    reset_session_objects = PoolConnection.reset_session_objects
+
+    def __init__(self, pooled: bool = False):
+        self.statements = []
+        self.copied = []
+        self.staged = []
+        self.merged = []
+        if pooled:
+            self.session_objects = set()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+def delays(*rows) -> DelayBatch:
+    return DelayBatch.from_records(StopPairDelay(from_stop, to_stop, "L1", delay, TIMESTAMP, trip_id)
+                                   for trip_id, from_stop, to_stop, delay in rows)
+
+def test_raw_delays_copied_in_chunks():
+    """Rows are flushed once max_rows are buffered, and the rest on flush()"""
+    conn = FakeConnection()
+    writer = DelayCopyWriter(max_rows=3)
+    writer.add(conn, delays(("T1", "Asker", "Oslo S", 60), ("T1", "Oslo S", "Lillestrøm", 150)))
+    assert conn.copied == []
+    writer.add(conn, delays(("T2", "Ski", "Oslo S", 600), ("T3", "Drammen", "Oslo S", 30)))
+    assert len(conn.copied) == 1
+    writer.add(conn, delays(("T4", "Oslo S", "Ski", 120)))
+    assert writer.flush(conn) == 1
+    assert writer.flush(conn) == 0
+    assert writer.rows_written == 5
+
+    assert conn.statements[0] == ('COPY station_pair_delays ("trip_id", "route_id", "from_station", '
+                                  '"to_station", "scheduled_departure", "actual_departure", '
+                                  '"delay_minutes", "recorded_at") FROM STDIN WITH (FORMAT csv)')
+    assert conn.copied[0].splitlines() == [
+        "T1,L1,Asker,Oslo S,,,1,2026-10-16 10:20:00",
+        "T1,L1,Oslo S,Lillestrøm,,,2,2026-10-16 10:20:00",
+        "T2,L1,Ski,Oslo S,,,10,2026-10-16 10:20:00",
+        "T3,L1,Drammen,Oslo S,,,0,2026-10-16 10:20:00",
+    ]
+    assert conn.copied[1] == "T4,L1,Oslo S,Ski,,,2,2026-10-16 10:20:00\n"
+
+def test_discard_drops_buffer():
+    """Discarded rows are never copied"""
+    conn = FakeConnection()
+    writer = DelayCopyWriter()
+    writer.add(conn, delays(("T1", "Asker", "Oslo S", 60)))
+    writer.discard()
+    assert writer.flush(conn) == 0 and conn.copied == []
+
+def test_upsert_plain_connection():
+    """Without session tracking, rows are staged in a temp table dropped on commit"""
+    conn = FakeConnection()
+    count = copy_upsert(conn, 'daily_station_stats', ['from_station', 'to_station', 'avg_delay'],
+                        [("Asker", "Oslo S", 1.5), ("Ski", "Oslo S", 2.0)], ['from_station', 'to_station'])
+    assert count == 2
+    assert conn.statements == [
+        'CREATE TEMP TABLE "staging_daily_station_stats" (LIKE "daily_station_stats" INCLUDING DEFAULTS) '
+        'ON COMMIT DROP',
+        'COPY "staging_daily_station_stats" ("from_station", "to_station", "avg_delay") FROM STDIN '
+        'WITH (FORMAT csv)',
+        'INSERT INTO "daily_station_stats" ("from_station", "to_station", "avg_delay") '
+        'SELECT "from_station", "to_station", "avg_delay" FROM "staging_daily_station_stats" '
+        'ON CONFLICT ("from_station", "to_station") DO UPDATE SET "avg_delay" = EXCLUDED."avg_delay"',
+    ]
+    assert conn.copied == ["Asker,Oslo S,1.5\nSki,Oslo S,2.0\n"]
+
+def test_upsert_reuses_session_objects():
+    """On a pooled session the staging table is created and the merge PREPAREd only once"""
+    conn = FakeConnection(pooled=True)
+    for _ in range(2):
+        copy_upsert(conn, 'route_stats', ['route_id', 'avg_delay'], [("L1", 1.0)], ['route_id'])
+    assert copy_upsert(conn, 'route_stats', ['route_id', 'avg_delay'], [], ['route_id']) == 0
+    kinds = [statement.split(' (')[0].split(' AS ')[0] for statement in conn.statements]
+    assert kinds == [
+        'CREATE TEMP TABLE IF NOT EXISTS "staging_route_stats"',
+        'PREPARE "merge_route_stats"',
+        'TRUNCATE "staging_route_stats"',
+        'COPY "staging_route_stats"',
+        'EXECUTE "merge_route_stats"',
+        'TRUNCATE "staging_route_stats"',
+        'COPY "staging_route_stats"',
+        'EXECUTE "merge_route_stats"',
+    ]
+    assert conn.session_objects == {"staging_route_stats", "merge_route_stats"}
+
+def test_upsert_after_rollback():
+    """After a rollback resets the session, the surviving staging table is emptied before the COPY"""
+    conn = FakeConnection(pooled=True)
+    copy_upsert(conn, 'route_stats', ['route_id', 'avg_delay'], [("L1", 1.0)], ['route_id'])
+    conn.reset_session_objects()  # What DatabasePool.transaction does on a rollback
+    assert conn.statements[-1] == 'DEALLOCATE ALL' and conn.session_objects == set()
+    copy_upsert(conn, 'route_stats', ['route_id', 'avg_delay'], [("L1", 2.0), ("L2", 3.0)], ['route_id'])
+    assert conn.merged == [["L1,1.0"], ["L1,2.0", "L2,3.0"]]
+    assert conn.statements[-4].startswith('PREPARE "merge_route_stats"')
+
+def main():
+    """Run the bulk ingestion checks"""
+    tests = [
+        ("Raw Delays Copied In Chunks", test_raw_delays_copied_in_chunks),
+        ("Discard Drops Buffer", test_discard_drops_buffer),
+        ("Upsert On Plain Connection", test_upsert_plain_connection),
+        ("Upsert Reuses Session Objects", test_upsert_reuses_session_objects),
+        ("Upsert After Rollback", test_upsert_after_rollback),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Feed Decoding Test
+Checks the stop times extracted from a hand-built feed (other routes, short
+trips and non-trip entities skipped), that a feed split at the wire level into
+entity chunks decodes on a process pool to the same stop times as a whole-feed
+parse, and that the fetcher's feed decoder is created once even when several
+threads ask for it at the same time.
+"""
+
+import sys
+import threading
+import time
+from google.transit import gtfs_realtime_pb2
+import feed_decode
+from data_fetcher import TrainDelayFetcher
+from delay_batch import MISSING_DELAY, StopTime
+from feed_decode import ParallelFeedDecoder, decode_trip_updates, extract_stop_times
+from gtfs_wire import read_feed_header, split_feed
+from oslo_region_config import get_route_code_set
+from synthetic_feed import build_feed_bytes
+
+DEFAULT_TIMESTAMP = 1792990000
+
+def hand_built_feed() -> gtfs_realtime_pb2.FeedMessage:
+    """Trips on L1 (kept), R99 (another route) and a one-stop L1 trip, plus a vehicle entity"""
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = DEFAULT_TIMESTAMP
+
+    def trip(entity_id, route_id, trip_id, stops, timestamp=0):
+        trip_update = feed.entity.add(id=entity_id).trip_update
+        trip_update.trip.route_id = route_id
+        trip_update.trip.trip_id = trip_id
+        trip_update.trip.start_date = "20261016"
+        if timestamp:
+            trip_update.timestamp = timestamp
+        for stop_id, sequence, arrival, departure in stops:
+            update = trip_update.stop_time_update.add(stop_id=stop_id)
+            if sequence is not None:
+                update.stop_sequence = sequence
+            if arrival is not None:
+                update.arrival.delay = arrival
+            if departure is not None:
+                update.departure.delay = departure
+
+    trip("1", "L1", "T1", [("A", 3, None, 60), ("B", 5, 120, 180), ("C", None, None, None)], 1792990100)
+    trip("2", "R99", "T2", [("A", 1, 30, 30), ("B", 2, 60, 60)])
+    trip("3", "L1", "T3", [("A", 1, 30, 30)])
+    vehicle = feed.entity.add(id="4").vehicle
+    vehicle.trip.route_id = "L1"
+    trip("5", "L1", "T5", [("B", 1, 0, 0), ("A", 2, 0, None)])
+    return feed
+
+EXPECTED = [
+    StopTime("A", "L1", "T1", 20261016, 3, 0, MISSING_DELAY, 60, 1792990100),
+    StopTime("B", "L1", "T1", 20261016, 5, 1, 120, 180, 1792990100),
+    StopTime("C", "L1", "T1", 20261016, 2, 2, MISSING_DELAY, MISSING_DELAY, 1792990100),
+    StopTime("B", "L1", "T5", 20261016, 1, 0, 0, 0, DEFAULT_TIMESTAMP),
+    StopTime("A", "L1", "T5", 20261016, 2, 1, 0, MISSING_DELAY, DEFAULT_TIMESTAMP),
+]
+
+def test_extract_stop_times():
+    """Only multi-stop trips on the wanted routes come out, with missing delays and sequences filled in"""
+    records = list(extract_stop_times(hand_built_feed(), frozenset({"L1"}), DEFAULT_TIMESTAMP))
+    assert records == EXPECTED, records
+
+def test_decode_trip_updates():
+    """Decoding the serialized feed gives the same stop times as columns"""
+    content = hand_built_feed().SerializeToString()
+    batch = decode_trip_updates(content, frozenset({"L1"}), DEFAULT_TIMESTAMP)
+    assert [batch.stop_names[code] for code in batch.stop_codes] == [record.stop_id for record in EXPECTED]
+    assert [batch.trip_names[code] for code in batch.trip_codes] == [record.trip_id for record in EXPECTED]
+    assert batch.positions.tolist() == [record.position for record in EXPECTED]
+    assert batch.arrival_delays.tolist() == [record.arrival_delay for record in EXPECTED]
+    assert batch.departure_delays.tolist() == [record.departure_delay for record in EXPECTED]
+
+def columns(batch) -> tuple:
+    """A batch's stop times as plain lists, independent of dictionary order"""
+    return ([batch.stop_names[code] for code in batch.stop_codes],
+            [batch.trip_names[code] for code in batch.trip_codes],
+            batch.positions.tolist(), batch.arrival_delays.tolist(),
+            batch.departure_delays.tolist(), batch.timestamps.tolist())
+
+def test_split_feed():
+    """Parts are valid feeds with the header and the entities in order, of similar size"""
+    content = build_feed_bytes(trips=300, seed=5, timestamp=DEFAULT_TIMESTAMP)
+    feed = gtfs_realtime_pb2.FeedMessage.FromString(content)
+    parts = split_feed(content, 4)
+    assert len(parts) == 4
+    entity_ids = []
+    for part in parts:
+        assert read_feed_header(part).timestamp == DEFAULT_TIMESTAMP
+        entity_ids += [entity.id for entity in gtfs_realtime_pb2.FeedMessage.FromString(part).entity]
+    assert entity_ids == [entity.id for entity in feed.entity]
+    sizes = [len(part) for part in parts]
+    assert max(sizes) < 2 * min(sizes), sizes
+    assert split_feed(content, 1) == [content]
+    try:
+        split_feed(content[:-3], 4)
+        assert False, "truncated feed was split"
+    except ValueError:
+        pass
+
+def test_parallel_decode_matches_whole_feed():
+    """Decoding entity chunks on a process pool gives the whole-feed stop times, in order"""
+    route_codes = get_route_code_set()
+    feeds = [build_feed_bytes(trips=300, seed=seed, timestamp=DEFAULT_TIMESTAMP) for seed in (6, 7)]
+    decoder = ParallelFeedDecoder(workers=2, min_parallel_bytes=0)
+    try:
+        parallel = decoder.decode(feeds[0], route_codes, DEFAULT_TIMESTAMP)
+        many = list(decoder.decode_many(((feed, DEFAULT_TIMESTAMP) for feed in feeds), route_codes))
+    finally:
+        decoder.close()
+    whole = [decode_trip_updates(feed, route_codes, DEFAULT_TIMESTAMP) for feed in feeds]
+    assert len(whole[0]) > 0
+    assert columns(parallel) == columns(whole[0])
+    assert [columns(batch) for batch in many] == [columns(batch) for batch in whole]
+
+def test_feed_decoder_created_once():
+    """Concurrent first uses of feed_decoder share one decoder"""
+    created = []
+
+    class SlowDecoder(feed_decode.ParallelFeedDecoder):
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)  # Widen the window between the check and the assignment
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    original = feed_decode.ParallelFeedDecoder
+    feed_decode.ParallelFeedDecoder = SlowDecoder
+    try:
+        fetcher = TrainDelayFetcher(state_path=None, decode_workers=1)
+        decoders = []
+        threads = [threading.Thread(target=lambda: decoders.append(fetcher.feed_decoder)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        fetcher.close()
+    finally:
+        feed_decode.ParallelFeedDecoder = original
+
+    assert len(created) == 1, f"{len(created)} decoders created"
+    assert all(decoder is created[0] for decoder in decoders)
+
+def main():
+    """Run the feed decoding checks"""
+    tests = [
+        ("Extract Stop Times", test_extract_stop_times),
+        ("Decode Trip Updates", test_decode_trip_updates),
+        ("Split Feed", test_split_feed),
+        ("Parallel Decode Matches Whole Feed", test_parallel_decode_matches_whole_feed),
+        ("Feed Decoder Created Once", test_feed_decoder_created_once),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
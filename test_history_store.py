@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+History Store Test
+Checks that delays appended to the local history come back from time-range,
+stop-pair and route queries exactly as a brute-force filter would return them,
+that shards outside the range are skipped using the index alone, and that a
+reopened store repairs an index left behind by an interrupted append.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+from delay_batch import DelayBatch, StopPairDelay
+from history_store import RECORD_DTYPE, HistoryStore
+
+DAY = 86400
+START = 1792108800  # 2026-10-16 02:00 Oslo
+PAIRS = [("Asker", "Oslo S", "L1"), ("Oslo S", "Lillestrøm", "L1"), ("Ski", "Oslo S", "L2"),
+         ("Oslo S", "Asker", "L1")]
+
+def records(seed: int, count: int) -> list:
+    """Delays on random pairs over three local days"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for pair, offset, delay in zip(rng.integers(0, len(PAIRS), count).tolist(),
+                                   rng.integers(0, 3 * DAY - 7200, count).tolist(),
+                                   rng.integers(-60, 900, count).tolist()):
+        from_stop, to_stop, route_id = PAIRS[pair]
+        rows.append(StopPairDelay(from_stop, to_stop, route_id, delay, START + offset))
+    return rows
+
+def expected(rows: list, start=None, end=None, from_stop=None, to_stop=None, route_id=None) -> list:
+    return sorted((row.timestamp, row.route_id, row.from_stop, row.to_stop, row.delay_seconds) for row in rows
+                  if (start is None or row.timestamp >= start) and (end is None or row.timestamp < end)
+                  and from_stop in (None, row.from_stop) and to_stop in (None, row.to_stop)
+                  and route_id in (None, row.route_id))
+
+def decoded(store: HistoryStore, result: np.ndarray) -> list:
+    frame = store.to_frame(result)
+    return sorted(zip(result['timestamp'].tolist(), frame['route_id'], frame['from_stop'],
+                      frame['to_stop'], frame['delay_seconds'].tolist()))
+
+def test_queries_match_brute_force():
+    """Range, pair and route queries return exactly the matching rows after a reopen"""
+    first, second = records(1, 500), records(2, 500)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(tmp)
+        # The second batch brings a route and stops in a new dictionary order
+        assert store.append(DelayBatch.from_records(first)) == 500
+        assert store.append(DelayBatch.from_records(second[::-1])) == 500
+        store = HistoryStore(tmp)
+        rows = first + second
+
+        assert len(store.index) == 3
+        assert decoded(store, store.query()) == expected(rows)
+        window = (START + DAY // 2, START + DAY + 3600)
+        assert decoded(store, store.query(*window)) == expected(rows, *window)
+        assert decoded(store, store.query(*window, "Asker", "Oslo S")) == \
+            expected(rows, *window, "Asker", "Oslo S")
+        assert decoded(store, store.query(route_id="L2")) == expected(rows, route_id="L2")
+        assert len(store.query(from_stop="Drammen")) == 0
+        assert decoded(store, store.pair_history("Oslo S", "Asker", days=1, now=START + 3 * DAY)) == \
+            expected(rows, START + 2 * DAY, None, "Oslo S", "Asker")
+
+def test_shards_skipped_by_index():
+    """A range inside one day maps only that day's shard"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(tmp)
+        store.append(DelayBatch.from_records(records(3, 300)))
+        days = [day for day, _ in store.iter_shards(START + DAY + 3600, START + DAY + 7200)]
+        assert days == ['20261017'], days
+
+def test_interrupted_append_repaired():
+    """Rows written after the index was saved are indexed on reopen; a torn row is dropped"""
+    rows = records(4, 100)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(tmp)
+        store.append(DelayBatch.from_records(rows[:50]))
+        index_path = os.path.join(tmp, 'index.json')
+        with open(index_path, 'rb') as f:
+            stale_index = f.read()
+        store.append(DelayBatch.from_records(rows[50:]))
+        with open(index_path, 'wb') as f:
+            f.write(stale_index)  # As if the process died before saving the index
+        shard = os.path.join(tmp, sorted(name for name in os.listdir(tmp) if name.endswith('.bin'))[0])
+        with open(shard, 'ab') as f:
+            f.write(b"\x00" * (RECORD_DTYPE.itemsize // 2))
+
+        store = HistoryStore(tmp)
+        assert decoded(store, store.query()) == expected(rows)
+        store.append(DelayBatch.from_records(rows[:1]))
+        assert decoded(store, HistoryStore(tmp).query()) == expected(rows + rows[:1])
+
+def main():
+    """Run the history store checks"""
+    tests = [
+        ("Queries Match Brute Force", test_queries_match_brute_force),
+        ("Shards Skipped By Index", test_shards_skipped_by_index),
+        ("Interrupted Append Repaired", test_interrupted_append_repaired),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
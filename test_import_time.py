@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Import Time Budget Test
+Checks that importing data_fetcher stays cheap: modules only some runs need are
+not imported at startup, and the import (measured with python -X importtime)
+costs little more than pandas and NumPy themselves, which every processing run needs.
+"""
+
+import os
+import subprocess
+import sys
+
+# Imported by data_fetcher only on the code paths that use them
+LAZY_MODULES = [
+    'requests',  # synchronous trip-updates fetch
+    'google.protobuf',  # feed decoding
+    'httpx', 'asyncio',  # --all-feeds
+    'psycopg2', 'dotenv',  # --use-db
+    'zstandard',  # --archive-dir / --replay
+    'cProfile', 'tracemalloc',  # --profile
+    'http.server',  # --metrics-port
+]
+
+# data_fetcher may take at most this many times as long to import as pandas + NumPy
+IMPORT_TIME_BUDGET_RATIO = 1.25
+RUNS = 3
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True, cwd=PACKAGE_DIR)
+
+def import_time_us(statement: str, module: str) -> int:
+    """Best-of-RUNS cumulative import time (microseconds) of module while running statement"""
+    timings = []
+    for _ in range(RUNS):
+        stderr = _python('-X', 'importtime', '-c', statement).stderr
+        for line in stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                timings.append(int(fields[1]))
+                break
+    assert timings, f"{module} not found in -X importtime output"
+    return min(timings)
+
+def test_lazy_modules_not_imported():
+    """Importing data_fetcher doesn't import modules only some runs need"""
+    output = _python('-c', f"import sys, data_fetcher; "
+                           f"print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))").stdout
+    imported = output.split()
+    assert not imported, f"data_fetcher imports {', '.join(imported)} at startup"
+
+def test_import_time_budget():
+    """data_fetcher's import time stays within budget of pandas + NumPy's"""
+    baseline = import_time_us('import pandas, numpy', 'pandas')
+    total = import_time_us('import data_fetcher', 'data_fetcher')
+    print(f"pandas + NumPy: {baseline / 1000:.1f} ms, data_fetcher: {total / 1000:.1f} ms "
+          f"({total / baseline:.2f}x, budget {IMPORT_TIME_BUDGET_RATIO}x)")
+    assert total <= baseline * IMPORT_TIME_BUDGET_RATIO, (
+        f"data_fetcher import takes {total / baseline:.2f}x as long as pandas + NumPy "
+        f"(budget {IMPORT_TIME_BUDGET_RATIO}x); run python -X importtime -c 'import data_fetcher'")
+
+def main():
+    """Run the import time checks"""
+    tests = [
+        ("Lazy Modules", test_lazy_modules_not_imported),
+        ("Import Time Budget", test_import_time_budget),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
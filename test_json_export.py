@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+JSON Export Test
+Checks that exported files are compact, rewritten only when their content
+changed (also across exporter instances, through manifest.json), that the
+manifest records the hash and size of every file, that the .gz/.br siblings
+decompress to the file, that the columnar layout decodes back to the table, and
+that polls only rewrite the date shards they touched, with index.json listing
+the retained dates.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+import pandas as pd
+from data_fetcher import TrainDelayFetcher
+from delay_batch import LOCAL_TIMEZONE, DelayBatch, StopPairDelay
+from json_export import MANIFEST_NAME, JsonExporter, brotli, frame_columns, frame_records
+from running_stats import RunningAggregator
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_unchanged_files_skipped():
+    """Identical content is not rewritten, also by a later exporter; changed content is"""
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = JsonExporter(tmp, compress=False)
+        assert exporter.export('a.json', {'x': [1, 2]})
+        assert exporter.export('b.json', {'y': None})
+        assert exporter.finish() == 2
+        assert read(os.path.join(tmp, 'a.json')) == b'{"x":[1,2]}'
+
+        exporter = JsonExporter(tmp, compress=False)
+        assert not exporter.export('a.json', {'x': [1, 2]})
+        assert exporter.export('b.json', {'y': 3})
+        assert exporter.changed == ['b.json']
+        assert exporter.finish() == 1
+        manifest_mtime = os.stat(os.path.join(tmp, MANIFEST_NAME)).st_mtime_ns
+
+        exporter = JsonExporter(tmp, compress=False)
+        assert not exporter.export('a.json', {'x': [1, 2]})
+        assert exporter.finish() == 0
+        # Nothing changed, so the manifest was left alone
+        assert os.stat(os.path.join(tmp, MANIFEST_NAME)).st_mtime_ns == manifest_mtime
+        assert sorted(os.listdir(tmp)) == ['a.json', 'b.json', MANIFEST_NAME]
+
+def test_manifest_lists_files():
+    """The manifest has the sha256 and size of every exported file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = JsonExporter(tmp, compress=False)
+        exporter.export('daily/2026-10-16.json', {'date': '2026-10-16'})
+        exporter.export('index.json', {'dates': ['2026-10-16']})
+        exporter.finish()
+        files = json.loads(read(os.path.join(tmp, MANIFEST_NAME)))['files']
+        assert sorted(files) == ['daily/2026-10-16.json', 'index.json']
+        for name, entry in files.items():
+            content = read(os.path.join(tmp, name))
+            assert entry['sha256'] == hashlib.sha256(content).hexdigest()
+            assert entry['bytes'] == len(content)
+
+def test_frame_records():
+    """Row objects with formatted timestamps and null for missing values"""
+    frame = pd.DataFrame({'from_stop': ['Asker', 'Ski'], 'avg_delay': [1.5, float('nan')],
+                          'timestamp': pd.to_datetime(['2026-10-16 08:00:00', '2026-10-16 09:30:15'])})
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = JsonExporter(tmp, compress=False)
+        exporter.export_frame('frame.json', frame)
+        assert json.loads(read(os.path.join(tmp, 'frame.json'))) == [
+            {'from_stop': 'Asker', 'avg_delay': 1.5, 'timestamp': '2026-10-16T08:00:00'},
+            {'from_stop': 'Ski', 'avg_delay': None, 'timestamp': '2026-10-16T09:30:15'},
+        ]
+    assert frame_records(frame.iloc[:0]) == []
+
+def test_compressed_siblings():
+    """Every file gets .gz and .br siblings of its content; a missing sibling forces a rewrite"""
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = JsonExporter(tmp)
+        exporter.export('a.json', {'stations': ['Asker', 'Oslo S'] * 100})
+        exporter.finish()
+        path = os.path.join(tmp, 'a.json')
+        content = read(path)
+        assert gzip.decompress(read(f"{path}.gz")) == content
+        entry = json.loads(read(os.path.join(tmp, MANIFEST_NAME)))['files']['a.json']
+        assert entry['gzip_bytes'] == os.path.getsize(f"{path}.gz") < len(content)
+        if brotli is not None:  # Optional dependency
+            assert brotli.decompress(read(f"{path}.br")) == content
+            assert entry['brotli_bytes'] == os.path.getsize(f"{path}.br") < len(content)
+
+        # Same content gives a byte-identical .gz (no timestamp in the header)
+        gz = read(f"{path}.gz")
+        os.remove(f"{path}.gz")
+        exporter = JsonExporter(tmp)
+        assert exporter.export('a.json', {'stations': ['Asker', 'Oslo S'] * 100})
+        assert read(f"{path}.gz") == gz
+
+        exporter.remove('a.json')
+        exporter.finish()
+        assert sorted(os.listdir(tmp)) == [MANIFEST_NAME]
+        assert json.loads(read(os.path.join(tmp, MANIFEST_NAME)))['files'] == {}
+
+def test_columnar_layout():
+    """Columns decode back to the rows; from_stop and to_stop share the stations dictionary"""
+    frame = pd.DataFrame({
+        'date': [date(2026, 10, 16), date(2026, 10, 16), date(2026, 10, 17)],
+        'from_stop': ['Asker', 'Oslo S', 'Ski'],
+        'to_stop': ['Oslo S', 'Asker', 'Oslo S'],
+        'delay_count': [3, 1, 2],
+        'is_relevant': [True, True, False],
+    })
+    layout = json.loads(json.dumps(frame_columns(frame), default=lambda array: array.tolist()))
+    assert layout['length'] == 3
+    assert layout['encoding'] == {'date': 'date', 'from_stop': 'stations', 'to_stop': 'stations'}
+    assert layout['dictionaries']['stations'] == ['Asker', 'Oslo S', 'Ski']
+    assert layout['dictionaries']['date'] == ['2026-10-16', '2026-10-17']
+    decoded = {name: [layout['dictionaries'][layout['encoding'][name]][code] for code in values]
+               if name in layout['encoding'] else values
+               for name, values in layout['columns'].items()}
+    assert decoded == {**frame.to_dict('list'), 'date': ['2026-10-16', '2026-10-16', '2026-10-17']}
+
+def noon(day: int) -> int:
+    """Epoch seconds of 12:00 Oslo time on 2026-10-<day>"""
+    return int(datetime(2026, 10, day, 12, tzinfo=ZoneInfo(LOCAL_TIMEZONE)).timestamp())
+
+def poll(fetcher: TrainDelayFetcher, output_dir: str, name: str, days: list):
+    """Process and export one poll with a delay on Asker -> Oslo S at noon of every day"""
+    delays = DelayBatch.from_records(StopPairDelay("Asker", "Oslo S", "L1", 120, noon(day), f"{name}-{day}")
+                                     for day in days)
+    fetcher.generate_json_files(fetcher.process_data({'delays': delays}), output_dir)
+
+def test_date_shards():
+    """Polls rewrite only the shards of the dates they touched; expired dates are removed"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    fetcher.aggregator = RunningAggregator(retention_days=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        def load(name: str):
+            return json.loads(read(os.path.join(tmp, name)))
+
+        def mtime(name: str) -> int:
+            return os.stat(os.path.join(tmp, name)).st_mtime_ns
+
+        poll(fetcher, tmp, 'first', [1, 2])
+        index = load('index.json')
+        assert index['dates'] == ['2026-10-01', '2026-10-02'] and index['latest_date'] == '2026-10-02'
+        assert index['daily'] == 'daily/{date}.json' and index['hourly'] == 'hourly/{date}.json'
+        assert [row['date'] for row in load('daily_stats.json')] == ['2026-10-02']
+        assert load('summary_7d.json')['end_date'] == '2026-10-02'
+        assert sum(row['delay_count'] for row in load('summary_7d.json')['station_pairs']) == 2
+        untouched = {name: mtime(name) for name in ('daily/2026-10-01.json', 'hourly/2026-10-01.json', 'index.json')}
+
+        poll(fetcher, tmp, 'second', [2])
+        assert {name: mtime(name) for name in untouched} == untouched
+        shard = load('daily/2026-10-02.json')
+        assert shard['date'] == '2026-10-02'
+        assert [(row['from_stop'], row['to_stop'], row['delay_count']) for row in shard['station_pairs']] == \
+            [("Asker", "Oslo S", 2)]
+        assert [row['hour'] for row in load('hourly/2026-10-02.json')] == [12]
+
+        # The window ends at the newest date, so 2026-10-01 falls out of the 2-day retention
+        poll(fetcher, tmp, 'third', [4])
+        assert load('index.json')['dates'] == ['2026-10-02', '2026-10-04']
+        assert not os.path.exists(os.path.join(tmp, 'daily/2026-10-01.json'))
+        assert not os.path.exists(os.path.join(tmp, 'hourly/2026-10-01.json.gz'))
+        assert 'daily/2026-10-01.json' not in load(MANIFEST_NAME)['files']
+        assert [row['date'] for row in load('daily_stats.json')] == ['2026-10-04']
+    fetcher.close()
+
+def main():
+    """Run the JSON export checks"""
+    tests = [
+        ("Unchanged Files Skipped", test_unchanged_files_skipped),
+        ("Manifest Lists Files", test_manifest_lists_files),
+        ("Frame Records", test_frame_records),
+        ("Compressed Siblings", test_compressed_siblings),
+        ("Columnar Layout", test_columnar_layout),
+        ("Date Shards", test_date_shards),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics Test
+Checks the Prometheus text rendering of counters, gauges and histograms, stage
+timing with error and row counts on a real poll, and that the metrics are
+served over HTTP and written to a textfile.
+"""
+
+import os
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from data_fetcher import TrainDelayFetcher
+from metrics import CONTENT_TYPE, MetricsRegistry, MetricsServer, PipelineMetrics
+
+def test_exposition_format():
+    """Samples render with escaped labels, cumulative buckets and +Inf"""
+    registry = MetricsRegistry()
+    polls = registry.counter('polls_total', 'Polls run.', ['feed'])
+    polls.inc(feed='trip_updates')
+    polls.inc(2, feed='alerts "VYG"')
+    registry.gauge('queue_depth', 'Queued feeds.').set(1.5)
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    assert registry.render() == '\n'.join([
+        '# HELP train_delays_polls_total Polls run.',
+        '# TYPE train_delays_polls_total counter',
+        'train_delays_polls_total{feed="alerts \\"VYG\\""} 2',
+        'train_delays_polls_total{feed="trip_updates"} 1',
+        '# HELP train_delays_queue_depth Queued feeds.',
+        '# TYPE train_delays_queue_depth gauge',
+        'train_delays_queue_depth 1.5',
+        '# HELP train_delays_latency_seconds Latency.',
+        '# TYPE train_delays_latency_seconds histogram',
+        'train_delays_latency_seconds_bucket{le="0.1"} 2',
+        'train_delays_latency_seconds_bucket{le="1"} 3',
+        'train_delays_latency_seconds_bucket{le="+Inf"} 4',
+        'train_delays_latency_seconds_sum 3.65',
+        'train_delays_latency_seconds_count 4',
+    ]) + '\n'
+
+    for call in (lambda: polls.inc(), lambda: registry.counter('polls_total', 'Again.')):
+        try:
+            call()
+            assert False, "accepted"
+        except ValueError:
+            pass
+
+def test_stage_timing():
+    """Stages are timed; failures are counted and don't update the last success time"""
+    metrics = PipelineMetrics()
+    with metrics.stage('decode'):
+        pass
+    succeeded_at = metrics.last_success.value(stage='decode')
+    try:
+        with metrics.stage('decode'):
+            raise RuntimeError("bad feed")
+    except RuntimeError:
+        pass
+    assert metrics.stage_seconds.count(stage='decode') == 2
+    assert metrics.stage_errors.value(stage='decode') == 1
+    assert succeeded_at > 0 and metrics.last_success.value(stage='decode') == succeeded_at
+
+def test_poll_rows_counted():
+    """process_data records the rows it took in and produced"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    raw_data = fetcher._mock_data()
+    stats = fetcher.process_data(raw_data)
+    fetcher.close()
+    metrics = fetcher.metrics
+    assert metrics.rows_in.value(stage='process_data') == len(raw_data['delays'])
+    assert metrics.rows_out.value(stage='process_data') == sum(len(frame) for frame in stats.values())
+    assert metrics.stage_seconds.count(stage='process_data') == 1
+
+def test_served_and_written():
+    """/metrics serves the registry (other paths 404); the textfile holds the same text"""
+    metrics = PipelineMetrics()
+    metrics.mock_fallbacks.inc()
+    server = MetricsServer(metrics.registry, 0)
+    try:
+        host, port = server.address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            body = response.read().decode()
+        try:
+            urllib.request.urlopen(f"http://{host}:{port}/other")
+            assert False, "served /other"
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+    finally:
+        server.close()
+    assert 'train_delays_mock_fallbacks_total 1\n' in body
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'train_delays.prom')
+        metrics.registry.write_textfile(path)
+        with open(path) as f:
+            assert f.read() == body
+
+def main():
+    """Run the pipeline metrics checks"""
+    tests = [
+        ("Exposition Format", test_exposition_format),
+        ("Stage Timing", test_stage_timing),
+        ("Poll Rows Counted", test_poll_rows_counted),
+        ("Served And Written", test_served_and_written),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Partition Maintenance Test
+Runs the daily partition helpers against a fake cursor (no PostgreSQL needed):
+missing partitions are created with the right day ranges, expired ones are
+detached and dropped, and the fetcher only checks the catalog again once a
+batch falls outside the days already covered.
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+from psycopg2 import sql
+from data_fetcher import TrainDelayFetcher
+from delay_batch import DelayBatch, StopPairDelay
+from setup_database import drop_old_partitions, ensure_partitions, partition_name
+
+def text(statement) -> str:
+    """Statement as SQL text, without needing a server connection to quote identifiers"""
+    if isinstance(statement, sql.Composed):
+        return ''.join(text(part) for part in statement.seq)
+    if isinstance(statement, sql.Identifier):
+        return '.'.join(f'"{name}"' for name in statement.strings)
+    if isinstance(statement, sql.SQL):
+        return statement.string
+    return statement
+
+class FakeCursor:
+    """Lists the given partitions from the catalog and records every other statement"""
+
+    def __init__(self, partitions):
+        self.partitions = list(partitions)
+        self.catalog_queries = 0
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        statement = text(statement)
+        if 'pg_inherits' in statement:
+            self.catalog_queries += 1
+        else:
+            self.statements.append((' '.join(statement.split()), params))
+
+    def fetchall(self):
+        return [(name,) for name in sorted(self.partitions)]
+
+class FakeConnection:
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+def test_missing_partitions_created():
+    """Every day from start through today + days_ahead gets a partition, existing ones are skipped"""
+    today = date.today()
+    start = today - timedelta(days=2)
+    cursor = FakeCursor([partition_name(today - timedelta(days=1)), 'station_pair_delays_default'])
+    assert ensure_partitions(cursor, start, days_ahead=1) == 3
+    days = [start, today, today + timedelta(days=1)]
+    assert cursor.statements == [
+        (f'CREATE TABLE IF NOT EXISTS "{partition_name(day)}" PARTITION OF station_pair_delays '
+         'FOR VALUES FROM (%s) TO (%s)', (day, day + timedelta(days=1)))
+        for day in days]
+
+def test_expired_partitions_dropped():
+    """Partitions older than the retention window are detached, then dropped"""
+    today = date.today()
+    old, kept = today - timedelta(days=31), today - timedelta(days=30)
+    cursor = FakeCursor([partition_name(old), partition_name(kept), partition_name(today),
+                         'station_pair_delays_default'])
+    assert drop_old_partitions(cursor, retention_days=30) == [partition_name(old)]
+    assert [statement for statement, _ in cursor.statements] == [
+        f'ALTER TABLE station_pair_delays DETACH PARTITION "{partition_name(old)}"',
+        f'DROP TABLE "{partition_name(old)}"',
+    ]
+
+def test_fetcher_checks_catalog_once_per_range():
+    """Batches inside the covered days don't query the catalog again; an older day does"""
+    now = int(datetime.combine(date.today(), datetime.min.time()).timestamp()) + 12 * 3600
+    cursor = FakeCursor([])
+    conn = FakeConnection(cursor)
+    fetcher = TrainDelayFetcher(state_path=None)
+    fetcher._partitioned = True
+    for timestamp in (now, now + 60, now - 5 * 86400):
+        fetcher._ensure_partitions(conn, DelayBatch.from_records(
+            [StopPairDelay("Asker", "Oslo S", "L1", 60, timestamp)]))
+    fetcher.close()
+    assert cursor.catalog_queries == 2
+
+def main():
+    """Run the partition maintenance checks"""
+    tests = [
+        ("Missing Partitions Created", test_missing_partitions_created),
+        ("Expired Partitions Dropped", test_expired_partitions_dropped),
+        ("Fetcher Checks Catalog Once Per Range", test_fetcher_checks_catalog_once_per_range),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
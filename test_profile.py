@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Profile Mode Test
+Checks that profiled polls of a saved feed each do a first poll's full work and
+leave the live state alone: no running statistics or dedup state saved, no
+history written, and the JSON export kept under the profile directory.
+"""
+
+import os
+import sys
+import tempfile
+from data_fetcher import TrainDelayFetcher, run_profile
+from synthetic_feed import build_feed
+
+def test_profile_isolated():
+    """Every profiled poll sees the whole feed as new; live state and tmp/ are untouched"""
+    with tempfile.TemporaryDirectory() as tmp:
+        feed_file = os.path.join(tmp, 'feed.pb')
+        with open(feed_file, 'wb') as f:
+            f.write(build_feed(trips=200, seed=1).SerializeToString())
+        state_dir = os.path.join(tmp, 'state')
+        profile_dir = os.path.join(tmp, 'profiles')
+
+        fetcher = TrainDelayFetcher(state_path=os.path.join(state_dir, 'running_stats.json'),
+                                    history_dir=os.path.join(tmp, 'history'))
+        live_aggregator = fetcher.aggregator
+        new_observations = fetcher.new_observations
+        extracted = []
+
+        def counting_new_observations(stop_times, now=None):
+            observations = new_observations(stop_times, now)
+            extracted.append(len(observations['delays']))
+            return observations
+
+        fetcher.new_observations = counting_new_observations
+        tmp_before = sorted(os.listdir('tmp')) if os.path.isdir('tmp') else None
+        run_profile(fetcher, 2, profile_dir, feed_file)
+
+        assert len(extracted) == 2 and extracted[0] > 0
+        assert extracted[1] == extracted[0], extracted
+        assert fetcher.aggregator is live_aggregator
+        assert not os.path.exists(os.path.join(tmp, 'history'))
+        assert not os.path.exists(state_dir)
+        assert sorted(os.listdir(os.path.join(profile_dir, 'export'))) == ['1', '2']
+        assert os.path.exists(os.path.join(profile_dir, 'export', '2', 'index.json'))
+        assert {'profile.pstats', 'profile.txt', 'allocations.txt'} <= set(os.listdir(profile_dir))
+        assert (sorted(os.listdir('tmp')) if os.path.isdir('tmp') else None) == tmp_before
+        fetcher.close()
+
+def main():
+    """Run the profile mode checks"""
+    tests = [
+        ("Profile Isolated", test_profile_isolated),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Route Topology Test
+Checks that configured stations are found by display name, NSR StopPlace ID or
+(from a GTFS stops.txt) the NSR Quay ID of a platform, that observations of stops the feed names by NSR ID are stored under the
+station's display name, one name per station, and that exactly the configured
+station pairs are tagged relevant by both aggregation engines.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from data_fetcher import AGGREGATION_ENGINES, TrainDelayFetcher
+from delay_batch import DelayBatch, StopPairDelay, StopTime, StopTimeBatch
+from oslo_region_config import OSLO_REGION_QUAYS, OSLO_REGION_STATIONS, add_custom_quays, get_route_topology, \
+    load_gtfs_quays
+
+ASKER_ID = OSLO_REGION_STATIONS["Asker"]["stop_place_id"]
+OSLO_ID = OSLO_REGION_STATIONS["Oslo S"]["stop_place_id"]
+
+def test_pair_lookup_by_name_or_id():
+    """A stop pair is the same configured pair whether its stops are named or NSR IDs"""
+    topology = get_route_topology()
+    pair = topology.pair_id("Asker", "Oslo S")
+    assert pair >= 0
+    assert topology.pair_id(ASKER_ID, OSLO_ID) == pair
+    assert topology.pair_id(ASKER_ID, "Oslo S") == pair
+    assert "L1" in topology.routes_for_pair(ASKER_ID, OSLO_ID)
+    assert topology.pair_id("Asker", "NSR:StopPlace:1") == -1
+
+def test_display_names():
+    """NSR IDs of configured stations become their display name; other stops are unchanged"""
+    stops = [ASKER_ID, "Oslo S", "NSR:Quay:1"]
+    assert get_route_topology().display_names(stops) == ["Asker", "Oslo S", "NSR:Quay:1"]
+
+def test_observations_use_display_names():
+    """A trip naming one station by NSR ID and another by name yields one name per station"""
+    trip = [(ASKER_ID, 60, 60), ("Oslo S", 120, 180), (OSLO_ID, 120, 180), ("NSR:Quay:1", 240, 240)]
+    stop_times = StopTimeBatch.from_records(
+        StopTime(stop, "L1", trip_id, 20261016, sequence, sequence, arrival, departure, 1792990000)
+        for trip_id in ("T1", "T2")
+        for sequence, (stop, arrival, departure) in enumerate(trip[:2] if trip_id == "T1" else trip[2:]))
+    fetcher = TrainDelayFetcher(state_path=None)
+    observations = fetcher.new_observations(stop_times)
+    fetcher.close()
+
+    delays = observations['delays']
+    assert sorted(delays.stop_names) == ["Asker", "NSR:Quay:1", "Oslo S"]
+    pairs = [(record.from_stop, record.to_stop) for record in delays.iter_records()]
+    assert pairs == [("Asker", "Oslo S"), ("Oslo S", "NSR:Quay:1")]
+    dwells = [(record.from_stop, record.delay_seconds) for record in observations['dwell_delays'].iter_records()]
+    assert dwells == [("Asker", 0), ("Oslo S", 60), ("Oslo S", 60), ("NSR:Quay:1", 0)]
+
+# A GTFS stops.txt in the layout of Entur's export: stations, with their quays as children
+STOPS_TXT = f"""stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station
+{ASKER_ID},Asker,59.833,10.437,1,
+NSR:Quay:1001,Asker,59.833,10.437,0,{ASKER_ID}
+NSR:Quay:1002,Asker,59.833,10.438,0,{ASKER_ID}
+{OSLO_ID},Oslo S,59.911,10.755,1,
+NSR:Quay:2001,Oslo S,59.911,10.755,0,{OSLO_ID}
+NSR:Quay:3001,Sandvika,59.891,10.523,0,NSR:StopPlace:3000
+"""
+
+def test_quays_from_gtfs_stops():
+    """Quays of configured stations resolve to their station; a trip naming quays is stored by station"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'stops.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(STOPS_TXT)
+        try:
+            assert load_gtfs_quays(path) == 3
+            topology = get_route_topology()
+            assert topology.display_names(["NSR:Quay:1002", "NSR:Quay:2001", "NSR:Quay:3001"]) == \
+                ["Asker", "Oslo S", "NSR:Quay:3001"]
+            assert topology.pair_id("NSR:Quay:1001", "NSR:Quay:2001") == topology.pair_id("Asker", "Oslo S") >= 0
+
+            stop_times = StopTimeBatch.from_records([
+                StopTime("NSR:Quay:1001", "L1", "T1", 20261016, 1, 0, 60, 60, 1792990000),
+                StopTime("NSR:Quay:2001", "L1", "T1", 20261016, 2, 1, 120, 120, 1792990000),
+            ])
+            fetcher = TrainDelayFetcher(state_path=None)
+            delays = fetcher.new_observations(stop_times)['delays']
+            assert [(record.from_stop, record.to_stop) for record in delays.iter_records()] == [("Asker", "Oslo S")]
+            assert (fetcher._pair_ids(delays) >= 0).all()
+            fetcher.close()
+        finally:
+            OSLO_REGION_QUAYS.clear()
+            add_custom_quays({})
+
+def test_relevance_tags():
+    """Configured pairs (either direction, by name or NSR ID) are relevant; other pairs are not"""
+    pairs = [("Asker", "Oslo S"), ("Oslo S", "Asker"), ("Asker", "Ski"), ("Asker", "NSR:Quay:1"),
+             (ASKER_ID, OSLO_ID)]
+    expected = dict(zip(pairs, [True, True, False, False, True]))
+    now = int(time.time())
+    delays = DelayBatch.from_records(StopPairDelay(from_stop, to_stop, "L1", 60, now, f"T{i}")
+                                     for i, (from_stop, to_stop) in enumerate(pairs))
+
+    for engine in AGGREGATION_ENGINES:
+        fetcher = TrainDelayFetcher(state_path=None, aggregation_engine=engine)
+        daily = fetcher.process_data({'delays': delays})['daily_stats']
+        fetcher.close()
+        tags = {(row.from_stop, row.to_stop): bool(row.is_relevant) for row in daily.itertuples()}
+        assert tags == expected, (engine, tags)
+
+def main():
+    """Run the route topology checks"""
+    tests = [
+        ("Pair Lookup By Name Or ID", test_pair_lookup_by_name_or_id),
+        ("Display Names", test_display_names),
+        ("Observations Use Display Names", test_observations_use_display_names),
+        ("Quays From GTFS Stops", test_quays_from_gtfs_stops),
+        ("Relevance Tags", test_relevance_tags),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Incremental Running Statistics Test
+Checks that a poll only reports, persists and summarizes the dates it touched:
+dated frames hold the dirty dates only, summaries are only rebuilt when a date
+in their window changed, per-date state files are only rewritten for changed
+dates, and mock polls never reach the database.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+import numpy as np
+from data_fetcher import TrainDelayFetcher
+from delay_batch import DelayBatch
+from running_stats import RunningAggregator
+
+OSLO_NOON = '{} 12:00:00+02:00'
+
+def delays_on(days: list) -> DelayBatch:
+    """One A -> B delay of 3 minutes at noon on each of the given days"""
+    timestamps = np.array([int(datetime.fromisoformat(OSLO_NOON.format(day)).timestamp()) for day in days],
+                          np.int64)
+    zeros = np.zeros(len(days), np.int32)
+    return DelayBatch(['A', 'B'], ['R'], [''], zeros, np.ones(len(days), np.int32), zeros,
+                      np.full(len(days), 180, np.int32), timestamps, zeros, zeros, zeros)
+
+def merge_pair(aggregator: RunningAggregator, day: date, delay: float = 3.0):
+    """Merge one A -> B delay on a day into the daily table"""
+    aggregator.merge_rows('daily', [(day, 'A', 'B')], [(1, delay, delay * delay, delay, delay)], [True])
+
+def test_frames_hold_dirty_dates_only():
+    """Dated frames only hold the dates a poll touched, summaries only when their window changed"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    stats = fetcher.process_data({'delays': delays_on(['2026-10-01', '2026-10-10', '2026-10-20'])})
+    assert sorted(stats['daily_stats']['date'].astype(str)) == ['2026-10-01', '2026-10-10', '2026-10-20']
+    assert 'pair_summary_7d' in stats and 'pair_summary_30d' in stats
+
+    # 2026-10-10 is outside the 7-day window ending 2026-10-20, but inside the 30-day one
+    stats = fetcher.process_data({'delays': delays_on(['2026-10-10'])})
+    assert list(stats['daily_stats']['date'].astype(str)) == ['2026-10-10']
+    assert stats['daily_stats']['delay_count'].tolist() == [2]
+    assert 'pair_summary_7d' not in stats and 'pair_summary_30d' in stats
+    assert stats['pair_summary_30d']['delay_count'].tolist() == [4]
+    assert len(stats['retained_dates']) == 3
+
+    stats = fetcher.process_data({'delays': delays_on([])})
+    assert stats['daily_stats'].empty and 'pair_summary_30d' not in stats
+    fetcher.close()
+
+def test_summary_cache_follows_changes():
+    """A cached summary base is rebuilt when one of its older days changes"""
+    aggregator = RunningAggregator()
+    for day in (date(2026, 10, 1), date(2026, 10, 2), date(2026, 10, 3)):
+        merge_pair(aggregator, day)
+    assert aggregator.summarize('daily', 7)['delay_count'].tolist() == [3]
+    merge_pair(aggregator, date(2026, 10, 1), 9.0)
+    summary = aggregator.summarize('daily', 7)
+    assert summary['delay_count'].tolist() == [4]
+    assert summary['max_delay_minutes'].tolist() == [9.0]
+    merge_pair(aggregator, date(2026, 10, 3))
+    assert aggregator.summarize('daily', 7)['delay_count'].tolist() == [5]
+
+def test_state_saved_per_changed_date():
+    """Only changed dates' state files are rewritten, pruned ones are deleted, and state reloads"""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'running_stats.json')
+        aggregator = RunningAggregator(state_path, retention_days=35)
+        merge_pair(aggregator, date(2026, 9, 1))
+        merge_pair(aggregator, date(2026, 10, 1))
+        aggregator.save()
+        dates_dir = os.path.join(tmp, 'running_stats.dates')
+        assert sorted(os.listdir(dates_dir)) == ['2026-09-01.json', '2026-10-01.json']
+
+        # An unchanged date is not rewritten
+        os.remove(os.path.join(dates_dir, '2026-09-01.json'))
+        merge_pair(aggregator, date(2026, 10, 1))
+        aggregator.save()
+        assert sorted(os.listdir(dates_dir)) == ['2026-10-01.json']
+
+        reloaded = RunningAggregator.load(state_path, retention_days=35)
+        assert reloaded.dates() == [date(2026, 10, 1)]
+        assert reloaded.tables['daily'][(date(2026, 10, 1), 'A', 'B')].count == 2
+        assert reloaded.relevant == {('A', 'B'): True}
+
+        # A date falling out of the retention window loses its file
+        merge_pair(reloaded, date(2026, 11, 20))
+        reloaded.prune()
+        reloaded.save()
+        assert sorted(os.listdir(dates_dir)) == ['2026-11-20.json']
+
+def test_mock_poll_not_saved():
+    """Mock polls never reach the database"""
+    fetcher = TrainDelayFetcher(state_path=None)
+
+    def fail(raw_data, stats):
+        raise AssertionError("mock poll reached the database")
+
+    fetcher._save_in_transaction = fail
+    raw_data = fetcher._mock_data()
+    fetcher.save_poll_to_database(raw_data, fetcher.process_data(raw_data))
+    fetcher.close()
+
+def main():
+    """Run the incremental running statistics checks"""
+    tests = [
+        ("Dirty Date Frames", test_frames_hold_dirty_dates_only),
+        ("Summary Cache", test_summary_cache_follows_changes),
+        ("Per-Date State", test_state_saved_per_changed_date),
+        ("Mock Poll Not Saved", test_mock_poll_not_saved),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Snapshot Archive Test
+Checks that archived snapshots come back by feed timestamp range, that a
+segment torn by a crash (inside a record header, inside a payload, or after the
+last indexed record) is cut back to its last complete record on reopen, that
+replaying the archive of live polls rebuilds the same running statistics, and
+that a replay keeps its own running state unless told otherwise.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import data_fetcher
+from data_fetcher import DEFAULT_REPLAY_STATE_PATH, DEFAULT_STATE_PATH, TrainDelayFetcher, run_replay
+from snapshot_archive import RECORD_HEADER, SnapshotArchive
+from synthetic_feed import build_feed_bytes
+
+FETCHED_AT = 1792990000  # All snapshots land in one UTC day, so in one segment
+
+def archive_of(directory: str, count: int) -> SnapshotArchive:
+    """An archive holding snapshots payload-0.. with feed timestamps 1000, 1010, ..."""
+    archive = SnapshotArchive(directory)
+    for i in range(count):
+        archive.append(f"payload-{i}".encode() * 50, 1000 + 10 * i, FETCHED_AT + i)
+    archive.close()
+    return archive
+
+def contents(archive: SnapshotArchive, start=None, end=None) -> list:
+    return [snapshot.content[:9].decode() for snapshot in archive.iter_snapshots(start, end)]
+
+def test_time_range():
+    """Snapshots are selected by feed timestamp, start inclusive and end exclusive"""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = archive_of(tmp, 5)
+        assert contents(archive) == [f"payload-{i}" for i in range(5)]
+        assert contents(archive, 1010, 1030) == ['payload-1', 'payload-2']
+        assert contents(archive, 2000) == []
+        snapshot = next(archive.iter_snapshots(1040))
+        assert (snapshot.feed_timestamp, snapshot.fetched_at) == (1040, FETCHED_AT + 4)
+
+def torn_archive(directory: str, cut: int) -> SnapshotArchive:
+    """Three snapshots with the segment cut `cut` bytes into the last record, then reopened and appended to"""
+    archive = archive_of(directory, 3)
+    path = archive.segments()[0]
+    last = int(archive.read_index(path)['offset'][-1])
+    with open(path, 'r+b') as f:
+        f.truncate(last + cut)
+    archive.append(b"payload-9" * 50, 1090, FETCHED_AT + 9)
+    archive.close()
+    return archive
+
+def test_torn_header_recovered():
+    """A record whose header was cut short is dropped along with its index entry"""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = torn_archive(tmp, RECORD_HEADER.size - 3)
+        assert contents(archive) == ['payload-0', 'payload-1', 'payload-9']
+
+def test_torn_payload_recovered():
+    """A record whose payload was cut short is dropped along with its index entry"""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = torn_archive(tmp, RECORD_HEADER.size + 5)
+        assert contents(archive) == ['payload-0', 'payload-1', 'payload-9']
+
+def test_unindexed_tail_recovered():
+    """Bytes after the last indexed record (a record that never got its index entry) are cut"""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = archive_of(tmp, 2)
+        path = archive.segments()[0]
+        size = os.path.getsize(path)
+        with open(path, 'ab') as f:
+            f.write(b"\x01" * (RECORD_HEADER.size + 4))
+        archive.append(b"payload-9" * 50, 1090, FETCHED_AT + 9)
+        archive.close()
+        assert contents(archive) == ['payload-0', 'payload-1', 'payload-9']
+        assert int(archive.read_index(path)['offset'][-1]) == size
+
+class FeedSession:
+    """Answers every get() with the next queued feed"""
+
+    class Response:
+        status_code = 200
+        headers = {}
+
+        def __init__(self, content: bytes):
+            self.content = content
+
+        def raise_for_status(self):
+            pass
+
+    def __init__(self, feeds):
+        self.feeds = list(feeds)
+
+    def get(self, url, headers=None, timeout=None):
+        return self.Response(self.feeds.pop(0))
+
+    def close(self):
+        pass
+
+def test_replay_matches_live():
+    """Live polls archive each new feed once; replaying them gives the live statistics"""
+    now = int(time.time())
+    first = build_feed_bytes(trips=100, seed=1, timestamp=now - 120)
+    feeds = [first, first, build_feed_bytes(trips=100, seed=2, timestamp=now - 60),
+             build_feed_bytes(trips=100, seed=3, timestamp=now)]
+    with tempfile.TemporaryDirectory() as tmp:
+        live = TrainDelayFetcher(state_path=os.path.join(tmp, 'live', 'running_stats.json'),
+                                 archive_dir=os.path.join(tmp, 'archive'))
+        live.session = FeedSession(feeds)
+        for _ in feeds:
+            raw_data = live.fetch_realtime_data()
+            if not raw_data.get('unchanged'):
+                live.process_data(raw_data)
+        live.close()
+
+        archive = SnapshotArchive(os.path.join(tmp, 'archive', 'trip_updates'))
+        assert [snapshot.feed_timestamp for snapshot in archive.iter_snapshots()] == [now - 120, now - 60, now]
+
+        replay = TrainDelayFetcher(state_path=os.path.join(tmp, 'replay', 'running_stats.json'))
+        replay.generate_json_files = lambda stats: None
+        run_replay(replay, archive.directory)
+        replay.close()
+
+        for kind in ('daily', 'route', 'segment', 'dwell'):
+            expected = live.aggregator.to_frame(kind)
+            assert len(expected) and replay.aggregator.to_frame(kind).equals(expected), kind
+
+def test_replay_state_kept_apart():
+    """--replay defaults to its own state file, never the live one; --state-file still wins"""
+    state_paths = []
+    replay, argv, cwd = data_fetcher.run_replay, sys.argv, os.getcwd()
+    data_fetcher.run_replay = lambda fetcher, *args: state_paths.append(fetcher.aggregator.state_path)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            for arguments in (['--replay', 'archive'], ['--replay', 'archive', '--state-file', 'backfill.json']):
+                sys.argv = ['data_fetcher.py', *arguments]
+                data_fetcher.main()
+            os.chdir(cwd)
+    finally:
+        data_fetcher.run_replay, sys.argv = replay, argv
+        os.chdir(cwd)
+    assert state_paths == [DEFAULT_REPLAY_STATE_PATH, 'backfill.json']
+    assert os.path.dirname(DEFAULT_REPLAY_STATE_PATH) != os.path.dirname(DEFAULT_STATE_PATH)
+
+def main():
+    """Run the snapshot archive checks"""
+    tests = [
+        ("Time Range", test_time_range),
+        ("Torn Header", test_torn_header_recovered),
+        ("Torn Payload", test_torn_payload_recovered),
+        ("Unindexed Tail", test_unindexed_tail_recovered),
+        ("Replay Matches Live", test_replay_matches_live),
+        ("Replay State Kept Apart", test_replay_state_kept_apart),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
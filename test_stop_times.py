@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Stop Time Attribution Test
+Checks the exact segment and dwell delay rows derived from hand-built trips:
+stops left out of the feed, stops missing their arrival or departure delay,
+stops with no delay at all, and trips that start without delay information.
+"""
+
+import sys
+from delay_batch import MISSING_DELAY, StopTime, StopTimeBatch
+
+TIMESTAMP = 1792990000
+MISSING = MISSING_DELAY
+
+# (trip_id, stop_id, stop_sequence, arrival_delay, departure_delay)
+TRIPS = [
+    ("T1", "A", 1, MISSING, 60),       # First stop: departure only
+    ("T1", "B", 2, 120, 180),          # Dwell of 60 s
+    ("T1", "C", 4, MISSING, MISSING),  # Stop 3 not in the feed; C reports nothing, so it carries B's 180
+    ("T1", "D", 5, 300, MISSING),      # Last stop: arrival only
+    ("T2", "A", 1, MISSING, MISSING),  # No delay information yet on this trip
+    ("T2", "B", 2, 30, 30),
+    ("T2", "C", 3, 90, 30),            # Recovered 60 s while standing
+]
+
+def stop_times() -> StopTimeBatch:
+    """The TRIPS stop_time_updates, positions restarting at 0 for every trip"""
+    records = []
+    for i, (trip_id, stop_id, sequence, arrival, departure) in enumerate(TRIPS):
+        position = 0 if i == 0 or TRIPS[i - 1][0] != trip_id else records[-1].position + 1
+        records.append(StopTime(stop_id, "L1", trip_id, 20261016, sequence, position,
+                                arrival, departure, TIMESTAMP))
+    return StopTimeBatch.from_records(records)
+
+def rows(batch) -> list:
+    return [(record.trip_id, record.from_stop, record.to_stop, record.stop_sequence, record.delay_seconds)
+            for record in batch.iter_records()]
+
+def test_filled_delays():
+    """Missing arrival/departure delays take the other one, then the last known departure of the trip"""
+    arrivals, departures = stop_times().filled_delays()
+    assert arrivals.tolist() == [60, 120, 180, 300, MISSING, 30, 90]
+    assert departures.tolist() == [60, 180, 180, 300, MISSING, 30, 30]
+
+def test_segment_delays():
+    """Each consecutive pair gets next arrival minus this departure; pairs with an unknown end are left out"""
+    assert rows(stop_times().segment_delays()) == [
+        ("T1", "A", "B", 1, 60),
+        ("T1", "B", "C", 2, 0),
+        ("T1", "C", "D", 4, 120),
+        ("T2", "B", "C", 2, 60),
+    ]
+
+def test_dwell_delays():
+    """Only stops reporting both arrival and departure get a dwell row"""
+    assert rows(stop_times().dwell_delays()) == [
+        ("T1", "B", "B", 2, 60),
+        ("T2", "B", "B", 2, 0),
+        ("T2", "C", "C", 3, -60),
+    ]
+
+def test_stop_pair_delays():
+    """Stop pairs carry the departure (else arrival) delay of their first stop, if it reports one"""
+    assert rows(stop_times().stop_pair_delays()) == [
+        ("T1", "A", "B", 1, 60),
+        ("T1", "B", "C", 2, 180),
+        ("T2", "B", "C", 2, 30),
+    ]
+
+def main():
+    """Run the stop time attribution checks"""
+    tests = [
+        ("Filled Delays", test_filled_delays),
+        ("Segment Delays", test_segment_delays),
+        ("Dwell Delays", test_dwell_delays),
+        ("Stop Pair Delays", test_stop_pair_delays),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
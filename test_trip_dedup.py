@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Trip Deduplication Test
+Checks that repeated observations are dropped, that a changed delay replaces the
+earlier one in the running statistics (with both aggregation engines) instead of
+counting twice, also when a stop recovers to on time, and that dedup state is saved with the running statistics and
+survives a restart.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+import pandas as pd
+from data_fetcher import TrainDelayFetcher
+from delay_batch import MISSING_DELAY, DelayBatch, StopPairDelay, StopTime, StopTimeBatch
+from trip_dedup import TripDeduplicator
+
+NOON = int(datetime.fromisoformat('2026-10-14 12:00:00+02:00').timestamp())
+
+def poll(*delays: int, timestamp: int = NOON) -> DelayBatch:
+    """Oslo S -> Lillestrøm delays of trips T0, T1, ... on route L1"""
+    return DelayBatch.from_records(StopPairDelay('Oslo S', 'Lillestrøm', 'L1', delay, timestamp,
+                                                 f'T{trip}', 20261014, 3)
+                                   for trip, delay in enumerate(delays))
+
+def raw_data(fetcher: TrainDelayFetcher, delays: DelayBatch) -> dict:
+    """A poll's observations after deduplication, as fetch_realtime_data returns them"""
+    observations, superseded = fetcher.deduplicator.filter(delays)
+    return {'delays': observations, 'superseded_delays': superseded}
+
+def test_filter_returns_superseded():
+    """Unchanged observations are dropped, changed ones come back with the value they replace"""
+    deduplicator = TripDeduplicator()
+    observations, superseded = deduplicator.filter(poll(120, 60))
+    assert len(observations) == 2 and len(superseded) == 0
+
+    observations, superseded = deduplicator.filter(poll(300, 60, timestamp=NOON + 60))
+    assert [record.delay_seconds for record in observations.iter_records()] == [300]
+    assert list(superseded.iter_records()) == [
+        StopPairDelay('Oslo S', 'Lillestrøm', 'L1', 120, NOON, 'T0', 20261014, 3)]
+
+def test_changed_delay_replaces_earlier():
+    """A trip stop whose delay changed counts once, with its latest delay, with either engine"""
+    for engine in ('numpy', 'pandas'):
+        fetcher = TrainDelayFetcher(state_path=None, aggregation_engine=engine)
+        fetcher.process_data(raw_data(fetcher, poll(120, 60)))
+        stats = fetcher.process_data(raw_data(fetcher, poll(600, 60)))
+        daily = stats['daily_stats'].iloc[0]
+        assert daily['delay_count'] == 2, engine
+        assert daily['total_delay_minutes'] == 11.0, engine
+        assert daily['delayed_count'] == 1, engine
+        assert abs(daily['p99_delay_minutes'] - 10.0) < 0.3, engine
+        route = stats['route_stats'].iloc[0]
+        assert route['delay_count'] == 2, engine
+        hourly = stats['hourly_stats'].iloc[0]
+        assert hourly['delay_count'] == 2, engine
+        fetcher.close()
+
+def trip(departure_delay: int) -> StopTimeBatch:
+    """Trip T0 leaving Oslo S (stop 3) for Lillestrøm with the given departure delay"""
+    return StopTimeBatch.from_records([
+        StopTime('Oslo S', 'L1', 'T0', 20261014, 3, 0, MISSING_DELAY, departure_delay, NOON),
+        StopTime('Lillestrøm', 'L1', 'T0', 20261014, 4, 1, departure_delay, MISSING_DELAY, NOON),
+    ])
+
+def test_recovery_to_on_time_replaces_delay():
+    """A trip stop reporting 300 s and then 0 s counts once, on time, with either engine"""
+    for engine in ('numpy', 'pandas'):
+        fetcher = TrainDelayFetcher(state_path=None, aggregation_engine=engine)
+        fetcher.process_data(fetcher.new_observations(trip(300)))
+        observations = fetcher.new_observations(trip(0))
+        assert [record.delay_seconds for record in observations['delays'].iter_records()] == [0], engine
+        assert [record.delay_seconds for record in observations['superseded_delays'].iter_records()] == [300]
+        stats = fetcher.process_data(observations)
+        daily = stats['daily_stats'].iloc[0]
+        assert daily['delay_count'] == 1 and daily['total_delay_minutes'] == 0.0, engine
+        assert daily['delayed_count'] == 0 and daily['on_time_percentage'] == 100.0, engine
+        assert stats['route_stats'].iloc[0]['delay_count'] == 1, engine
+        # Unchanged on-time reports are deduplicated like any other
+        assert len(fetcher.new_observations(trip(0))['delays']) == 0, engine
+        fetcher.close()
+
+def test_fully_superseded_key_has_no_extremes():
+    """A key whose only observation moved to another hour has a zero count and no min/max"""
+    fetcher = TrainDelayFetcher(state_path=None)
+    fetcher.process_data(raw_data(fetcher, poll(120)))
+    stats = fetcher.process_data(raw_data(fetcher, poll(240, timestamp=NOON + 3600)))
+    hourly = stats['date_hourly_stats'].set_index('hour')
+    assert hourly.loc[12, 'delay_count'] == 0
+    assert pd.isna(hourly.loc[12, 'min_delay_minutes']) and pd.isna(hourly.loc[12, 'max_delay_minutes'])
+    assert hourly.loc[13, 'delay_count'] == 1
+    fetcher.close()
+
+def test_state_saved_with_running_stats():
+    """Dedup state is written with the running statistics and takes back changes after a restart"""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'running_stats.json')
+        fetcher = TrainDelayFetcher(state_path=state_path)
+        fetcher.process_data(raw_data(fetcher, poll(120)))
+        # Saved by process_data itself, not only on close()
+        assert os.path.exists(os.path.join(tmp, 'trip_dedup.json'))
+        del fetcher
+
+        restarted = TrainDelayFetcher(state_path=state_path)
+        stats = restarted.process_data(raw_data(restarted, poll(300)))
+        daily = stats['daily_stats'].iloc[0]
+        assert daily['delay_count'] == 1 and daily['total_delay_minutes'] == 5.0
+        restarted.close()
+
+def test_station_delays_kept_without_new_observations():
+    """A poll whose observations were all seen before leaves station_delays.json alone"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        fetcher = TrainDelayFetcher(state_path=None)
+        fetcher.generate_json_files(fetcher.process_data(raw_data(fetcher, poll(120, 60))), output_dir)
+        stats = fetcher.process_data(raw_data(fetcher, poll(120, 60)))
+        assert stats['station_delays'].empty
+        fetcher.generate_json_files(stats, output_dir)
+        with open(os.path.join(output_dir, 'station_delays.json')) as f:
+            assert len(json.load(f)) == 2
+        fetcher.close()
+
+def test_version_1_state_loads():
+    """Version 1 state still deduplicates; changes to its entries are not taken back"""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'trip_dedup.json')
+        with open(state_path, 'w') as f:
+            json.dump({'version': 1, 'seen': [['T0', 20261014, 3, 120, 9e9]]}, f)
+        deduplicator = TripDeduplicator.load(state_path)
+        observations, _ = deduplicator.filter(poll(120), now=9e9)
+        assert len(observations) == 0
+        observations, superseded = deduplicator.filter(poll(300), now=9e9)
+        assert len(observations) == 1 and len(superseded) == 1
+
+        deduplicator = TripDeduplicator.load(state_path)
+        observations, superseded = deduplicator.filter(poll(300), now=9e9)
+        assert len(observations) == 1 and len(superseded) == 0
+
+def main():
+    """Run the deduplication checks"""
+    tests = [
+        ("Superseded Observations", test_filter_returns_superseded),
+        ("Changed Delay Replaces Earlier", test_changed_delay_replaces_earlier),
+        ("Recovery To On Time", test_recovery_to_on_time_replaces_delay),
+        ("Fully Superseded Key", test_fully_superseded_key_has_no_extremes),
+        ("State Saved With Running Stats", test_state_saved_with_running_stats),
+        ("Station Delays Kept", test_station_delays_kept_without_new_observations),
+        ("Version 1 State", test_version_1_state_loads),
+    ]
+
+    failed = 0
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running: {test_name}")
+        try:
+            test_func()
+            print(f"✅ {test_name} passed")
+        except AssertionError as e:
+            print(f"❌ {test_name} failed: {e}")
+            failed += 1
+
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Trip-Level Deduplication
+The GTFS-RT feed re-reports every trip/stop on each poll. TripDeduplicator
+remembers the last observation seen per (trip_id, start_date, stop_sequence) and
+lets only new or changed observations through, so one delayed departure is stored
+and aggregated once instead of on every poll. When a delay changes, the observation
+it supersedes is returned as well, so the running statistics can take it back and
+each trip stop counts once, with its latest delay. Memory is bounded by an LRU size
+cap and a TTL on entries.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+import orjson
+from atomic_write import write_atomic
+from delay_batch import DelayBatch, StopPairDelay
+
+# (trip_id, start_date, stop_sequence)
+ObservationKey = Tuple[str, int, int]
+
+# (from_stop, to_stop, route_id, timestamp) of the last observation, None if unknown
+ObservationContext = Optional[Tuple[str, str, str, int]]
+
+# Version 2 keeps the stops, route and timestamp of each observation, so a superseded
+# one can be taken back; version 1 entries still load (their changes are not taken back)
+STATE_VERSION = 2
+
+class TripDeduplicator:
+    """Bounded LRU/TTL memory of the last delay observed per trip stop"""
+
+    def __init__(self, max_entries: int = 200_000, ttl_seconds: float = 6 * 3600,
+                 state_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.state_path = state_path
+        # key -> (delay_seconds, context, last_seen epoch seconds); oldest entries first
+        self._seen: 'OrderedDict[ObservationKey, Tuple[int, ObservationContext, float]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    @classmethod
+    def load(cls, state_path: str, max_entries: int = 200_000,
+             ttl_seconds: float = 6 * 3600) -> 'TripDeduplicator':
+        """Load persisted observations, starting empty if there are none"""
+        deduplicator = cls(max_entries, ttl_seconds, state_path)
+        if not os.path.exists(state_path):
+            return deduplicator
+
+        try:
+            with open(state_path, 'rb') as f:
+                state = orjson.loads(f.read())
+            version = state.get('version')
+            if version not in (1, STATE_VERSION):
+                print(f"Ignoring trip dedup state with unknown version in {state_path}")
+                return deduplicator
+            seen = deduplicator._seen
+            for entry in state.get('seen', []):
+                if version == 1:
+                    trip_id, start_date, stop_sequence, delay, last_seen = entry
+                    context = None
+                else:
+                    trip_id, start_date, stop_sequence, delay, *context, last_seen = entry
+                    context = tuple(context)
+                seen[(trip_id, start_date, stop_sequence)] = (delay, context, last_seen)
+            deduplicator.expire()
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Failed to load trip dedup state from {state_path}: {e}")
+        return deduplicator
+
+    def save(self):
+        """Persist observations atomically (write to a temp file, then rename)"""
+        if not self.state_path:
+            return
+
+        state = {
+            'version': STATE_VERSION,
+            'seen': [[*key, delay, *(context or ('', '', '', 0)), last_seen]
+                     for key, (delay, context, last_seen) in self._seen.items()],
+        }
+        write_atomic(self.state_path, orjson.dumps(state), durable=True)
+
+    def expire(self, now: Optional[float] = None):
+        """Evict entries past their TTL, then the least recently seen beyond max_entries"""
+        cutoff = (now if now is not None else time.time()) - self.ttl_seconds
+        seen = self._seen
+        while seen:
+            key, (_, _, last_seen) = next(iter(seen.items()))
+            if last_seen >= cutoff and len(seen) <= self.max_entries:
+                break
+            del seen[key]
+
+    def filter(self, batch: DelayBatch, now: Optional[float] = None) -> Tuple[DelayBatch, DelayBatch]:
+        """
+        Return (observations that are new or whose delay changed since last seen,
+        the earlier observations the changed ones supersede). Every observation
+        refreshes its entry (last write wins per trip stop).
+        """
+        if len(batch) == 0:
+            return batch, DelayBatch.empty()
+
+        now = now if now is not None else time.time()
+        seen = self._seen
+        stops, routes, trips = batch.stop_names, batch.route_names, batch.trip_names
+        keep = np.zeros(len(batch), dtype=bool)
+        superseded: List[StopPairDelay] = []
+
+        for i, (from_code, to_code, route_code, delay, timestamp, trip_code, start_date, stop_sequence) in \
+                enumerate(zip(batch.from_codes.tolist(), batch.to_codes.tolist(), batch.route_codes.tolist(),
+                              batch.delay_seconds.tolist(), batch.timestamps.tolist(), batch.trip_codes.tolist(),
+                              batch.start_dates.tolist(), batch.stop_sequences.tolist())):
+            trip_id = trips[trip_code]
+            if not trip_id:
+                keep[i] = True  # No trip identity to deduplicate on
+                continue
+            key = (trip_id, start_date, stop_sequence)
+            previous = seen.get(key)
+            if previous is None or previous[0] != delay:
+                keep[i] = True
+                # Entries from version 1 state carry no context to take back
+                if previous is not None and previous[1] is not None and previous[1][0]:
+                    from_stop, to_stop, route_id, previous_timestamp = previous[1]
+                    superseded.append(StopPairDelay(from_stop, to_stop, route_id, previous[0],
+                                                    previous_timestamp, trip_id, start_date, stop_sequence))
+            seen[key] = (delay, (stops[from_code], stops[to_code], routes[route_code], timestamp), now)
+            seen.move_to_end(key)
+
+        self.expire(now)
+        return batch.take(keep), DelayBatch.from_records(superseded)